@@ -1,12 +1,19 @@
 # bot.py
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.utils import executor
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram import Dispatcher
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 from aiogram.types import BotCommand
 
 import db
-from config import API_TOKEN
+import inline
+import metrics
+import similar
+import updates
+from sender import ThrottledBot
+from storage import SQLiteStorage
+from writer import events
+from config import (API_TOKEN, MODE, SKIP_UPDATES, TELEGRAM_API_SERVER, WEBHOOK_URL, WEBHOOK_SECRET,
+                    METRICS_HOST, METRICS_PORT, PROFILE_PATH)
 from handlers import register_handlers
 from helpers import load_recipes_from_json
 
@@ -26,17 +33,32 @@ db.init_db()
 
 added = load_recipes_from_json()
 if added:
-    logger.info(f"Добавлено рецептов из JSON: {added}")
+    logger.info(f"Добавлено/обновлено рецептов из JSON: {added}")
 
 
 #  Инициализация бота
-bot = Bot(API_TOKEN, parse_mode="HTML")
-dp = Dispatcher(bot, storage=MemoryStorage())
+# ThrottledBot сам соблюдает лимиты Telegram и повторяет запросы после 429
+server = TelegramAPIServer.from_base(TELEGRAM_API_SERVER) if TELEGRAM_API_SERVER else TELEGRAM_PRODUCTION
+bot = ThrottledBot(API_TOKEN, parse_mode="HTML", server=server)
+dp = Dispatcher(bot, storage=SQLiteStorage())  # состояния FSM — в recipes.db
 
 # Регистрируем все хендлеры
 register_handlers(dp)
 
 
+#  Метрики
+# Время/ошибки хендлеров — middleware; пул БД, FSM и отправка считают себя сами,
+# а их снимки отдаются как gauge'и в момент запроса /metrics
+updates.setup_metrics(dp)
+metrics.register("db_pool", db.aio.metrics)
+metrics.register("recipe_cache", db.cache_stats)
+metrics.register("writer", events.metrics)
+metrics.register("fsm", dp.storage.metrics)
+metrics.register("sender", bot.metrics)
+metrics.register("inline", inline.metrics)
+_metrics_runner = None
+
+
 #  Команды
 
 async def _set_bot_commands():
@@ -58,22 +80,61 @@ async def _set_bot_commands():
 
 async def on_startup(dp):
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
-        logger.info("Webhook удалён, старые апдейты сброшены ✅")
+        if MODE == "webhook":
+            if WEBHOOK_URL:
+                await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET or None,
+                                      drop_pending_updates=SKIP_UPDATES)
+                logger.info(f"Webhook установлен: {WEBHOOK_URL} ✅")
+        else:
+            await bot.delete_webhook(drop_pending_updates=SKIP_UPDATES)
+            logger.info("Webhook удалён, работаем через polling ✅")
     except Exception as e:
-        logger.warning(f"delete_webhook error: {e}")
+        logger.warning(f"webhook setup error: {e}")
 
     await _set_bot_commands()
-    me = await bot.get_me()
-    logger.info(f"Bot: {me.first_name} [@{me.username}] запущен и готов к работе 🔥")
+    events.start()
+    similar.warm()   # модель похожих — фоном, не в первом запросе
+    global _metrics_runner
+    if METRICS_PORT:
+        try:
+            _metrics_runner = await metrics.serve(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            logger.warning(f"Не удалось поднять метрики на {METRICS_HOST}:{METRICS_PORT}: {e}")
+    if PROFILE_PATH:
+        metrics.profiler.start()
+        logger.info(f"Профилировщик включён, профиль будет записан в {PROFILE_PATH}")
+    try:
+        me = await bot.get_me()
+        logger.info(f"Bot: {me.first_name} [@{me.username}] запущен и готов к работе 🔥")
+    except Exception as e:
+        logger.warning(f"get_me error: {e}")
 
 
 async def on_shutdown(dp):
-    # Закрываем соединение с БД, если нужно
+    if PROFILE_PATH and metrics.profiler.running:
+        with open(PROFILE_PATH, "w", encoding="utf-8") as f:
+            f.write(metrics.profiler.stop())
+        logger.info(f"Профиль записан: {PROFILE_PATH}")
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+    await inline.close()
+    await bot.drain()
+    # Дописываем отложенные события и закрываем соединения с БД
+    try:
+        await events.close()
+        logger.info(f"Очередь записи: {events.metrics()}")
+    except Exception as e:
+        logger.warning(f"Writer close error: {e}")
+    logger.info(f"Исходящие запросы: {bot.metrics()}")
+    try:
+        await dp.storage.close()   # до db.close: дописываем несохранённые состояния FSM
+        logger.info(f"Состояния FSM: {dp.storage.metrics()}")
+    except Exception as e:
+        logger.warning(f"FSM storage close error: {e}")
     try:
-        if hasattr(db, "close"):
-            db.close()
-            logger.info("Соединение с базой закрыто ✅")
+        logger.info(f"Пул БД: {db.aio.metrics()}")
+        db.close()
+        logger.info("Соединения с базой закрыты ✅")
     except Exception as e:
         logger.warning(f"DB close error: {e}")
     logger.info("Бот корректно остановлен 👋")
@@ -83,9 +144,7 @@ async def on_shutdown(dp):
 '''Запуск'''
 
 if __name__ == "__main__":
-    executor.start_polling(
-        dp,
-        skip_updates=True,
-        on_startup=on_startup,
-        on_shutdown=on_shutdown
-    )
+    if MODE == "webhook":
+        updates.run_webhook(dp, on_startup=on_startup, on_shutdown=on_shutdown)
+    else:
+        updates.run_polling(dp, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,86 @@
+# cache.py — простой потокобезопасный LRU-кэш с лимитом по числу элементов и памяти
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+def approx_size(obj: Any) -> int:
+    """Грубая оценка памяти объекта (строки, числа, списки, кортежи, словари)."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(x) for x in obj)
+    return size
+
+
+class LRUCache:
+    """LRU-кэш: вытесняет самые давние записи при превышении max_items или max_bytes.
+    ttl (секунды) — необязательный срок жизни записи."""
+
+    def __init__(self, max_items: int = 1024, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None, sizeof: Callable[[Any], int] = approx_size):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, size, expires)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (item[2] is not None and item[2] < time.monotonic()):
+                if item is not None:
+                    self._drop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any):
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, size, expires)
+            self.bytes += size
+            while self._data and (len(self._data) > self.max_items or
+                                  (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                self._drop(next(iter(self._data)))
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            self._drop(key)
+            return default if item[2] is not None and item[2] < time.monotonic() else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"items": len(self._data), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+    def _drop(self, key):
+        _, size, _ = self._data.pop(key)
+        self.bytes -= size
+
+
+_MISSING = object()
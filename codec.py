@@ -0,0 +1,87 @@
+# codec.py — компактный двоичный формат ингредиентов и шагов рецепта
+#
+# Вместо JSON-текста в recipes.ingredients / recipes.steps лежат BLOB'ы:
+#   ингредиенты: [версия u8][n u32] + n × <Iff> (id имени из ingredient_names, граммы, ккал);
+#   строки (шаги, страницы карточек): [версия u8][n u32] + n × ([длина u32][utf-8]).
+# Имена ингредиентов интернированы (db.ingredient_names): «Лук» и «Соль» из тысяч
+# рецептов хранятся один раз. Разбор идёт по memoryview без копирования буфера —
+# создаются только итоговые str и float. Если в колонке текст (база до миграции или
+# строка, записанная старой версией), он читается как JSON. Граммы и ккал — float32:
+# для показа (render) их округляют, точные исходные значения в отпечатке content_hash.
+import json
+import struct
+from typing import Any, Callable, Dict, List, Union
+
+FORMAT_VERSION = 1
+
+_HEAD = struct.Struct("<BI")
+_ING = struct.Struct("<Iff")
+_LEN = struct.Struct("<I")
+
+Blob = Union[bytes, memoryview, str]
+
+
+class CodecError(ValueError):
+    pass
+
+
+def _head(view: memoryview) -> int:
+    if len(view) < _HEAD.size:
+        raise CodecError("слишком короткий BLOB")
+    version, n = _HEAD.unpack_from(view)
+    if version != FORMAT_VERSION:
+        raise CodecError(f"неизвестная версия формата: {version}")
+    return n
+
+
+def encode_ingredients(ings: List[Dict[str, Any]], name_id: Callable[[str], int]) -> bytes:
+    """[{"name", "grams", "kcal"}, ...] → BLOB; name_id — id интернированного имени."""
+    out = bytearray(_HEAD.pack(FORMAT_VERSION, len(ings)))
+    for i in ings:
+        out += _ING.pack(name_id(str(i.get("name", ""))), float(i.get("grams", 0)), float(i.get("kcal", 0)))
+    return bytes(out)
+
+
+def ingredient_records(blob: Blob):
+    """Итератор (name_id, граммы, ккал) без разбора имён — для индексов и FTS."""
+    view = memoryview(blob)
+    n = _head(view)
+    body = view[_HEAD.size:_HEAD.size + n * _ING.size]
+    if len(body) != n * _ING.size:
+        raise CodecError("обрезанный список ингредиентов")
+    return _ING.iter_unpack(body)
+
+
+def decode_ingredients(blob: Blob, name: Callable[[int], str]) -> List[Dict[str, Any]]:
+    """BLOB (или JSON-текст старого формата) → [{"name", "grams", "kcal"}, ...]."""
+    if isinstance(blob, str):
+        return json.loads(blob)
+    return [{"name": name(nid), "grams": g, "kcal": k} for nid, g, k in ingredient_records(blob)]
+
+
+def encode_strings(items: List[str]) -> bytes:
+    out = bytearray(_HEAD.pack(FORMAT_VERSION, len(items)))
+    for s in items:
+        data = s.encode("utf-8")
+        out += _LEN.pack(len(data))
+        out += data
+    return bytes(out)
+
+
+def decode_strings(blob: Blob) -> List[str]:
+    """BLOB (или JSON-текст старого формата) → список строк."""
+    if isinstance(blob, str):
+        return json.loads(blob)
+    view = memoryview(blob)
+    n = _head(view)
+    pos, out = _HEAD.size, []
+    for _ in range(n):
+        if pos + _LEN.size > len(view):
+            raise CodecError("обрезанный список строк")
+        (size,) = _LEN.unpack_from(view, pos)
+        pos += _LEN.size
+        if pos + size > len(view):
+            raise CodecError("обрезанный список строк")
+        out.append(str(view[pos:pos + size], "utf-8"))
+        pos += size
+    return out
@@ -1,9 +1,107 @@
 # config.py
-API_TOKEN = "@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@"   # ← вставь токен от BotFather
+import os
 
-# Путь до JSON с рецептами 
-RECIPES_JSON_PATH = "recipes.json"
+API_TOKEN = os.getenv("BOT_TOKEN", "@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@")   # ← вставь токен от BotFather
 
-# Целевые калории для плана
+# Путь до JSON с рецептами и до базы (переопределяются окружением — так их подменяет tools/bench.py)
+RECIPES_JSON_PATH = os.getenv("RECIPES_JSON", "recipes.json")
+DB_PATH = os.getenv("RECIPES_DB", "recipes.db")
+
+# Целевые калории для плана (ккал/день) и их подпись
+CUT_KCAL_RANGE = (1700, 1900)
+BULK_KCAL_RANGE = (2600, 2900)
 CUT_CAL_TARGET = "≈ 1 700–1 900 ккал/день"
 BULK_CAL_TARGET = "≈ 2 600–2 900 ккал/день"
+
+# Планировщик рациона: приёмы пищи (название, доля дневной нормы, макс. время готовки в мин),
+# допустимый вес порции в граммах и число дней
+MEAL_SLOTS = (("Завтрак", 0.25, 30), ("Обед", 0.40, 120), ("Ужин", 0.35, 60))
+PORTION_GRAMS = (150, 600)
+PLAN_DAYS = 3
+
+# Список покупок: строк на страницу и сколько помнить последний собранный список (для листания)
+SHOP_PAGE_LINES = 30
+SHOP_TTL_S = 6 * 3600
+
+# Похожие рецепты (similar.py): соседей на рецепт, потолок числа признаков-ингредиентов
+# (самые частые; память матрицы — рецептов × признаков × 4 байта), память под блок
+# матрицы сходства при построении и порог сходства, ниже которого соседей не показываем
+SIMILAR_TOP_K = 5
+SIMILAR_MAX_FEATURES = 512
+SIMILAR_BLOCK_MB = 64
+SIMILAR_MIN_SCORE = 0.1
+
+# Inline-поиск (@bot борщ, inline.py): результатов на страницу (Telegram — не больше 50),
+# сколько результатов на запрос держать в кэше, размер и срок жизни кэша по запросам,
+# пауза на дребезг (запрос, перебитый следующим за это время, не выполняется)
+# и сколько секунд Telegram может сам кэшировать ответ
+INLINE_PAGE = 20
+INLINE_MAX_RESULTS = 100
+INLINE_CACHE_ITEMS = 5000
+INLINE_CACHE_TTL_S = 600
+INLINE_DEBOUNCE_MS = 300
+INLINE_CACHE_TIME_S = 60
+
+# Пул потоков для запросов к SQLite (db.aio): число потоков и глубина очереди
+DB_WORKERS = 4
+DB_MAX_QUEUE = 256
+
+# Кэш разобранных рецептов (db.get_recipe): лимит записей и памяти
+RECIPE_CACHE_ITEMS = 20000
+RECIPE_CACHE_MB = 64
+
+# Отложенная запись событий (writer.py): период сброса, размер пакета, лимит очереди
+WRITE_FLUSH_MS = 200
+WRITE_BATCH = 500
+WRITE_QUEUE = 10000
+
+# Приём апдейтов: "polling" или "webhook"
+MODE = os.getenv("BOT_MODE", "polling")
+SKIP_UPDATES = False            # True — сбрасывать накопившиеся апдейты при старте
+# Свой (или тестовый) Bot API сервер, например http://127.0.0.1:8081; пусто — api.telegram.org
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER", "")
+
+# Webhook: публичный URL (пусто — set_webhook не вызывается, удобно для локальных тестов)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBAPP_HOST = "0.0.0.0"
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+# Параллельная обработка апдейтов (порядок внутри одного чата сохраняется)
+UPDATE_WORKERS = 16
+UPDATE_QUEUE = 5000
+DRAIN_TIMEOUT_S = 30
+
+# Несколько процессов (supervisor.py): воркеров (0 — по числу ядер), очередь апдейтов на воркер
+# в supervisor'е и сколько из них отдано воркеру без подтверждения (теряются, если он упадёт),
+# частота и таймаут heartbeat'а (завис — перезапуск), потолок паузы между перезапусками
+# упавшего воркера и сколько воркер ждёт ответа процесса-писателя БД
+WORKER_PROCESSES = int(os.getenv("BOT_WORKERS", "0"))
+WORKER_QUEUE = 1000
+WORKER_INFLIGHT = 32
+WORKER_HEARTBEAT_S = 1.0
+WORKER_HEARTBEAT_TIMEOUT_S = 30
+WORKER_RESTART_MAX_S = 30
+WRITER_TIMEOUT_S = 30
+
+# Исходящие запросы: лимиты Telegram (сообщений в секунду) и повторы после 429
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_GROUP_RATE = 20 / 60
+SEND_MAX_RETRIES = 3
+
+# Состояния FSM (черновики рецептов): хранятся в recipes.db, в памяти — ограниченный кэш
+FSM_TTL_S = 24 * 3600           # брошенное состояние забывается через сутки без изменений
+FSM_CACHE_ITEMS = 50_000
+FSM_CACHE_MB = 32
+FSM_FLUSH_MS = 500              # изменения пишутся пачкой раз в FSM_FLUSH_MS
+FSM_SWEEP_S = 600               # как часто удалять просроченные состояния из базы
+
+# Метрики Prometheus: http://METRICS_HOST:METRICS_PORT/metrics (0 — выключено, по умолчанию).
+# Под supervisor.py воркер n слушает METRICS_PORT+1+n. 9100 не брать — это порт node_exporter
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Путь для профиля за весь запуск (collapsed-стеки пишутся на остановке); пусто — выключено.
+# Профиль по запросу доступен и без этого: GET /profile?seconds=10 на порту метрик
+PROFILE_PATH = os.getenv("BOT_PROFILE", "")
@@ -1,29 +1,131 @@
 # db.py
-import sqlite3, json
+import sqlite3, json, hashlib, threading, asyncio, functools, re, random, time
+from array import array
+from collections import deque
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional, Tuple
 
-DB_PATH = Path("recipes.db")
+import numpy as np
 
-def get_conn():
-    return sqlite3.connect(DB_PATH)
+import codec
+import metrics
+import render
+from cache import LRUCache
+from config import (DB_PATH as _DB_PATH, DB_WORKERS, DB_MAX_QUEUE, RECIPE_CACHE_ITEMS, RECIPE_CACHE_MB,
+                    SIMILAR_TOP_K)
 
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS recipes(
+DB_PATH = Path(_DB_PATH)
+
+
+#  Соединения
+#
+# Каждый поток держит одно долгоживущее соединение (handlers, пул потоков БД и т.д.).
+# Открытие/закрытие на каждый апдейт больше не происходит, а кэш подготовленных
+# выражений sqlite3 (cached_statements) живёт столько же, сколько соединение.
+
+PRAGMAS = {
+    "journal_mode": "WAL",          # читатели не блокируют писателя
+    "synchronous": "NORMAL",        # в WAL безопасно, fsync только на чекпойнтах
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -32 * 1024,       # в KiB (отрицательное значение), т.е. 32 МБ
+    "temp_store": "MEMORY",
+}
+BUSY_TIMEOUT_S = 10
+STATEMENT_CACHE = 256
+
+_local = threading.local()
+_conns: List[sqlite3.Connection] = []
+_conns_lock = threading.Lock()
+_generation = 0  # увеличивается в close(): потоки переоткроют соединение при следующем обращении
+
+def _connect() -> sqlite3.Connection:
+    with metrics.DB_CONNECT_SECONDS.time():
+        conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_S, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE)
+        conn.row_factory = sqlite3.Row
+        for name, value in PRAGMAS.items():
+            conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+def get_conn() -> sqlite3.Connection:
+    """Соединение текущего потока (создаётся при первом обращении)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.gen != _generation:
+        conn = _connect()
+        _local.conn, _local.gen = conn, _generation
+        with _conns_lock:
+            _conns.append(conn)
+    return conn
+
+#  Один писатель (supervisor.py)
+#
+# В режиме нескольких процессов в базу пишет только процесс-писатель. Функции с @_writes
+# в воркере не выполняются сами: write_proxy(имя, args, kwargs) отправляет вызов писателю
+# и получает (результат, изменения набора рецептов). Изменения сразу применяются к своим
+# кэшам (_recipes_changed), остальным воркерам их рассылает supervisor.
+
+write_proxy: Optional[Callable[[str, tuple, dict], Tuple[Any, list]]] = None
+_WRITE_FUNCTIONS: Dict[str, Callable] = {}
+_changes: Optional[list] = None   # в писателе: изменения рецептов текущего вызова
+
+def _writes(fn):
+    _WRITE_FUNCTIONS[fn.__name__] = fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if write_proxy is None:
+            return fn(*args, **kwargs)
+        result, changes = write_proxy(fn.__name__, args, kwargs)
+        for recipe_ids, user_id in changes:
+            _recipes_changed(recipe_ids, user_id)
+        return result
+    return wrapper
+
+def execute_write(name: str, args: tuple, kwargs: dict) -> Tuple[Any, list]:
+    """В процессе-писателе: выполнить функцию записи; (результат, [(recipe_ids, user_id), ...])."""
+    global _changes
+    _changes = []
+    try:
+        return _WRITE_FUNCTIONS[name](*args, **kwargs), _changes
+    finally:
+        _changes = None
+
+def close():
+    """Останавливает пул потоков БД и закрывает все соединения (вызывается из bot.on_shutdown)."""
+    global _generation
+    aio.shutdown()
+    with _conns_lock:
+        _generation += 1
+        conns, _conns[:] = list(_conns), []
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+_RECIPES_COLUMNS = """
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,                -- NULL = общая база; иначе — личный рецепт
         title TEXT NOT NULL,
         description TEXT NOT NULL,      -- краткое описание (без граммовок)
-        ingredients_json TEXT NOT NULL, -- [{"name": str, "grams": float, "kcal": float}]
-        steps_json TEXT NOT NULL,       -- [str, ...]
+        ingredients BLOB NOT NULL,      -- codec: (id имени, граммы, ккал) × n
+        ingredient_names TEXT NOT NULL DEFAULT '',  -- названия ингредиентов через пробел (текст для FTS)
+        steps BLOB NOT NULL,            -- codec: строки шагов
         cook_time_min INTEGER NOT NULL,
         total_kcal INTEGER NOT NULL,
-        total_grams INTEGER NOT NULL
-    );
-    """)
+        total_grams INTEGER NOT NULL,
+        n_ingredients INTEGER NOT NULL DEFAULT 0,   -- строк в recipe_ingredients (для «докупить»)
+        content_hash TEXT               -- sha1 содержимого (для инкрементального импорта)
+"""
+
+def init_db():
+    conn = get_conn()
+    cur = conn.cursor()
+    fresh = cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='recipes'").fetchone() is None
+    cur.execute(f"CREATE TABLE IF NOT EXISTS recipes({_RECIPES_COLUMNS})")
     cur.execute("""
     CREATE TABLE IF NOT EXISTS cook_logs(
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -32,80 +134,1220 @@ def init_db():
         ts DATETIME DEFAULT CURRENT_TIMESTAMP
     );
     """)
-    conn.commit(); conn.close()
+    cur.execute("CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT)")
+    if fresh:
+        _create_ingredient_names(cur)
+        _create_indexes(cur)
+        _create_fts(cur)
+        _create_ingredients(cur)
+        _create_stats(cur)
+        _create_fsm(cur)
+        _create_favorites(cur)
+        _create_similar(cur)
+        cur.execute(f"PRAGMA user_version={len(_MIGRATIONS)}")
+        old = len(_MIGRATIONS)
+    else:
+        old = _migrate(conn)
+    conn.commit()
+    _load_names(conn)
+    if old < _MIGRATIONS.index(_m12_recipes_schema) + 1:
+        vacuum()   # JSON-колонки удалены, recipes пересобрана — возвращаем место файлу
 
-def _insert(conn, user_id, title, desc, ings: List[Dict[str, Any]], steps: List[str], tmin: int):
+
+#  Схема и миграции
+
+def _create_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_recipes_title ON recipes(title)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_recipes_quick ON recipes(cook_time_min, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_cook_logs_user ON cook_logs(user_id, ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_recipes_user ON recipes(user_id)")
+
+#  Полнотекстовый индекс (FTS5)
+#
+# recipes_fts — contentless-таблица (текст не дублируется, только индекс), rowid = recipes.id.
+# Индексируются название, описание и названия ингредиентов (колонка ingredient_names: в BLOB'е
+# ingredients только id имён, а триггеры должны работать в любом клиенте — sqlite3, бэкапы, —
+# без функций, которые регистрирует этот модуль).
+# unicode61 корректно приводит кириллицу к нижнему регистру, «ё» сводим к «е» сами.
+# Синхронизация — триггерами на recipes.
+
+def _fts_norm(expr: str) -> str:
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+_FTS_COLUMNS = ", ".join([
+    _fts_norm("{t}.title"),
+    _fts_norm("{t}.description"),
+    _fts_norm("{t}.ingredient_names"),
+])
+# до миграции 11 ингредиенты лежали JSON-текстом (нужно старым миграциям)
+_FTS_JSON_COLUMNS = ", ".join([
+    _fts_norm("{t}.title"),
+    _fts_norm("{t}.description"),
+    _fts_norm("(SELECT group_concat(json_extract(value, '$.name'), ' ') FROM json_each({t}.ingredients_json))"),
+])
+
+def _create_fts(cur, columns: str = _FTS_COLUMNS, source: str = "ingredient_names"):
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(
+        title, description, ingredients,
+        content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """)
+    ins = f"INSERT INTO recipes_fts(rowid, title, description, ingredients) VALUES(NEW.id, {columns.format(t='NEW')});"
+    dele = (f"INSERT INTO recipes_fts(recipes_fts, rowid, title, description, ingredients) "
+            f"VALUES('delete', OLD.id, {columns.format(t='OLD')});")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS recipes_fts_ai AFTER INSERT ON recipes BEGIN {ins} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS recipes_fts_ad AFTER DELETE ON recipes BEGIN {dele} END")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS recipes_fts_au
+    AFTER UPDATE OF title, description, {source} ON recipes BEGIN {dele} {ins} END""")
+
+#  Статистика (роллапы)
+#
+# Счётчики пользователя обновляются в той же транзакции, что и изменения рецептов/логов,
+# поэтому «📊 Статистика» не сканирует ни recipes, ни cook_logs.
+
+def _create_stats(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS user_stats(
+        user_id INTEGER PRIMARY KEY,
+        recipes INTEGER NOT NULL DEFAULT 0,     -- личных рецептов
+        cooked INTEGER NOT NULL DEFAULT 0,      -- завершённых готовок
+        kcal_cooked INTEGER NOT NULL DEFAULT 0,
+        last_day TEXT,                          -- последний день готовки (UTC, YYYY-MM-DD)
+        streak INTEGER NOT NULL DEFAULT 0,      -- дней подряд на last_day
+        best_streak INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS user_recipe_cooks(
+        user_id INTEGER NOT NULL, recipe_id INTEGER NOT NULL, n INTEGER NOT NULL,
+        PRIMARY KEY(user_id, recipe_id)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS user_week_kcal(
+        user_id INTEGER NOT NULL, week TEXT NOT NULL,   -- ISO-неделя: 2026-W42
+        kcal INTEGER NOT NULL, cooks INTEGER NOT NULL,
+        PRIMARY KEY(user_id, week)
+    ) WITHOUT ROWID;
+    """)
+
+def _bump_user_recipes(cur, user_id: int, delta: int):
+    cur.execute("""
+    INSERT INTO user_stats(user_id, recipes) VALUES(?, MAX(?, 0))
+    ON CONFLICT(user_id) DO UPDATE SET recipes = MAX(recipes + ?, 0)
+    """, (user_id, delta, delta))
+
+def _iso_week(day: date) -> str:
+    y, w, _ = day.isocalendar()
+    return f"{y}-W{w:02d}"
+
+def _rollup_cook(cur, user_id: int, recipe_id: int, kcal: int, day: date):
+    row = cur.execute("SELECT last_day, streak FROM user_stats WHERE user_id=?", (user_id,)).fetchone()
+    streak = 1
+    if row and row[0]:
+        last = date.fromisoformat(row[0])
+        if last >= day:
+            day, streak = max(last, day), row[1]   # тот же день (или запись из прошлого)
+        elif last == day - timedelta(days=1):
+            streak = row[1] + 1
+    cur.execute("""
+    INSERT INTO user_stats(user_id, cooked, kcal_cooked, last_day, streak, best_streak) VALUES(?,1,?,?,?,?)
+    ON CONFLICT(user_id) DO UPDATE SET cooked = cooked + 1, kcal_cooked = kcal_cooked + excluded.kcal_cooked,
+        last_day = excluded.last_day, streak = excluded.streak, best_streak = MAX(best_streak, excluded.streak)
+    """, (user_id, kcal, day.isoformat(), streak, streak))
+    cur.execute("""
+    INSERT INTO user_recipe_cooks(user_id, recipe_id, n) VALUES(?,?,1)
+    ON CONFLICT(user_id, recipe_id) DO UPDATE SET n = n + 1
+    """, (user_id, recipe_id))
+    cur.execute("""
+    INSERT INTO user_week_kcal(user_id, week, kcal, cooks) VALUES(?,?,?,1)
+    ON CONFLICT(user_id, week) DO UPDATE SET kcal = kcal + excluded.kcal, cooks = cooks + 1
+    """, (user_id, _iso_week(day), kcal))
+
+def _rebuild_stats(cur):
+    """Пересчёт роллапов с нуля по recipes и cook_logs (миграция, dedup)."""
+    for table in ("user_stats", "user_recipe_cooks", "user_week_kcal"):
+        cur.execute(f"DELETE FROM {table}")
+    cur.execute("""
+    INSERT INTO user_stats(user_id, recipes)
+    SELECT user_id, COUNT(*) FROM recipes WHERE user_id IS NOT NULL GROUP BY user_id
+    """)
+    logs = cur.execute("""
+    SELECT l.user_id, l.recipe_id, COALESCE(r.total_kcal, 0), l.ts
+    FROM cook_logs l LEFT JOIN recipes r ON r.id = l.recipe_id ORDER BY l.ts, l.id
+    """).fetchall()
+    for user_id, recipe_id, kcal, ts in logs:
+        _rollup_cook(cur, user_id, recipe_id, kcal, _ts_day(ts))
+
+def _ts_day(ts: Optional[str]) -> date:
+    return date.fromisoformat(ts[:10]) if ts else datetime.now(timezone.utc).date()
+
+
+#  Нормализованные ингредиенты
+#
+# recipe_ingredients — по строке на ингредиент рецепта с каноническим именем
+# (нижний регистр, ё→е, без скобок и пунктуации). Индекс по имени позволяет
+# подбирать рецепты «из того, что есть» без разбора JSON.
+
+def _create_ingredients(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS recipe_ingredients(
+        recipe_id INTEGER NOT NULL,
+        name TEXT NOT NULL,             -- каноническое имя
+        grams REAL NOT NULL,
+        kcal REAL NOT NULL
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ri_name ON recipe_ingredients(name, recipe_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ri_recipe ON recipe_ingredients(recipe_id)")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS recipe_ingredients_ad AFTER DELETE ON recipes
+    BEGIN DELETE FROM recipe_ingredients WHERE recipe_id = OLD.id; END""")
+
+def _ingredient_rows(recipe_id: int, ings: List[Dict[str, Any]]) -> List[Tuple]:
+    return [(recipe_id, canon_name(str(i.get("name", ""))), float(i.get("grams", 0)), float(i.get("kcal", 0)))
+            for i in ings if str(i.get("name", "")).strip()]
+
+def _index_ingredients(cur, recipe_ids: List[int], source: str = "ingredients"):
+    """Пересобирает строки recipe_ingredients для указанных рецептов (по колонке source)."""
+    for k in range(0, len(recipe_ids), 500):
+        chunk = recipe_ids[k:k + 500]
+        marks = ",".join("?" * len(chunk))
+        rows: List[Tuple] = []
+        for rid, blob in cur.execute(f"SELECT id, {source} FROM recipes WHERE id IN ({marks})", chunk).fetchall():
+            rows.extend(_ingredient_rows(rid, codec.decode_ingredients(blob, ingredient_name)))
+        cur.execute(f"DELETE FROM recipe_ingredients WHERE recipe_id IN ({marks})", chunk)
+        cur.executemany("INSERT INTO recipe_ingredients(recipe_id, name, grams, kcal) VALUES(?,?,?,?)", rows)
+        _vocab_add(r[1] for r in rows)
+
+#  Интернированные имена ингредиентов (codec)
+#
+# В BLOB'е ингредиентов вместо имени — id из ingredient_names. Таблица только растёт,
+# id не переиспользуются, поэтому кэш id <-> имя в памяти не инвалидируется; чужие
+# (другой процесс) id подгружаются при промахе. Новые имена записываются отдельной
+# короткой транзакцией ДО основной (intern_names): откат записи рецепта не оставит
+# в кэше id, которых нет в базе.
+
+_names_lock = threading.Lock()
+_name_by_id: Dict[int, str] = {}
+_id_by_name: Dict[str, int] = {}
+
+def _create_ingredient_names(cur):
+    cur.execute("CREATE TABLE IF NOT EXISTS ingredient_names(id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+
+def _remember_names(rows):
+    with _names_lock:
+        for nid, name in rows:
+            _name_by_id[nid] = name
+            _id_by_name[name] = nid
+
+def _load_names(conn: Optional[sqlite3.Connection] = None):
+    conn = conn or get_conn()
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='ingredient_names'").fetchone():
+        _remember_names(conn.execute("SELECT id, name FROM ingredient_names").fetchall())
+
+def _intern(cur, names):
+    """Выдать id новым именам в текущей транзакции (миграции и intern_names)."""
+    missing = sorted({n for n in names if n not in _id_by_name})
+    if not missing:
+        return
+    cur.executemany("INSERT OR IGNORE INTO ingredient_names(name) VALUES(?)", [(n,) for n in missing])
+    for k in range(0, len(missing), 500):
+        chunk = missing[k:k + 500]
+        _remember_names(cur.execute(f"SELECT id, name FROM ingredient_names WHERE name IN ({','.join('?' * len(chunk))})",
+                                    chunk).fetchall())
+
+def intern_names(recipes_ings: List[List[Dict[str, Any]]]):
+    """Завести id для имён ингредиентов отдельной транзакцией (вызывать до записи рецептов)."""
+    names = {str(i.get("name", "")) for ings in recipes_ings for i in ings}
+    if names.issubset(_id_by_name):
+        return
+    conn = get_conn()
+    with conn:
+        _intern(conn.cursor(), names)
+
+def ingredient_name(nid: int) -> str:
+    name = _name_by_id.get(nid)
+    if name is None:
+        # id выдан другим процессом; отдельное соединение — можем быть внутри транзакции
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            _load_names(conn)
+        finally:
+            conn.close()
+        name = _name_by_id.get(nid, "?")
+    return name
+
+def _has_column(cur, table: str, column: str) -> bool:
+    return any(r[1] == column for r in cur.execute(f"PRAGMA table_info({table})"))
+
+def _m1_content_hash(cur):
+    if not _has_column(cur, "recipes", "content_hash"):
+        cur.execute("ALTER TABLE recipes ADD COLUMN content_hash TEXT")
+    _create_indexes(cur)
+
+def _m2_fts(cur):
+    _create_fts(cur, _FTS_JSON_COLUMNS, "ingredients_json")
+    cur.execute("INSERT INTO recipes_fts(recipes_fts) VALUES('delete-all')")
+    cur.execute(f"""
+    INSERT INTO recipes_fts(rowid, title, description, ingredients)
+    SELECT id, {_FTS_JSON_COLUMNS.format(t='recipes')} FROM recipes
+    """)
+
+def _m3_ingredients(cur):
+    _create_ingredients(cur)
+    ids = [r[0] for r in cur.execute("SELECT id FROM recipes")]
+    _index_ingredients(cur, ids, "ingredients_json")
+
+def _m4_quick_index(cur):
+    _create_indexes(cur)
+
+def _m5_cook_logs_index(cur):
+    _create_indexes(cur)
+
+def _m6_stats(cur):
+    _create_indexes(cur)
+    _create_stats(cur)
+    _rebuild_stats(cur)
+
+def _m7_fsm(cur):
+    _create_fsm(cur)
+
+def _m8_favorites(cur):
+    _create_favorites(cur)
+
+def _m9_similar(cur):
+    _create_similar(cur)   # списки соседей строит manage.py similar (или лениво при первом запросе)
+
+def _m10_binary(cur):
+    """JSON-колонки ingredients_json/steps_json → BLOB'ы codec и текст имён для FTS; триггеры
+    пересоздаются (индекс не трогаем: текст для него тот же). Место возвращает VACUUM в init_db."""
+    _create_ingredient_names(cur)
+    if not _has_column(cur, "recipes", "ingredients"):
+        cur.execute("ALTER TABLE recipes ADD COLUMN ingredients BLOB")
+        cur.execute("ALTER TABLE recipes ADD COLUMN steps BLOB")
+    if not _has_column(cur, "recipes", "ingredient_names"):
+        cur.execute("ALTER TABLE recipes ADD COLUMN ingredient_names TEXT NOT NULL DEFAULT ''")
+    last = 0
+    while True:
+        rows = cur.execute("SELECT id, ingredients_json, steps_json FROM recipes WHERE id > ? ORDER BY id LIMIT 5000",
+                           (last,)).fetchall()
+        if not rows:
+            break
+        last = rows[-1][0]
+        batch = [(rid, json.loads(i), json.loads(st)) for rid, i, st in rows]
+        _intern(cur, [str(x.get("name", "")) for _, ings, _ in batch for x in ings])
+        cur.executemany("UPDATE recipes SET ingredients=?, ingredient_names=?, steps=? WHERE id=?",
+                        [(codec.encode_ingredients(ings, _id_by_name.__getitem__), _names_text(ings),
+                          codec.encode_strings(st), rid) for rid, ings, st in batch])
+    for name in ("recipes_fts_ai", "recipes_fts_ad", "recipes_fts_au"):
+        cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+    cur.execute("ALTER TABLE recipes DROP COLUMN ingredients_json")
+    cur.execute("ALTER TABLE recipes DROP COLUMN steps_json")
+    _create_fts(cur)
+
+def _m11_ingredient_count(cur):
+    if not _has_column(cur, "recipes", "n_ingredients"):
+        cur.execute("ALTER TABLE recipes ADD COLUMN n_ingredients INTEGER NOT NULL DEFAULT 0")
+    cur.execute("UPDATE recipes SET n_ingredients=(SELECT COUNT(*) FROM recipe_ingredients x WHERE x.recipe_id=recipes.id)")
+
+def _m12_recipes_schema(cur):
+    """Таблица recipes как в свежей схеме: колонки, добавленные ALTER'ом в 10 и 11, там без
+    NOT NULL и в другом порядке. Ограничения колонок SQLite не меняет — пересобираем таблицу
+    (индексы и триггеры удаляются вместе со старой и создаются заново), счётчик id сохраняем."""
+    seq = cur.execute("SELECT seq FROM sqlite_sequence WHERE name='recipes'").fetchone()
+    cur.execute("DROP TABLE IF EXISTS recipes_new")
+    cur.execute(f"CREATE TABLE recipes_new({_RECIPES_COLUMNS})")
+    cols = ", ".join(r[1] for r in cur.execute("PRAGMA table_info(recipes_new)"))
+    cur.execute(f"INSERT INTO recipes_new({cols}) SELECT {cols} FROM recipes")
+    cur.execute("DROP TABLE recipes")
+    cur.execute("ALTER TABLE recipes_new RENAME TO recipes")
+    if seq:
+        cur.execute("UPDATE sqlite_sequence SET seq=MAX(seq, ?) WHERE name='recipes'", (seq[0],))
+    _create_indexes(cur)
+    _create_fts(cur)
+    _create_ingredients(cur)
+    _create_favorites(cur)
+    _create_similar(cur)
+
+# Порядок важен: номер миграции = индекс + 1 (хранится в PRAGMA user_version).
+# Свежая база создаётся сразу в актуальной схеме и миграции не гоняет.
+_MIGRATIONS = [_m1_content_hash, _m2_fts, _m3_ingredients, _m4_quick_index, _m5_cook_logs_index,
+               _m6_stats, _m7_fsm, _m8_favorites, _m9_similar, _m10_binary, _m11_ingredient_count,
+               _m12_recipes_schema]
+
+def _migrate(conn):
+    cur = conn.cursor()
+    ver = cur.execute("PRAGMA user_version").fetchone()[0]
+    for n, step in enumerate(_MIGRATIONS[ver:], ver + 1):
+        step(cur)
+        cur.execute(f"PRAGMA user_version={n}")
+        conn.commit()
+    return ver
+
+def get_meta(key: str) -> Optional[str]:
+    conn = get_conn()
+    row = conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_meta(key: str, value: Optional[str]):
+    conn = get_conn()
+    with conn:
+        if value is None:
+            conn.execute("DELETE FROM meta WHERE key=?", (key,))
+        else:
+            conn.execute("INSERT INTO meta(key, value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (key, value))
+
+def recipe_hash(title, desc, ings: List[Dict[str, Any]], steps: List[str], tmin: int) -> str:
+    """Стабильный отпечаток рецепта: не зависит от порядка ключей и форматирования JSON."""
+    payload = json.dumps([title, desc, ings, steps, int(tmin)], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _names_text(ings: List[Dict[str, Any]]) -> str:
+    """Колонка ingredient_names: названия ингредиентов через пробел (для FTS-триггеров)."""
+    return " ".join(str(i.get("name", "")) for i in ings)
+
+def _row_values(user_id, title, desc, ings: List[Dict[str, Any]], steps: List[str], tmin: int) -> Tuple:
     total_kcal = int(round(sum(float(i.get("kcal", 0)) for i in ings)))
     total_grams = int(round(sum(float(i.get("grams", 0)) for i in ings)))
+    n_ings = sum(1 for i in ings if str(i.get("name", "")).strip())   # как в _ingredient_rows
+    return (user_id, title, desc, codec.encode_ingredients(ings, _id_by_name.__getitem__), _names_text(ings),
+            codec.encode_strings(steps), tmin, total_kcal, total_grams, n_ings,
+            recipe_hash(title, desc, ings, steps, tmin))
+
+_INSERT_SQL = """
+    INSERT INTO recipes(user_id,title,description,ingredients,ingredient_names,steps,cook_time_min,total_kcal,
+                        total_grams,n_ingredients,content_hash)
+    VALUES(?,?,?,?,?,?,?,?,?,?,?)
+    """
+
+def _insert(conn, user_id, title, desc, ings: List[Dict[str, Any]], steps: List[str], tmin: int):
     cur = conn.cursor()
-    cur.execute("""
-    INSERT INTO recipes(user_id,title,description,ingredients_json,steps_json,cook_time_min,total_kcal,total_grams)
-    VALUES(?,?,?,?,?,?,?,?)
-    """, (user_id, title, desc, json.dumps(ings, ensure_ascii=False),
-          json.dumps(steps, ensure_ascii=False), tmin, total_kcal, total_grams))
-    conn.commit()
+    cur.execute(_INSERT_SQL, _row_values(user_id, title, desc, ings, steps, tmin))
+    rid = cur.lastrowid
+    rows = _ingredient_rows(rid, ings)
+    cur.executemany("INSERT INTO recipe_ingredients(recipe_id, name, grams, kcal) VALUES(?,?,?,?)", rows)
+    _vocab_add(r[1] for r in rows)
+    return rid
+
+def _max_id(cur) -> int:
+    return cur.execute("SELECT COALESCE(MAX(id), 0) FROM recipes").fetchone()[0]
 
 def insert_many(recipes: List[Dict[str, Any]]):
-    conn = get_conn()
+    intern_names([r["ingredients"] for r in recipes])
+    conn = get_conn(); cur = conn.cursor()
+    with conn:
+        last = _max_id(cur)
+        cur.executemany(_INSERT_SQL, [
+            _row_values(None, r["title"], r["description"], r["ingredients"], r["steps"], r["cook_time_min"])
+            for r in recipes])
+        ids = [r[0] for r in cur.execute("SELECT id FROM recipes WHERE id > ?", (last,)).fetchall()]
+        _index_ingredients(cur, ids)
+    _recipes_changed(ids)
+
+def upsert_shared(recipes: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """Инкрементальный импорт общей базы: ключ — название, изменение определяется по content_hash.
+    Новые вставляются, изменённые обновляются, неизменные не трогаются. Одна транзакция.
+    Возвращает (добавлено, обновлено)."""
+    intern_names([r["ingredients"] for r in recipes])
+    conn = get_conn(); cur = conn.cursor()
+    known: Dict[str, Tuple[int, Optional[str]]] = {}
+    for rid, title, h in cur.execute("SELECT id, title, content_hash FROM recipes WHERE user_id IS NULL ORDER BY id DESC"):
+        known[title] = (rid, h)  # при дублях остаётся самый ранний id
+    to_insert, to_update, seen = [], [], set()
     for r in recipes:
-        _insert(conn, None, r["title"], r["description"], r["ingredients"], r["steps"], r["cook_time_min"])
-    conn.close()
+        if r["title"] in seen:
+            continue
+        seen.add(r["title"])
+        vals = _row_values(None, r["title"], r["description"], r["ingredients"], r["steps"], r["cook_time_min"])
+        old = known.get(r["title"])
+        if old is None:
+            to_insert.append(vals)
+        elif old[1] != vals[-1]:
+            to_update.append(vals[2:] + (old[0],))
+    with conn:
+        last = _max_id(cur)
+        if to_insert:
+            cur.executemany(_INSERT_SQL, to_insert)
+        if to_update:
+            cur.executemany("""
+            UPDATE recipes SET description=?, ingredients=?, ingredient_names=?, steps=?, cook_time_min=?,
+                               total_kcal=?, total_grams=?, n_ingredients=?, content_hash=?
+            WHERE id=?
+            """, to_update)
+        changed = [u[-1] for u in to_update]
+        changed += [r[0] for r in cur.execute("SELECT id FROM recipes WHERE id > ?", (last,)).fetchall()]
+        _index_ingredients(cur, changed)
+        _forget_similar(cur, [u[-1] for u in to_update])
+    _recipes_changed(changed)
+    return len(to_insert), len(to_update)
 
+def dedup_shared() -> int:
+    """Схлопывает дубли общей базы (одинаковое название): остаётся самый ранний id,
+    cook_logs переназначаются на него. Возвращает число удалённых строк."""
+    conn = get_conn(); cur = conn.cursor()
+    with conn:
+        cur.execute("DROP TABLE IF EXISTS temp._dups")
+        cur.execute("""
+        CREATE TEMP TABLE _dups AS
+        SELECT r.id AS old_id, k.keep_id FROM recipes r
+        JOIN (SELECT title, MIN(id) AS keep_id FROM recipes WHERE user_id IS NULL
+              GROUP BY title HAVING COUNT(*) > 1) k ON r.title = k.title
+        WHERE r.user_id IS NULL AND r.id <> k.keep_id
+        """)
+        cur.execute("""
+        UPDATE cook_logs SET recipe_id=(SELECT keep_id FROM _dups WHERE old_id=cook_logs.recipe_id)
+        WHERE recipe_id IN (SELECT old_id FROM _dups)
+        """)
+        cur.execute("DELETE FROM recipes WHERE id IN (SELECT old_id FROM _dups)")
+        removed = cur.rowcount
+        cur.execute("DROP TABLE _dups")
+        # оставшиеся строки могли быть из старого импорта — пусть следующий старт сверит хэши
+        cur.execute("DELETE FROM meta WHERE key LIKE 'json_fp:%'")
+        _rebuild_stats(cur)
+    _recipes_changed(None)
+    return removed
+
+def vacuum():
+    get_conn().execute("VACUUM")
+
+@_writes
 def add_user_recipe(user_id: int, title: str, desc: str, ings: List[Dict[str, Any]], steps: List[str], tmin: int):
-    conn = get_conn(); _insert(conn, user_id, title, desc, ings, steps, tmin); conn.close()
+    intern_names([ings])
+    conn = get_conn()
+    with conn:
+        rid = _insert(conn, user_id, title, desc, ings, steps, tmin)
+        _bump_user_recipes(conn.cursor(), user_id, +1)
+    _recipes_changed([rid], user_id)
+    return rid
+
+#  Поиск
+
+# Окончания, которые отрезаем у слов запроса: «курицей» → «куриц*», «помидоры» → «помидор*».
+_RU_ENDINGS = sorted("""
+    иями ями ами ого его ому ему ыми ими ией иях ах ях ой ей ий ый ая яя ое ее ые ие
+    ов ев ом ем ам ям ую юю ию а я ы и у ю о е ь й
+""".split(), key=len, reverse=True)
+_WORD_RE = re.compile(r"\w+")
+
+def norm_text(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+def stem(word: str) -> str:
+    """Очень лёгкий стемминг для русского: срезаем одно окончание, оставляя ≥ 3 букв."""
+    for end in _RU_ENDINGS:
+        if word.endswith(end) and len(word) - len(end) >= 3:
+            return word[:-len(end)]
+    return word
 
-def search(keyword: str, user_id: int):
-    conn = get_conn(); conn.row_factory = sqlite3.Row
-    cur = conn.cursor(); like = f"%{keyword.lower()}%"
+# Префиксные индексы FTS — от 2 символов (prefix='2 3'): «с»* перебирал бы весь словарь
+# (~200 мс на 100k рецептов), поэтому однобуквенные слова («с», «и», «в») в запрос не идут
+FTS_MIN_TERM = 2
+
+def fts_query(text: str) -> Optional[str]:
+    """Строка запроса FTS5: все слова (по префиксу основы) должны встретиться.
+    None — искать нечего (пусто или одни однобуквенные слова)."""
+    terms = [stem(w) for w in _WORD_RE.findall(norm_text(text)) if len(w) >= FTS_MIN_TERM]
+    if not terms:
+        return None
+    return " ".join(f'"{t}"*' for t in terms)
+
+SEARCH_LIMIT = 40
+
+def search(keyword: str, user_id: int, limit: int = SEARCH_LIMIT):
+    """Поиск по названию/описанию/ингредиентам через FTS5, сортировка по bm25
+    (название важнее ингредиентов, ингредиенты важнее описания)."""
+    q = fts_query(keyword)
+    if q is None:
+        return []
+    cur = get_conn().cursor()
     cur.execute("""
-    SELECT * FROM recipes
-    WHERE (user_id IS NULL OR user_id=?)
-      AND (LOWER(title) LIKE ? OR LOWER(description) LIKE ? OR LOWER(ingredients_json) LIKE ?)
-    ORDER BY id DESC LIMIT 40
-    """, (user_id, like, like, like))
-    rows = cur.fetchall(); conn.close(); return rows
-
-def all_for_user(user_id: int, quick_only: bool=False):
-    conn = get_conn(); conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    SELECT r.* FROM recipes_fts f JOIN recipes r ON r.id = f.rowid
+    WHERE recipes_fts MATCH ? AND (r.user_id IS NULL OR r.user_id=?)
+    ORDER BY bm25(recipes_fts, 10.0, 1.0, 4.0), r.id DESC LIMIT ?
+    """, (q, user_id, limit))
+    return cur.fetchall()
+
+def search_recipes(keyword: str, user_id: Optional[int], limit: int = SEARCH_LIMIT) -> List[Dict[str, Any]]:
+    """Поиск для inline-режима: только общие (user_id=None) или только свои рецепты пользователя,
+    разобранные и с готовой карточкой (через кэш рецептов — выбор результата БД уже не трогает)."""
+    q = fts_query(keyword)
+    if q is None:
+        return []
+    owner, params = ("r.user_id IS NULL", [q]) if user_id is None else ("r.user_id = ?", [q, user_id])
+    conn = get_conn()
+    # сначала только id по bm25 (сортировка не тащит BLOB'ы), строки — лишь для тех, кого нет в кэше
+    ids = [r[0] for r in conn.execute(f"""
+    SELECT r.id FROM recipes_fts f JOIN recipes r ON r.id = f.rowid
+    WHERE recipes_fts MATCH ? AND {owner}
+    ORDER BY bm25(recipes_fts, 10.0, 1.0, 4.0), r.id DESC LIMIT ?""", params + [limit])]
+    found = {rid: _recipe_cache.get(rid) for rid in ids}
+    missing = [rid for rid, r in found.items() if r is None]
+    if missing:
+        marks = ",".join("?" * len(missing))
+        for row in conn.execute(f"SELECT * FROM recipes WHERE id IN ({marks})", missing):
+            found[row["id"]] = _remember(row)
+    return [found[rid] for rid in ids if found[rid] is not None]
+
+#  Постраничный список
+#
+# Keyset-пагинация: страница задаётся ключом сортировки крайнего элемента, а не OFFSET,
+# поэтому любая страница стоит одинаково. Тянем только поля для строки списка.
+# Порядок: все — id DESC; быстрые — cook_time_min ASC, id DESC (индекс idx_recipes_quick).
+
+PAGE_SIZE = 20
+QUICK_MAX_MIN = 15
+
+def page_key(row, quick_only: bool) -> str:
+    """Курсор для callback_data: «id» или «минуты.id»."""
+    return f"{row['cook_time_min']}.{row['id']}" if quick_only else str(row["id"])
+
+def _parse_key(key: str, quick_only: bool) -> Tuple[int, int]:
     if quick_only:
-        cur.execute("""SELECT * FROM recipes WHERE (user_id IS NULL OR user_id=?) AND cook_time_min<=15 ORDER BY cook_time_min,id DESC""",(user_id,))
+        tmin, rid = key.split(".")
+        return int(tmin), int(rid)
+    return 0, int(key)
+
+def list_page(user_id: int, quick_only: bool = False, after: Optional[str] = None,
+              before: Optional[str] = None, limit: int = PAGE_SIZE) -> Tuple[List[sqlite3.Row], bool, bool]:
+    """Страница списка рецептов: после курсора after, либо перед курсором before.
+    Возвращает (строки, есть_предыдущая, есть_следующая)."""
+    where = ["(user_id IS NULL OR user_id=?)"]
+    params: List[Any] = [user_id]
+    if quick_only:
+        where.append("cook_time_min<=?"); params.append(QUICK_MAX_MIN)
+    backward = before is not None
+    key = before if backward else after
+    if key is not None:
+        tmin, rid = _parse_key(key, quick_only)
+        if quick_only:
+            op_t, op_id = (">", "<") if not backward else ("<", ">")
+            where.append(f"(cook_time_min {op_t} ? OR (cook_time_min = ? AND id {op_id} ?))")
+            params += [tmin, tmin, rid]
+        else:
+            where.append("id < ?" if not backward else "id > ?"); params.append(rid)
+    if quick_only:
+        order = "cook_time_min, id DESC" if not backward else "cook_time_min DESC, id"
     else:
-        cur.execute("""SELECT * FROM recipes WHERE (user_id IS NULL OR user_id=?) ORDER BY id DESC""",(user_id,))
-    rows = cur.fetchall(); conn.close(); return rows
+        order = "id DESC" if not backward else "id"
+    cur = get_conn().cursor()
+    cur.execute(f"""
+    SELECT id, title, cook_time_min, total_kcal FROM recipes
+    WHERE {" AND ".join(where)} ORDER BY {order} LIMIT ?
+    """, params + [limit + 1])
+    rows = cur.fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        return rows[::-1], more, True
+    return rows, key is not None, more
 
 def by_id(recipe_id: int, user_id: int) -> Optional[sqlite3.Row]:
-    conn = get_conn(); conn.row_factory = sqlite3.Row
+    conn = get_conn()
     cur = conn.cursor()
-    cur.execute("""SELECT * FROM recipes WHERE id=? AND (user_id IS NULL OR user_id=?)""",(recipe_id, user_id))
-    row = cur.fetchone(); conn.close(); return row
+    cur.execute("SELECT * FROM recipes WHERE id=? AND (user_id IS NULL OR user_id=?)", (recipe_id, user_id))
+    return cur.fetchone()
+
+#  Кэш разобранных рецептов
+#
+# Рецепт в кэше — уже разобранный dict (ingredients/steps — списки) вместе с готовым
+# HTML карточки и шагов (render.py, рендерится при попадании в кэш), чтобы пошаговая
+# готовка и карточки не трогали ни SQLite, ни codec. Общие рецепты меняются только
+# импортом, личные — через add_user_recipe/delete_user_recipe; там же и инвалидация.
+
+_recipe_cache = LRUCache(max_items=RECIPE_CACHE_ITEMS, max_bytes=RECIPE_CACHE_MB * 1024 * 1024)
+
+def _recipes_changed(recipe_ids: Optional[List[int]], user_id: Optional[int] = None):
+    """Сброс всех производных от набора рецептов кэшей. recipe_ids=None — «изменилось всё»;
+    user_id=None — менялась общая база, иначе — личные рецепты этого пользователя."""
+    global _shared_ids, _shared_version
+    if _changes is not None:
+        _changes.append((recipe_ids, user_id))
+    if recipe_ids is None:
+        _recipe_cache.clear()
+    else:
+        for rid in recipe_ids:
+            _recipe_cache.pop(rid)
+    if user_id is None:
+        _shared_ids = None
+        _shared_version += 1
+    else:
+        _own_ids.pop(user_id)
+        _user_versions[user_id] = _user_versions.get(user_id, 0) + 1
+
+# Версии набора рецептов: по ним внешние кэши (planner) понимают, что пора пересчитать
+_shared_version = 0
+_user_versions: Dict[int, int] = {}
 
+def recipes_version(user_id: int) -> Tuple[int, int]:
+    return _shared_version, _user_versions.get(user_id, 0)
+
+def decode_recipe(row) -> Dict[str, Any]:
+    try:
+        ings, steps = row["ingredients"], row["steps"]
+    except IndexError:   # база до миграции 11 (JSON-колонки) — её читает миграция 3
+        ings, steps = row["ingredients_json"], row["steps_json"]
+    return {
+        "id": row["id"],
+        "user_id": row["user_id"],
+        "title": row["title"],
+        "description": row["description"],
+        "ingredients": codec.decode_ingredients(ings, ingredient_name),
+        "steps": codec.decode_strings(steps),
+        "cook_time_min": row["cook_time_min"],
+        "total_kcal": row["total_kcal"],
+        "total_grams": row["total_grams"],
+    }
+
+def _remember(row) -> Dict[str, Any]:
+    """Разобранный рецепт с готовыми card_pages/step_html, запомненный в кэше."""
+    recipe = _recipe_cache.get(row["id"])
+    if recipe is None:
+        recipe = decode_recipe(row)
+        card = render.render_recipe(recipe)    # один раз на попадание в кэш, дальше — готовые строки
+        recipe["card_pages"], recipe["step_html"] = card["pages"], card["steps"]
+        _recipe_cache.put(row["id"], recipe)
+    return recipe
+
+def cached_recipe(recipe_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """Рецепт из кэша (без обращения к БД) или None."""
+    r = _recipe_cache.get(recipe_id)
+    if r is not None and (r["user_id"] is None or r["user_id"] == user_id):
+        return r
+    return None
+
+def cache_stats() -> Dict[str, int]:
+    return _recipe_cache.stats()
+
+def get_recipe(recipe_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """Разобранный рецепт (общий или свой) через кэш."""
+    r = cached_recipe(recipe_id, user_id)
+    if r is not None:
+        return r
+    row = by_id(recipe_id, user_id)
+    return _remember(row) if row else None
+
+@_writes
 def delete_user_recipe(recipe_id: int, user_id: int) -> bool:
     conn = get_conn(); cur = conn.cursor()
-    cur.execute("DELETE FROM recipes WHERE id=? AND user_id=?", (recipe_id, user_id))
-    ok = cur.rowcount > 0; conn.commit(); conn.close(); return ok
+    with conn:
+        cur.execute("DELETE FROM recipes WHERE id=? AND user_id=?", (recipe_id, user_id))
+        ok = cur.rowcount > 0
+        if ok:
+            _bump_user_recipes(cur, user_id, -1)
+    if ok:
+        _recipes_changed([recipe_id], user_id)
+    return ok
 
-def random_recipe(user_id: int):
-    conn = get_conn(); conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("""SELECT * FROM recipes WHERE (user_id IS NULL OR user_id=?) ORDER BY RANDOM() LIMIT 1""", (user_id,))
-    row = cur.fetchone(); conn.close(); return row
+#  Случайный рецепт
+#
+# Вместо ORDER BY RANDOM() (сортировка всей таблицы) держим в памяти массив id общих
+# рецептов и кортежи id личных. Выбор — случайный индекс и один поиск по первичному ключу
+# (или попадание в кэш). Недавно показанные/приготовленные пользователем id пропускаем.
 
-def by_ingredients(words: List[str], user_id: int):
-    conn = get_conn(); conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    like = "%" + "%".join(w.lower() for w in words) + "%"
-    cur.execute("""SELECT * FROM recipes WHERE (user_id IS NULL OR user_id=?) AND (LOWER(ingredients_json) LIKE ? OR LOWER(title) LIKE ?) ORDER BY id DESC LIMIT 40""",(user_id, like, like))
-    rows = cur.fetchall(); conn.close(); return rows
+RANDOM_RECENT = 20      # сколько последних рецептов пользователя не повторять
+RANDOM_TRIES = 5
+
+_shared_ids: Optional[array] = None
+_own_ids = LRUCache(max_items=50000)    # user_id -> tuple(id)
+_recent = LRUCache(max_items=50000)     # user_id -> deque(id) показанных и приготовленных
+
+def _shared_id_array() -> array:
+    global _shared_ids
+    ids = _shared_ids
+    if ids is None:
+        ids = array("q", (r[0] for r in get_conn().execute("SELECT id FROM recipes WHERE user_id IS NULL ORDER BY id")))
+        _shared_ids = ids
+    return ids
+
+def _user_ids(user_id: int) -> Tuple[int, ...]:
+    ids = _own_ids.get(user_id)
+    if ids is None:
+        ids = tuple(r[0] for r in get_conn().execute("SELECT id FROM recipes WHERE user_id=? ORDER BY id", (user_id,)))
+        _own_ids.put(user_id, ids)
+    return ids
+
+def has_own_recipes(user_id: int) -> bool:
+    return bool(_user_ids(user_id))
+
+def _recent_ids(user_id: int) -> deque:
+    recent = _recent.get(user_id)
+    if recent is None:
+        rows = get_conn().execute(
+            "SELECT recipe_id FROM cook_logs WHERE user_id=? ORDER BY ts DESC LIMIT ?", (user_id, RANDOM_RECENT)).fetchall()
+        recent = deque((r[0] for r in reversed(rows)), maxlen=RANDOM_RECENT)
+        _recent.put(user_id, recent)
+    return recent
+
+def mark_seen(user_id: int, recipe_id: int):
+    _recent_ids(user_id).append(recipe_id)
+
+def random_recipe(user_id: int, avoid_recent: bool = True) -> Optional[Dict[str, Any]]:
+    shared, own = _shared_id_array(), _user_ids(user_id)
+    total = len(shared) + len(own)
+    if not total:
+        return None
+    recent = _recent_ids(user_id) if avoid_recent else ()
+    recipe = None
+    for attempt in range(RANDOM_TRIES):
+        i = random.randrange(total)
+        rid = shared[i] if i < len(shared) else own[i - len(shared)]
+        if rid in recent and attempt < RANDOM_TRIES - 1 and total > len(recent):
+            continue
+        recipe = get_recipe(rid, user_id)
+        if recipe is not None:
+            break
+        # рецепт исчез в обход кэшей — перечитаем массивы id (и общие, и личные)
+        _recipes_changed([rid])
+        _recipes_changed([rid], user_id)
+        shared, own = _shared_id_array(), _user_ids(user_id)
+        total = len(shared) + len(own)
+        if not total:
+            return None
+    if recipe is not None and avoid_recent:
+        recent.append(recipe["id"])
+    return recipe
+
+#  Подбор по ингредиентам
+
+def canon_name(name: str) -> str:
+    """Каноническое имя ингредиента: «Горошек консерв. (банка)» → «горошек консерв»."""
+    return " ".join(_WORD_RE.findall(re.sub(r"\(.*?\)", " ", norm_text(name))))
+
+# Словарь канонических имён → слова имени. Заменяется целиком (copy-on-write),
+# поэтому читать его из любого потока можно без блокировок.
+_vocab: Optional[Dict[str, Tuple[str, ...]]] = None
+
+def _vocab_add(names):
+    global _vocab
+    if _vocab is None:
+        return
+    new = {n: tuple(n.split()) for n in names if n not in _vocab}
+    if new:
+        _vocab = {**_vocab, **new}
+
+def _ingredient_vocab() -> Dict[str, Tuple[str, ...]]:
+    global _vocab
+    if _vocab is None:
+        names = get_conn().execute("SELECT DISTINCT name FROM recipe_ingredients").fetchall()
+        _vocab = {r[0]: tuple(r[0].split()) for r in names}
+    return _vocab
+
+def match_ingredient_names(word: str) -> List[str]:
+    """Канонические имена, в которых каждое слово запроса — префикс (по основе) какого-то слова имени."""
+    stems = [stem(w) for w in _WORD_RE.findall(norm_text(word))]
+    if not stems:
+        return []
+    return [name for name, parts in _ingredient_vocab().items()
+            if all(any(p.startswith(s) for p in parts) for s in stems)]
+
+# Общая база для подбора — в памяти: по каждому имени отсортированный массив id рецептов
+# и число ингредиентов каждого рецепта (индекс — id). covered/matched считаются сложением
+# по массивам запроса, без GROUP BY по всем вхождениям в SQLite: миллисекунды и на 100k+.
+# Перечитывается при смене общей базы (как массивы planner); личные рецепты — запросом.
+_postings: Optional[Tuple[int, Dict[str, np.ndarray], np.ndarray]] = None   # (версия, имя -> id, n по id)
+_postings_lock = threading.Lock()
+
+def _shared_postings() -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    global _postings
+    with _postings_lock:
+        if _postings is None or _postings[0] != _shared_version:
+            version = _shared_version
+            shared = np.frombuffer(_shared_id_array(), dtype=np.int64)
+            is_shared = np.zeros(int(shared[-1]) + 1 if len(shared) else 1, dtype=bool)
+            is_shared[shared] = True
+            cur = get_conn().cursor()
+            cur.row_factory = None      # сотни тысяч строк — без sqlite3.Row
+            rows = cur.execute("SELECT name, recipe_id FROM recipe_ingredients ORDER BY name, recipe_id").fetchall()
+            post: Dict[str, np.ndarray] = {}
+            for name, group in groupby(rows, key=lambda r: r[0]):
+                ids = np.fromiter((r[1] for r in group), dtype=np.int64)
+                ids = ids[ids < len(is_shared)]
+                ids = ids[is_shared[ids]]
+                if len(ids):
+                    post[name] = ids
+            # число ингредиентов общего рецепта = его строк в recipe_ingredients (= recipes.n_ingredients)
+            n = np.bincount(np.concatenate(list(post.values())), minlength=len(is_shared)) if post else \
+                np.zeros(len(is_shared), dtype=np.int64)
+            _postings = (version, post, n)
+        return _postings[1], _postings[2]
+
+def _rank_shared(pairs: List[Tuple[str, int]], limit: int) -> List[Tuple[int, int, int]]:
+    post, n = _shared_postings()
+    covered = np.zeros(len(n), dtype=np.int64)
+    matched = np.zeros(len(n), dtype=np.int64)
+    for name in {name for name, _ in pairs if name in post}:
+        matched[post[name]] += 1
+    for w in {w for _, w in pairs}:
+        arrs = [post[name] for name, pw in pairs if pw == w and name in post]
+        if arrs:
+            covered[np.unique(np.concatenate(arrs)) if len(arrs) > 1 else arrs[0]] += 1
+    ids = np.flatnonzero(covered)
+    if not len(ids):
+        return []
+    missing = n[ids] - matched[ids]
+    # больше покрыто, затем меньше докупить, затем новее — одним ключом
+    key = (covered[ids] << 48) | ((0xFFFF - np.minimum(missing, 0xFFFF)) << 32) | ids
+    if len(key) > limit:
+        part = np.argpartition(-key, limit)[:limit]
+        ids, key = ids[part], key[part]
+    order = np.argsort(-key)
+    return [(int(i), int(covered[i]), int(n[i] - matched[i])) for i in ids[order]]
+
+def by_ingredients(words: List[str], user_id: int, limit: int = SEARCH_LIMIT):
+    """Рецепты, покрывающие больше всего ингредиентов пользователя; при равенстве —
+    с наименьшим числом недостающих. В строках дополнительно: covered, missing."""
+    pairs = [(name, w) for w, word in enumerate(words) for name in match_ingredient_names(word)]
+    if not pairs:
+        return []
+    top = _rank_shared(pairs, limit)
+    conn = get_conn()
+    if _user_ids(user_id):     # свои рецепты: CROSS JOIN — от них, а не от всех вхождений имени
+        values = ",".join("(?,?)" for _ in pairs)
+        top += [tuple(r) for r in conn.execute(f"""
+        WITH q(name, w) AS (VALUES {values})
+        SELECT r.id, COUNT(DISTINCT q.w), r.n_ingredients - COUNT(DISTINCT ri.rowid)
+        FROM recipes r CROSS JOIN recipe_ingredients ri ON ri.recipe_id = r.id CROSS JOIN q ON q.name = ri.name
+        WHERE r.user_id = ? GROUP BY r.id""", [x for p in pairs for x in p] + [user_id])]
+        top = sorted(top, key=lambda t: (-t[1], t[2], -t[0]))[:limit]
+    if not top:
+        return []
+    values = ",".join("(?,?,?,?)" for _ in top)
+    return conn.execute(f"""
+    WITH t(id, covered, missing, pos) AS (VALUES {values})
+    SELECT r.*, t.covered, t.missing FROM t JOIN recipes r ON r.id = t.id ORDER BY t.pos
+    """, [x for pos, t in enumerate(top) for x in t + (pos,)]).fetchall()
 
-def log_cook(user_id: int, recipe_id: int):
+def _log_cook(cur, user_id: int, recipe_id: int, when: datetime):
+    cur.execute("INSERT INTO cook_logs(user_id, recipe_id, ts) VALUES (?,?,?)",
+                (user_id, recipe_id, when.strftime("%Y-%m-%d %H:%M:%S")))
+    r = _recipe_cache.get(recipe_id)
+    if r is not None:
+        kcal = r["total_kcal"]
+    else:
+        row = cur.execute("SELECT total_kcal FROM recipes WHERE id=?", (recipe_id,)).fetchone()
+        kcal = row[0] if row else 0
+    _rollup_cook(cur, user_id, recipe_id, kcal, when.date())
+
+# Пакетная запись событий из writer.BatchWriter: kind -> функция(cur, *args)
+_EVENT_WRITERS = {
+    "cook": _log_cook,
+}
+
+@_writes
+def _store_events(events: List[Tuple[str, tuple]]):
     conn = get_conn(); cur = conn.cursor()
-    cur.execute("INSERT INTO cook_logs(user_id, recipe_id) VALUES (?,?)", (user_id, recipe_id))
-    conn.commit(); conn.close()
+    with conn:
+        for kind, args in events:
+            _EVENT_WRITERS[kind](cur, *args)
+
+def write_events(events: List[Tuple[str, tuple]]):
+    """Записать пачку событий одной транзакцией."""
+    _store_events(events)
+    for kind, args in events:  # «недавно готовил» — память этого процесса, не писателя
+        if kind == "cook":
+            mark_seen(args[0], args[1])
+
+STATS_TOP = 3
+STATS_WEEKS = 4
+
+def stats(user_id: int) -> Dict[str, Any]:
+    """Статистика из роллапов: счётчики, серия дней, самые частые рецепты, ккал по неделям."""
+    cur = get_conn().cursor()
+    row = cur.execute("SELECT * FROM user_stats WHERE user_id=?", (user_id,)).fetchone()
+    today = datetime.now(timezone.utc).date()
+    streak = 0
+    if row and row["last_day"] and date.fromisoformat(row["last_day"]) >= today - timedelta(days=1):
+        streak = row["streak"]   # серия жива, если готовили сегодня или вчера
+    top = cur.execute("""
+    SELECT c.recipe_id, c.n, COALESCE(r.title, '—') AS title FROM user_recipe_cooks c
+    LEFT JOIN recipes r ON r.id = c.recipe_id
+    WHERE c.user_id=? ORDER BY c.n DESC, c.recipe_id LIMIT ?
+    """, (user_id, STATS_TOP)).fetchall()
+    weeks = cur.execute("""
+    SELECT week, kcal, cooks FROM user_week_kcal WHERE user_id=? ORDER BY week DESC LIMIT ?
+    """, (user_id, STATS_WEEKS)).fetchall()
+    return {
+        "common": len(_shared_id_array()),
+        "mine": row["recipes"] if row else 0,
+        "cooked": row["cooked"] if row else 0,
+        "kcal_cooked": row["kcal_cooked"] if row else 0,
+        "streak": streak,
+        "best_streak": row["best_streak"] if row else 0,
+        "top": [dict(r) for r in top],
+        "weeks": [dict(r) for r in weeks],
+    }
+
 
-def stats(user_id: int):
+#  Данные для планировщика рациона (planner.py)
+
+def plan_rows(user_id: Optional[int] = None) -> List[Tuple[int, int, int, int, str]]:
+    """(id, total_kcal, total_grams, cook_time_min, title) общих рецептов или личных рецептов user_id."""
+    cur = get_conn().cursor()
+    if user_id is None:
+        cur.execute("SELECT id, total_kcal, total_grams, cook_time_min, title FROM recipes WHERE user_id IS NULL")
+    else:
+        cur.execute("SELECT id, total_kcal, total_grams, cook_time_min, title FROM recipes WHERE user_id=?", (user_id,))
+    return [tuple(r) for r in cur.fetchall()]
+
+
+#  Избранное и список покупок
+#
+# favorites — (пользователь, рецепт); удаляется вместе с рецептом триггером.
+# Список покупок собирается одним запросом по recipe_ingredients: ингредиенты всех
+# рецептов складываются по каноническому имени с учётом доли порции каждого рецепта.
+
+FAVORITES_LIMIT = 200
+SHOP_MAX_RECIPES = 200
+
+def _create_favorites(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS favorites(
+        user_id INTEGER NOT NULL,
+        recipe_id INTEGER NOT NULL,
+        added_at INTEGER NOT NULL,
+        PRIMARY KEY(user_id, recipe_id)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS favorites_ad AFTER DELETE ON recipes
+    BEGIN DELETE FROM favorites WHERE recipe_id = OLD.id; END""")
+
+@_writes
+def toggle_favorite(user_id: int, recipe_id: int) -> Optional[bool]:
+    """Добавить в избранное или убрать оттуда. True — добавлен, False — убран, None — рецепт недоступен."""
     conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM recipes WHERE user_id IS NULL"); common = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM recipes WHERE user_id=?", (user_id,)); mine = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM cook_logs WHERE user_id=?", (user_id,)); cooked = cur.fetchone()[0]
-    conn.close(); return {"common": common, "mine": mine, "cooked": cooked}
\ No newline at end of file
+    with conn:
+        cur.execute("DELETE FROM favorites WHERE user_id=? AND recipe_id=?", (user_id, recipe_id))
+        if cur.rowcount:
+            return False
+        cur.execute("""
+        INSERT INTO favorites(user_id, recipe_id, added_at)
+        SELECT ?, id, CAST(strftime('%s','now') AS INTEGER) FROM recipes
+        WHERE id=? AND (user_id IS NULL OR user_id=?)""", (user_id, recipe_id, user_id))
+        return True if cur.rowcount else None
+
+def favorites(user_id: int, limit: int = FAVORITES_LIMIT) -> List[sqlite3.Row]:
+    """Избранные рецепты пользователя (id, title, cook_time_min, total_kcal), новые сверху."""
+    return get_conn().execute("""
+    SELECT r.id, r.title, r.cook_time_min, r.total_kcal FROM favorites f JOIN recipes r ON r.id = f.recipe_id
+    WHERE f.user_id=? ORDER BY f.added_at DESC, f.recipe_id DESC LIMIT ?""", (user_id, limit)).fetchall()
+
+def shopping_list(user_id: int, portions: Dict[int, float]) -> Tuple[List[sqlite3.Row], int]:
+    """Сводный список покупок: portions — {recipe_id: доля рецепта (1 — целиком)}.
+    Возвращает ([(name, grams, kcal, recipes)], сколько рецептов из portions нашлось)."""
+    items = [(int(rid), float(k)) for rid, k in portions.items() if k > 0][:SHOP_MAX_RECIPES]
+    if not items:
+        return [], 0
+    cur = get_conn().cursor()
+    values = ",".join(["(?,?)"] * len(items))
+    params = [x for p in items for x in p] + [user_id]
+    cur.execute(f"""
+    WITH q(recipe_id, k) AS (VALUES {values}),
+    ok AS (SELECT q.recipe_id, q.k FROM q JOIN recipes r ON r.id = q.recipe_id
+           WHERE r.user_id IS NULL OR r.user_id = ?)
+    SELECT ri.name, SUM(ri.grams * ok.k) AS grams, SUM(ri.kcal * ok.k) AS kcal,
+           COUNT(DISTINCT ri.recipe_id) AS recipes, (SELECT COUNT(*) FROM ok) AS found
+    FROM ok JOIN recipe_ingredients ri ON ri.recipe_id = ok.recipe_id
+    GROUP BY ri.name ORDER BY ri.name
+    """, params)
+    rows = cur.fetchall()
+    return rows, (rows[0]["found"] if rows else 0)
+
+#  Похожие рецепты (similar.py)
+#
+# similar — готовые top-k соседей каждого рецепта: (recipe_id, rank) -> similar_id, score.
+# Запрос «похожих» — чтение k строк по первичному ключу. Строки рецепта и строки,
+# ссылающиеся на него, удаляются вместе с рецептом; изменённый импортом рецепт
+# теряет свой список и пересчитывается при следующем запросе.
+
+def _create_similar(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS similar(
+        recipe_id INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        similar_id INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY(recipe_id, rank)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_similar_to ON similar(similar_id)")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS similar_ad AFTER DELETE ON recipes
+    BEGIN DELETE FROM similar WHERE recipe_id = OLD.id OR similar_id = OLD.id; END""")
+
+def _forget_similar(cur, recipe_ids: List[int]):
+    for k in range(0, len(recipe_ids), 500):
+        chunk = recipe_ids[k:k + 500]
+        cur.execute(f"DELETE FROM similar WHERE recipe_id IN ({','.join('?' * len(chunk))})", chunk)
+
+def feature_rows(user_id: Optional[int] = None) -> List[Tuple[int, str, str, float, float]]:
+    """(recipe_id, title, ингредиент, граммы, ккал) общих рецептов или личных рецептов user_id, по recipe_id."""
+    cur = get_conn().cursor()
+    where = "r.user_id IS NULL" if user_id is None else "r.user_id = ?"
+    cur.execute(f"""
+    SELECT r.id, r.title, ri.name, ri.grams, ri.kcal FROM recipes r JOIN recipe_ingredients ri ON ri.recipe_id = r.id
+    WHERE {where} ORDER BY r.id""", () if user_id is None else (user_id,))
+    return cur.fetchall()
+
+def recipe_owner(recipe_id: int) -> Tuple[bool, Optional[int]]:
+    """(есть ли рецепт, его user_id)."""
+    row = get_conn().execute("SELECT user_id FROM recipes WHERE id=?", (recipe_id,)).fetchone()
+    return (row is not None, row[0] if row else None)
+
+def users_with_recipes() -> List[int]:
+    return [r[0] for r in get_conn().execute("SELECT DISTINCT user_id FROM recipes WHERE user_id IS NOT NULL")]
+
+@_writes
+def save_similar(recipe_ids: List[int], rows: List[Tuple[int, int, int, float]], replace_all: bool = False):
+    """Заменить списки соседей recipe_ids на rows (recipe_id, rank, similar_id, score).
+    replace_all — пересобрать таблицу целиком (полная перестройка)."""
+    conn = get_conn(); cur = conn.cursor()
+    with conn:
+        if replace_all:
+            cur.execute("DELETE FROM similar")
+        else:
+            _forget_similar(cur, recipe_ids)
+        cur.executemany("INSERT OR REPLACE INTO similar(recipe_id, rank, similar_id, score) VALUES(?,?,?,?)", rows)
+
+def similar_to(recipe_id: int, user_id: int, limit: int = SIMILAR_TOP_K) -> List[sqlite3.Row]:
+    """Готовые соседи рецепта, видимые пользователю (id, title, cook_time_min, total_kcal, score)."""
+    return get_conn().execute("""
+    SELECT r.id, r.title, r.cook_time_min, r.total_kcal, s.score FROM similar s
+    JOIN recipes src ON src.id = s.recipe_id JOIN recipes r ON r.id = s.similar_id
+    WHERE s.recipe_id = ? AND (src.user_id IS NULL OR src.user_id = ?) AND (r.user_id IS NULL OR r.user_id = ?)
+    ORDER BY s.rank LIMIT ?""", (recipe_id, user_id, user_id, limit)).fetchall()
+
+#  Состояния FSM (storage.SQLiteStorage)
+#
+# Одна строка на (чат, пользователь); пустые состояния не хранятся. updated_at — unix-время
+# последней записи: брошенные черновики старше TTL не читаются и удаляются fsm_expire.
+
+def _create_fsm(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS fsm_states(
+        chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+        state TEXT, data TEXT NOT NULL, bucket TEXT NOT NULL,
+        updated_at INTEGER NOT NULL,
+        PRIMARY KEY(chat_id, user_id)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm_states(updated_at)")
+
+def fsm_load(chat_id, user_id, not_before: int) -> Optional[sqlite3.Row]:
+    return get_conn().execute(
+        "SELECT state, data, bucket FROM fsm_states WHERE chat_id=? AND user_id=? AND updated_at>=?",
+        (chat_id, user_id, not_before)).fetchone()
+
+@_writes
+def fsm_save(rows: List[Tuple]):
+    """rows: (chat_id, user_id, state, data_json, bucket_json, updated_at); пустое состояние — удаление."""
+    conn = get_conn()
+    empty = [(r[0], r[1]) for r in rows if r[2] is None and r[3] == "{}" and r[4] == "{}"]
+    keep = [r for r in rows if not (r[2] is None and r[3] == "{}" and r[4] == "{}")]
+    with conn:
+        if empty:
+            conn.executemany("DELETE FROM fsm_states WHERE chat_id=? AND user_id=?", empty)
+        if keep:
+            conn.executemany("""
+            INSERT INTO fsm_states(chat_id, user_id, state, data, bucket, updated_at) VALUES (?,?,?,?,?,?)
+            ON CONFLICT(chat_id, user_id) DO UPDATE SET state=excluded.state, data=excluded.data,
+                bucket=excluded.bucket, updated_at=excluded.updated_at
+            """, keep)
+
+@_writes
+def fsm_expire(before: int) -> int:
+    conn = get_conn()
+    with conn:
+        return conn.execute("DELETE FROM fsm_states WHERE updated_at<?", (before,)).rowcount
+
+
+#  Асинхронный доступ
+#
+# Хендлеры aiogram работают в одном event loop, а sqlite3 — блокирующий.
+# db.aio.<функция>(...) — тот же API, что и у модуля, но вызов уходит в отдельный
+# ограниченный пул потоков (у каждого потока своё соединение, см. get_conn).
+
+class _AsyncDB:
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self.queued = 0        # отправлено в пул, но ещё не начато
+        self.running = 0
+        self.completed = 0
+        self.max_queued = 0
+        self.observer: Optional[Callable[[str, float], None]] = None  # (имя функции, секунды) — для замеров
+
+    def configure(self, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        """Меняет размер пула/очереди (до первого запроса или после shutdown)."""
+        self.shutdown()
+        if workers is not None:
+            self.workers = workers
+        if max_queue is not None:
+            self.max_queue = max_queue
+
+    def shutdown(self, wait: bool = True):
+        pool, self._pool, self._slots = self._pool, None, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {"workers": self.workers, "queued": self.queued, "running": self.running,
+                    "completed": self.completed, "max_queued": self.max_queued}
+
+    def _call(self, fn, name, queued_at, args, kwargs):
+        with self._lock:
+            self.queued -= 1; self.running += 1
+        t0 = time.perf_counter()
+        metrics.DB_WAIT_SECONDS.observe(t0 - queued_at, name)
+        try:
+            result = fn(*args, **kwargs)
+            metrics.DB_ROWS.inc(name, value=metrics.rows_of(result))
+            return result
+        except Exception as e:
+            metrics.DB_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            metrics.DB_SECONDS.observe(time.perf_counter() - t0, name)
+            with self._lock:
+                self.running -= 1; self.completed += 1
+
+    async def run(self, fn, *args, name: Optional[str] = None, **kwargs):
+        """Выполнить произвольную функцию в пуле БД. name — метка в метриках; по умолчанию имя
+        функции (для чужих модулей — с модулем: similar.similar), у lambda его нужно задать."""
+        if name is None:
+            name = fn.__name__ if fn.__module__ == __name__ else f"{fn.__module__}.{fn.__name__}"
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="db")
+            self._slots = asyncio.Semaphore(self.workers + self.max_queue)
+        t0 = time.perf_counter()
+        try:
+            async with self._slots:  # если очередь переполнена — ждём здесь, а не копим задачи в пуле
+                with self._lock:
+                    self.queued += 1
+                    self.max_queued = max(self.max_queued, self.queued)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool, self._call, fn, name, t0, args, kwargs)
+        finally:
+            if self.observer is not None:  # время с точки зрения хендлера: очередь + выполнение
+                self.observer(name, time.perf_counter() - t0)
+
+    def __getattr__(self, name: str):
+        fn = globals().get(name)
+        if name.startswith("_") or not callable(fn) or isinstance(fn, type):
+            raise AttributeError(f"db.aio: нет функции {name}")
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await self.run(fn, *args, **kwargs)
+        setattr(self, name, wrapper)
+        return wrapper
+
+    async def get_recipe(self, recipe_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        # попадание в кэш отдаём сразу, не гоняя вызов через пул
+        r = cached_recipe(recipe_id, user_id)
+        return r if r is not None else await self.run(get_recipe, recipe_id, user_id)
+
+aio = _AsyncDB(DB_WORKERS, DB_MAX_QUEUE)
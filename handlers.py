@@ -1,12 +1,19 @@
 # handlers.py
-import json
 from aiogram import types, Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
+from aiogram.utils.exceptions import InvalidQueryID
 
 import db
-from keyboards import main_kb, cook_button, next_step_btn
-from helpers import fmt_card_short, chef_tip, plan_3_days
+from writer import events
+from keyboards import main_kb, cook_button, next_step_btn, pager_kb, shop_source_kb, shop_pager_kb, similar_button
+from helpers import chef_tip
+import inline
+import planner
+import shopping
+import similar
+from router import TextRouter, IntentReset
+from config import INLINE_CACHE_TIME_S
 
 # ===== FSM для добавления рецепта =====
 class AddRecipe(StatesGroup):
@@ -17,6 +24,7 @@ class AddRecipe(StatesGroup):
     tmin = State()
 
 def register_handlers(dp: Dispatcher):
+    router = TextRouter()
 
     # /start + /ping
     @dp.message_handler(commands=["start"])
@@ -28,46 +36,76 @@ def register_handlers(dp: Dispatcher):
         await m.answer("pong ✅")
 
     # --- Статистика
-    @dp.message_handler(lambda x: x.text == "📊 Статистика")
+    @router.button("📊 Статистика")
     async def stats_cmd(m: types.Message):
-        s = db.stats(m.from_user.id)
-        await m.answer(f"📊 <b>Статистика</b>\nОбщих рецептов: <b>{s['common']}</b>\n"
-                       f"Твоих рецептов: <b>{s['mine']}</b>\nЗапусков готовки: <b>{s['cooked']}</b>")
+        s = await db.aio.stats(m.from_user.id)
+        msg = [f"📊 <b>Статистика</b>\nОбщих рецептов: <b>{s['common']}</b>\n"
+               f"Твоих рецептов: <b>{s['mine']}</b>\nЗапусков готовки: <b>{s['cooked']}</b>\n"
+               f"Серия: <b>{s['streak']}</b> дн. подряд (рекорд: {s['best_streak']})"]
+        if s["top"]:
+            msg.append("\n<u>Чаще всего готовишь:</u>")
+            msg += [f"• #{t['recipe_id']} {t['title']} — {t['n']}×" for t in s["top"]]
+        if s["weeks"]:
+            msg.append("\n<u>Ккал по неделям:</u>")
+            msg += [f"• {w['week']}: {w['kcal']} ккал ({w['cooks']} блюд)" for w in s["weeks"]]
+        await m.answer("\n".join(msg))
 
-    # --- Все рецепты
-    @dp.message_handler(lambda x: x.text == "📖 Все рецепты")
-    async def list_all(m: types.Message):
-        rows = db.all_for_user(m.from_user.id)
+    # --- Все рецепты / Быстрое блюдо (<=15 мин): постранично
+    _PAGE_KINDS = {"all": False, "quick": True}
+
+    async def _list_page(user_id: int, kind: str, after=None, before=None):
+        quick_only = _PAGE_KINDS[kind]
+        rows, has_prev, has_next = await db.aio.list_page(user_id, quick_only, after=after, before=before)
         if not rows:
+            return None, None
+        if quick_only:
+            msg = [f"<b>До {db.QUICK_MAX_MIN} минут:</b>"] + [f"#{r['id']} — {r['title']} (⏱️ {r['cook_time_min']} мин)" for r in rows]
+        else:
+            msg = ["<b>Все доступные рецепты:</b>"] + [f"#{r['id']} — {r['title']} (⏱️ {r['cook_time_min']} мин, 🔥 {r['total_kcal']} ккал)" for r in rows]
+        kb = pager_kb(kind, db.page_key(rows[0], quick_only), db.page_key(rows[-1], quick_only), has_prev, has_next)
+        return "\n".join(msg), kb
+
+    @router.button("📖 Все рецепты", "/recipes")
+    async def list_all(m: types.Message):
+        text, kb = await _list_page(m.from_user.id, "all")
+        if not text:
             await m.answer("Пока пусто.")
             return
-        msg = ["<b>Все доступные рецепты:</b>"] + [f"#{r['id']} — {r['title']} (⏱️ {r['cook_time_min']} мин, 🔥 {r['total_kcal']} ккал)" for r in rows]
-        await m.answer("\n".join(msg))
+        await m.answer(text, reply_markup=kb)
 
-    # --- Быстрое блюдо (<=15 мин)
-    @dp.message_handler(lambda x: x.text == "⏱️ Быстрое блюдо")
+    @router.button("⏱️ Быстрое блюдо")
     async def quick(m: types.Message):
-        rows = db.all_for_user(m.from_user.id, quick_only=True)
-        if not rows:
+        text, kb = await _list_page(m.from_user.id, "quick")
+        if not text:
             await m.answer("Нет быстрых блюд.")
             return
-        msg = ["<b>До 15 минут:</b>"] + [f"#{r['id']} — {r['title']} (⏱️ {r['cook_time_min']} мин)" for r in rows]
-        await m.answer("\n".join(msg))
+        await m.answer(text, reply_markup=kb)
+
+    @dp.callback_query_handler(lambda c: c.data.startswith("page:"))
+    async def list_page(c: types.CallbackQuery):
+        _, kind, direction, key = c.data.split(":", 3)
+        if kind not in _PAGE_KINDS:
+            await c.answer(); return
+        if direction == "f":
+            text, kb = await _list_page(c.from_user.id, kind, after=key)
+        else:
+            text, kb = await _list_page(c.from_user.id, kind, before=key)
+        if text:
+            await c.message.edit_text(text, reply_markup=kb)
+        await c.answer()
 
     # --- Поиск
-    @dp.message_handler(lambda x: x.text == "🔍 Поиск рецептов")
+    @router.button("🔍 Поиск рецептов", intent="search")
     async def search_start(m: types.Message):
         await m.answer("Введи слово/фразу для поиска (название/ингредиенты):")
 
-    @dp.message_handler(lambda x: x.text and x.text not in {
-        "🔍 Поиск рецептов","➕ Добавить рецепт","👣 Учение рецептов","📖 Все рецепты",
-        "🗑️ Удалить рецепты","📊 Статистика","🎲 Случайный рецепт","🧠 Совет от шефа",
-        "🥗 Из ингредиентов?","⏱️ Быстрое блюдо","📅 Рацион на 3 дня","Похудение","Набор массы",
-        "⭐ Избранное","🧾 Список покупок"
-    }, content_types=types.ContentTypes.TEXT)
+    @router.intent("search")
     async def search_query(m: types.Message):
         q = m.text.strip()
-        rows = db.search(q, m.from_user.id)
+        if db.fts_query(q) is None:
+            await m.answer(f"Слишком короткий запрос — нужно слово хотя бы из {db.FTS_MIN_TERM} букв.")
+            return
+        rows = await db.aio.search(q, m.from_user.id)
         if not rows:
             await m.answer("Ничего не найдено 😕")
             return
@@ -75,70 +113,127 @@ def register_handlers(dp: Dispatcher):
         msg.append("\nОтправь номер рецепта, чтобы открыть карточку.")
         await m.answer("\n".join(msg))
 
+    # --- Inline-режим (@bot борщ): карточки прямо в результатах, см. inline.py
+    async def _answer_inline(q: types.InlineQuery, articles, personal: bool):
+        items, next_offset = inline.page(articles, q.offset)
+        try:
+            await q.answer(items, cache_time=INLINE_CACHE_TIME_S, is_personal=personal, next_offset=next_offset)
+        except InvalidQueryID:
+            pass  # ответ опоздал — пользователь уже ввёл другое или закрыл выбор
+
+    async def _search_inline(q: types.InlineQuery):
+        await _answer_inline(q, *await db.aio.run(inline.results, q.query, q.from_user.id))
+
+    @dp.inline_handler()
+    async def inline_search(q: types.InlineQuery):
+        uid = q.from_user.id
+        hit = inline.results(q.query, uid, fetch=False)
+        if hit is not None:   # кэш (и следующие страницы) — сразу
+            inline.supersede(uid)
+            await _answer_inline(q, *hit)
+        else:
+            inline.debounce(uid, q.id, lambda: _search_inline(q))
+
+    # --- Карточка: готовые страницы из db (render.py), кнопка — под последней
+    async def _send_card(m: types.Message, r):
+        pages = r["card_pages"]
+        for page in pages[:-1]:
+            await m.answer(page)
+        await m.answer(pages[-1], reply_markup=cook_button(r["id"]))
+
     # --- Показ карточки по номеру
-    @dp.message_handler(lambda x: x.text and x.text.isdigit())
+    @router.number
     async def show_by_id(m: types.Message):
         rid = int(m.text)
-        r = db.by_id(rid, m.from_user.id)
+        r = await db.aio.get_recipe(rid, m.from_user.id)
         if not r:
             await m.answer("Рецепт не найден.")
             return
-        await m.answer(fmt_card_short(r), reply_markup=cook_button(r["id"]))
+        await _send_card(m, r)
 
     # --- Случайный рецепт
-    @dp.message_handler(lambda x: x.text == "🎲 Случайный рецепт")
+    @router.button("🎲 Случайный рецепт", "/random")
     async def random_recipe(m: types.Message):
-        r = db.random_recipe(m.from_user.id)
+        r = await db.aio.random_recipe(m.from_user.id)
         if not r:
             await m.answer("Рецептов пока нет 🤷")
             return
-        await m.answer(fmt_card_short(r), reply_markup=cook_button(r["id"]))
+        await _send_card(m, r)
 
     # --- Пошаговая готовка (кнопка)
     @dp.callback_query_handler(lambda c: c.data.startswith("cook:"))
     async def cook_flow(c: types.CallbackQuery):
         _, rid, idx = c.data.split(":"); rid = int(rid); idx = int(idx)
-        r = db.by_id(rid, c.from_user.id)
+        r = await db.aio.get_recipe(rid, c.from_user.id)
         if not r:
             await c.answer("Рецепт не найден.", show_alert=True); return
-        steps = json.loads(r["steps_json"])
-        if idx >= len(steps):
-            db.log_cook(c.from_user.id, rid)
-            await c.message.reply("✅ Готово! Приятного аппетита 😋")
-            await c.answer(); return
-        text = f"<b>{r['title']}</b>\nШаг {idx+1}/{len(steps)}:\n\n{steps[idx]}"
-        await c.message.edit_text(text, reply_markup=next_step_btn(rid, idx+1))
+        if idx >= len(r["step_html"]):
+            await events.log_cook(c.from_user.id, rid)
+            if c.inline_message_id:  # карточка из inline-режима: чат чужой, отвечаем всплывающим окном
+                await c.answer("✅ Готово! Приятного аппетита 😋", show_alert=True)
+                await c.bot.edit_message_reply_markup(inline_message_id=c.inline_message_id); return
+            await c.answer()
+            await c.message.reply("✅ Готово! Приятного аппетита 😋", reply_markup=similar_button(rid)); return
+        # сначала снять «часики», правку — фоном: пока она ждёт лимита чата, следующее
+        # «Далее» заменит её в очереди отправки, а не встанет за ней (sender.ThrottledBot._edit)
+        await c.answer()
+        if c.inline_message_id:
+            c.bot.detach(c.bot.edit_message_text(r["step_html"][idx], inline_message_id=c.inline_message_id,
+                                                 reply_markup=next_step_btn(rid, idx+1)))
+        else:
+            c.bot.detach(c.message.edit_text(r["step_html"][idx], reply_markup=next_step_btn(rid, idx+1)))
+
+    # --- Похожие рецепты (готовые списки соседей, см. similar.py)
+    @dp.callback_query_handler(lambda c: c.data.startswith("sim:"))
+    async def similar_recipes(c: types.CallbackQuery):
+        rid = int(c.data.split(":")[1])
+        rows = await db.aio.run(similar.similar, rid, c.from_user.id)
+        if not rows:
+            await c.answer("Похожих рецептов не нашлось 🤷", show_alert=True); return
+        msg = ["<b>Похожие блюда:</b>"] + [
+            f"#{r['id']} — {r['title']} (⏱️ {r['cook_time_min']} мин, 🔥 {r['total_kcal']} ккал)" for r in rows]
+        msg.append("\nОтправь номер рецепта, чтобы открыть карточку.")
+        await c.message.answer("\n".join(msg))
         await c.answer()
 
     # --- Из ингредиентов
-    @dp.message_handler(lambda x: x.text == "🥗 Из ингредиентов?")
+    @router.button("🥗 Из ингредиентов?", intent="ingredients")
     async def ingred_start(m: types.Message):
         await m.answer("Введи список через запятую (например: курица, рис, помидор)")
 
-    @dp.message_handler(lambda x: "," in (x.text or ""))
+    @router.intent("ingredients")
     async def ingred_find(m: types.Message):
         words = [w.strip() for w in m.text.split(",") if w.strip()]
-        rows = db.by_ingredients(words, m.from_user.id)
+        rows = await db.aio.by_ingredients(words, m.from_user.id)
         if not rows:
             await m.answer("Ничего не подобрал 😕")
             return
-        msg = ["<b>Подходит:</b>"] + [f"#{r['id']} — {r['title']}" for r in rows]
+        msg = ["<b>Подходит:</b>"] + [
+            f"#{r['id']} — {r['title']} (есть {r['covered']} из {len(words)}, докупить: {r['missing']})"
+            for r in rows]
         await m.answer("\n".join(msg))
 
     # --- Совет от шефа
-    @dp.message_handler(lambda x: x.text == "🧠 Совет от шефа")
+    @router.button("🧠 Совет от шефа")
     async def tip(m: types.Message):
-        from helpers import chef_tip as tip_fn
-        await m.answer(tip_fn())
+        await m.answer(chef_tip())
 
     # --- Рацион на 3 дня
-    @dp.message_handler(lambda x: x.text == "📅 Рацион на 3 дня")
+    @router.button("📅 Рацион на 3 дня", intent="ration")
     async def ration_start(m: types.Message):
         await m.answer("Выбери цель: Похудение / Набор массы")
 
-    @dp.message_handler(lambda x: x.text in {"Похудение","Набор массы"})
+    @router.button("Похудение", "Набор массы")
     async def ration_goal(m: types.Message):
-        await m.answer(plan_3_days(m.text), parse_mode="HTML")
+        plan = await db.aio.run(planner.make_plan, m.text, m.from_user.id)
+        if not plan:
+            await m.answer("Рецептов пока нет 🤷")
+            return
+        await m.answer(planner.format_plan(plan), reply_markup=shop_source_kb(f"plan:{m.text}"))
+
+    @router.intent("ration")
+    async def ration_other(m: types.Message):
+        await m.answer("Нужно выбрать: Похудение / Набор массы")
 
     # --- Добавить рецепт (FSM)
     @dp.message_handler(lambda x: x.text == "➕ Добавить рецепт", state="*")
@@ -204,7 +299,7 @@ def register_handlers(dp: Dispatcher):
         try:
             tmin = int(m.text.strip())
             data = await state.get_data()
-            db.add_user_recipe(
+            await db.aio.add_user_recipe(
                 m.from_user.id, data["title"], data["desc"],
                 data["ings"], data["steps_list"], tmin
             )
@@ -212,36 +307,111 @@ def register_handlers(dp: Dispatcher):
             await m.answer("✅ Рецепт сохранён! Найти его можно через поиск или список.", reply_markup=main_kb())
         except Exception:
             await m.answer("Нужно целое число минут.")
+            return
+        await db.aio.run(similar.update_user, m.from_user.id)   # соседи нового рецепта — уже после ответа
 
     # --- Удалить рецепт (только свои)
-    @dp.message_handler(lambda x: x.text == "🗑️ Удалить рецепты")
+    @router.button("🗑️ Удалить рецепты", intent="delete")
     async def del_hint(m: types.Message):
         await m.answer("Отправь ID рецепта, который ты хочешь удалить (только свои).")
 
-    @dp.message_handler(lambda x: x.text and x.text.isdigit(), content_types=types.ContentTypes.TEXT)
+    @router.intent("delete")
     async def delete_by_id(m: types.Message):
+        if not m.text.strip().isdigit():
+            await m.answer("Нужен номер рецепта (только цифры).")
+            return
         rid = int(m.text)
-        ok = db.delete_user_recipe(rid, m.from_user.id)
+        ok = await db.aio.delete_user_recipe(rid, m.from_user.id)
         if ok:
             await m.answer("🗑️ Удалено.")
         else:
             await m.answer("Можно удалять только <b>свои</b> рецепты.")
 
     # --- Учение (подсказка)
-    @dp.message_handler(lambda x: x.text == "👣 Учение рецептов")
+    @router.button("👣 Учение рецептов")
     async def teach(m: types.Message):
         await m.answer("Открой рецепт по номеру и нажми «🍳 Хочу готовить» — начнётся пошаговая инструкция.")
 
 
-    @dp.message_handler(lambda x: x.text == "⭐ Избранное")
+    # --- Избранное
+    @dp.callback_query_handler(lambda c: c.data.startswith("fav:"))
+    async def fav_toggle(c: types.CallbackQuery):
+        added = await db.aio.toggle_favorite(c.from_user.id, int(c.data.split(":")[1]))
+        if added is None:
+            await c.answer("Рецепт не найден.", show_alert=True)
+        else:
+            await c.answer("⭐ Добавлено в избранное" if added else "Убрано из избранного")
+
+    @router.button("⭐ Избранное")
     async def fav(m: types.Message):
-        await m.answer("⭐ Избранное: пока простая заглушка. Можем подключить сохранение в БД по кнопке «В избранное».")
+        rows = await db.aio.favorites(m.from_user.id)
+        if not rows:
+            await m.answer("⭐ В избранном пусто. Открой рецепт и нажми «⭐ В избранное».")
+            return
+        msg = ["⭐ <b>Избранное:</b>"] + [f"#{r['id']} — {r['title']} (⏱️ {r['cook_time_min']} мин)" for r in rows]
+        msg.append("\nОтправь номер рецепта, чтобы открыть карточку.")
+        await m.answer("\n".join(msg), reply_markup=shop_source_kb("fav"))
+
+    # --- Список покупок: из избранного, из рациона или по номерам рецептов
+    async def _send_shop(m: types.Message, pages):
+        if not pages:
+            await m.answer("Не из чего собирать список 🤷 Нужны номера доступных рецептов.")
+            return
+        await m.answer(pages[0], reply_markup=shop_pager_kb(0, len(pages)))
 
-    @dp.message_handler(lambda x: x.text == "🧾 Список покупок")
+    @router.button("🧾 Список покупок", intent="shop")
     async def shop(m: types.Message):
-        await m.answer("🧾 Список покупок: скопируй ингредиенты сюда — я соберу список (можно доработать под кнопки и БД).")
+        await m.answer("🧾 Пришли номера рецептов через запятую (порции — через x: 12, 15x2) "
+                       "или собери список из избранного:", reply_markup=shop_source_kb("fav"))
+
+    @router.intent("shop")
+    async def shop_ids(m: types.Message):
+        portions = shopping.parse_ids(m.text)
+        pages = await db.aio.run(shopping.build, m.from_user.id, portions, "по номерам рецептов")
+        await _send_shop(m, pages)
+
+    @dp.callback_query_handler(lambda c: c.data.startswith("shop:"))
+    async def shop_from(c: types.CallbackQuery):
+        source = c.data.split(":", 1)[1]
+        uid = c.from_user.id
+        if source == "fav":
+            pages = await db.aio.run(lambda: shopping.build(uid, shopping.from_favorites(uid), "избранное"),
+                                      name="shopping.from_favorites")
+        elif source.startswith("plan:") and source[5:] in planner.GOALS:
+            goal = source[5:]
+            plan = await db.aio.run(planner.make_plan, goal, uid)
+            pages = plan and await db.aio.run(shopping.build, uid, shopping.from_plan(plan), f"рацион «{goal}»")
+        else:
+            await c.answer(); return
+        await _send_shop(c.message, pages)
+        await c.answer()
+
+    @dp.callback_query_handler(lambda c: c.data.startswith("shoppage:"))
+    async def shop_page(c: types.CallbackQuery):
+        n = int(c.data.split(":")[1])
+        pages = shopping.last(c.from_user.id)
+        if not pages or not 0 <= n < len(pages):
+            await c.answer("Список устарел — собери его заново.", show_alert=True); return
+        await c.message.edit_text(pages[n], reply_markup=shop_pager_kb(n, len(pages)))
+        await c.answer()
+
+    # --- Свободный текст без намерения: список через запятую — ингредиенты, иначе поиск
+    @router.text
+    async def free_text(m: types.Message):
+        if "," in m.text:
+            await ingred_find(m)
+        else:
+            await search_query(m)
+
+    # --- Все текстовые сообщения вне FSM — через роутер (в самом конце!)
+    @dp.message_handler(content_types=types.ContentTypes.TEXT)
+    async def route_text(m: types.Message):
+        if not await router.dispatch(m):
+            await fallback(m)
+
+    dp.middleware.setup(IntentReset(router, route_text))
 
-    # --- Фоллбэк (в самом конце!)
-    @dp.message_handler()
+    # --- Фоллбэк
+    @dp.message_handler(content_types=types.ContentTypes.ANY)
     async def fallback(m: types.Message):
-        await m.answer("Выбери действие на клавиатуре 👇", reply_markup=main_kb())
\ No newline at end of file
+        await m.answer("Выбери действие на клавиатуре 👇", reply_markup=main_kb())
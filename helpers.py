@@ -1,35 +1,10 @@
-import json, logging, os
+import json, logging, os, hashlib
 from typing import List, Dict, Any
 from aiogram import types
-from config import CUT_CAL_TARGET, BULK_CAL_TARGET, RECIPES_JSON_PATH
+from config import RECIPES_JSON_PATH
 import db
 
 
-"""  Форматирование ингредиентов и карточек  """
-
-def fmt_ingredients(ings: List[Dict[str, Any]]) -> str:
-    lines = ["<u>Ингредиенты (с граммовками и ккал):</u>"]
-    for i in ings:
-        name = i.get("name", "?")
-        grams = int(float(i.get("grams", 0)))
-        kcal = int(float(i.get("kcal", 0)))
-        lines.append(f"• {name} — {grams} г ({kcal} ккал)")
-    return "\n".join(lines)
-
-def fmt_card_short(row) -> str:
-    ings = json.loads(row["ingredients_json"])
-    return (f"<b>{row['title']}</b>\n"
-            f"{row['description']}\n\n"
-            f"⏱️ Время: <b>{row['cook_time_min']} мин</b>\n"
-            f"⚖️ Выход: <b>{row['total_grams']} г</b>\n"
-            f"🔥 Калории: <b>{row['total_kcal']} ккал</b>\n\n"
-            f"{fmt_ingredients(ings)}\n\n"
-            f"Нажми кнопку снизу, если хочешь готовить пошагово ⤵️")
-
-
-
-
-
 '''🧠 Советы шефа'''
 
 def chef_tip() -> str:
@@ -44,41 +19,36 @@ def chef_tip() -> str:
     return "🧠 Совет от шефа:\n" + random.choice(tips)
 
 
-''' План питания'''
-
-
-def plan_3_days(goal: str) -> str:
-    if goal == "Похудение":
-        target = CUT_CAL_TARGET
-        days = [
-            ["Овсяная каша с бананом 🍌", "Огуречный салат с йогуртом 🥒", "Курица с рисом 🍗🍚"],
-            ["Сырники классические 🧀", "Салат «Цезарь» 🥗", "Тушёная рыба с рисом 🐟🍚"],
-            ["Омлет с томатами 🍳", "Паста с томатами 🍝", "Греческий салат 🧀🥗"],
-        ]
-    else:
-        target = BULK_CAL_TARGET
-        days = [
-            ["Панкейки 🥞 + мёд", "Плов узбекский 🍚🥩", "Карбонара 🍝"],
-            ["Борщ украинский 🍲 + хлеб", "Котлеты с пюре 🥔", "Пицца «Маргарита» 🍕"],
-            ["Сырники 🧀 + сметана", "Паста болоньезе 🍝", "Курица с гречкой 🍗+🍚"],
-        ]
-    out = [f"📅 <b>Рацион на 3 дня — {goal}</b>\nЦель по калорийности: {target}\n"]
-    for d, m in enumerate(days, 1):
-        out.append(f"<u>День {d}</u>:\n• Завтрак: {m[0]}\n• Обед: {m[1]}\n• Ужин: {m[2]}")
-    return "\n".join(out)
+'''📦 Импорт рецептов из JSON'''
 
 
-'''📦 Импорт рецептов из JSON'''
+def _json_fingerprint(path: str) -> str:
+    st = os.stat(path)
+    return f"{st.st_mtime_ns}:{st.st_size}"
 
 
-def load_recipes_from_json(path: str = RECIPES_JSON_PATH) -> int:
-    """Импорт из JSON в базу (user_id = NULL). Возвращает число добавленных."""
+def load_recipes_from_json(path: str = RECIPES_JSON_PATH, force: bool = False) -> int:
+    """Инкрементальный импорт из JSON в базу (user_id = NULL).
+    Если файл не менялся (mtime/size, затем sha256 содержимого) — импорт пропускается целиком.
+    Иначе добавляются новые и обновляются изменённые рецепты. Возвращает число добавленных+обновлённых."""
     if not os.path.exists(path):
         logging.info(f"JSON не найден: {path}")
         return 0
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        key = f"json_fp:{os.path.abspath(path)}"
+        stamp = _json_fingerprint(path)
+        old_stamp, _, old_sha = (db.get_meta(key) or "").partition("|")
+        if not force and old_stamp == stamp:
+            logging.info("JSON не изменился — импорт пропущен")
+            return 0
+        with open(path, "rb") as f:
+            raw = f.read()
+        sha = hashlib.sha256(raw).hexdigest()
+        if not force and old_sha == sha:
+            db.set_meta(key, f"{stamp}|{sha}")
+            logging.info("JSON не изменился (тот же хэш) — импорт пропущен")
+            return 0
+        data = json.loads(raw.decode("utf-8"))
         items: List[Dict[str, Any]] = []
         for r in data:
             if not all(k in r for k in ("title", "description", "ingredients", "steps", "cook_time_min")):
@@ -90,10 +60,10 @@ def load_recipes_from_json(path: str = RECIPES_JSON_PATH) -> int:
                 "steps": r["steps"],
                 "cook_time_min": int(r["cook_time_min"])
             })
-        if items:
-            db.insert_many(items)
-        logging.info(f"Импортировано рецептов из JSON: {len(items)}")
-        return len(items)
+        added, updated = db.upsert_shared(items)
+        db.set_meta(key, f"{stamp}|{sha}")
+        logging.info(f"Импорт из JSON: {len(items)} в файле, добавлено {added}, обновлено {updated}")
+        return added + updated
     except Exception as e:
         logging.exception(f"Ошибка импорта JSON: {e}")
-        return 0
\ No newline at end of file
+        return 0
@@ -0,0 +1,120 @@
+# inline.py — поиск рецептов в inline-режиме (@bot борщ)
+#
+# Результат — статья с готовой карточкой рецепта и кнопкой «Хочу готовить»: выбор сразу
+# отправляет карточку в чат, без запросов к базе (рецепты заодно лежат в кэше db).
+# Статьи кэшируются по нормализованному запросу (db.fts_query: «Борщи» и «борщ» — один ключ):
+#   • общие рецепты — одна запись на запрос для всех пользователей, до изменения общей базы;
+#   • свои рецепты — отдельно на (пользователь, запрос), до изменения его рецептов;
+# в ответе свои идут первыми. Листание — offset/next_offset из answerInlineQuery, страница
+# режется из кэша. Дребезг: запрос, которого нет в кэше, выполняется через INLINE_DEBOUNCE_MS,
+# и только если пользователь за это время не допечатал следующий.
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram import types
+
+import db
+from cache import LRUCache
+from keyboards import cook_button
+from config import INLINE_PAGE, INLINE_MAX_RESULTS, INLINE_CACHE_ITEMS, INLINE_CACHE_TTL_S, INLINE_DEBOUNCE_MS
+
+logger = logging.getLogger("cooking-bot.inline")
+
+Articles = List[types.InlineQueryResultArticle]
+
+_shared = LRUCache(max_items=INLINE_CACHE_ITEMS, ttl=INLINE_CACHE_TTL_S)     # запрос -> (версия общей базы, статьи)
+_own = LRUCache(max_items=INLINE_CACHE_ITEMS, ttl=INLINE_CACHE_TTL_S)        # (user, запрос) -> (версия, статьи);
+                                                                             # user -> (версия, []) — своих рецептов нет
+_latest: Dict[int, str] = {}     # user_id -> id последнего отложенного запроса
+_tasks: Set[asyncio.Task] = set()
+_stats = {"cached": 0, "searched": 0, "debounced": 0}
+
+
+def metrics() -> Dict[str, int]:
+    return {**_stats, "shared_items": len(_shared), "own_items": len(_own), "waiting": len(_tasks)}
+
+
+def _article(r) -> types.InlineQueryResultArticle:
+    return types.InlineQueryResultArticle(
+        id=str(r["id"]), title=r["title"],
+        description=f"⏱️ {r['cook_time_min']} мин · 🔥 {r['total_kcal']} ккал",
+        input_message_content=types.InputTextMessageContent(r["card_pages"][0], parse_mode="HTML"),
+        reply_markup=cook_button(r["id"], similar=False))
+
+
+def _fresh(cache: LRUCache, key, version) -> Optional[Articles]:
+    hit = cache.get(key)
+    return hit[1] if hit is not None and hit[0] == version else None
+
+
+def results(text: str, user_id: int, fetch: bool = True) -> Optional[Tuple[Articles, bool]]:
+    """(статьи: свои, затем общие; есть ли среди них свои). fetch=False — только кэш, None — промах;
+    с fetch=True недостающее ищется в базе (вызывать в пуле db.aio)."""
+    q = db.fts_query(text)
+    if q is None:
+        return [], False
+    shared_v, own_v = db.recipes_version(user_id)
+    shared = _fresh(_shared, q, shared_v)
+    own = _fresh(_own, user_id, own_v)
+    if own is None:
+        own = _fresh(_own, (user_id, q), own_v)
+    if shared is None or own is None:
+        if not fetch:
+            return None
+        _stats["searched"] += 1
+        if shared is None:
+            shared = [_article(r) for r in db.search_recipes(text, None, INLINE_MAX_RESULTS)]
+            _shared.put(q, (shared_v, shared))
+        if own is None:
+            if db.has_own_recipes(user_id):
+                own = [_article(r) for r in db.search_recipes(text, user_id, INLINE_MAX_RESULTS)]
+                _own.put((user_id, q), (own_v, own))
+            else:   # у большинства своих рецептов нет — одна запись на пользователя, а не на запрос
+                own = []
+                _own.put(user_id, (own_v, own))
+    else:
+        _stats["cached"] += 1
+    return (own + shared)[:INLINE_MAX_RESULTS], bool(own)
+
+
+def page(articles: Articles, offset: str) -> Tuple[Articles, str]:
+    """Страница по offset из InlineQuery и next_offset для следующей ("" — больше нет)."""
+    start = int(offset) if offset.isdigit() else 0
+    end = start + INLINE_PAGE
+    return articles[start:end], str(end) if end < len(articles) else ""
+
+
+def supersede(user_id: int):
+    """Пришёл запрос, на который ответили сразу: отложенный запрос пользователя больше не нужен."""
+    if _latest.pop(user_id, None) is not None:
+        _stats["debounced"] += 1
+
+
+def debounce(user_id: int, query_id: str, run: Callable[[], Awaitable[None]]):
+    """Выполнить run() через INLINE_DEBOUNCE_MS отдельной задачей, если пользователь не прислал
+    запрос новее. Не ждём в хендлере: апдейты одного пользователя обрабатываются по очереди,
+    и следующий запрос просто не дошёл бы до хендлера, пока идёт пауза."""
+    if user_id in _latest:
+        _stats["debounced"] += 1
+    _latest[user_id] = query_id
+
+    async def later():
+        await asyncio.sleep(INLINE_DEBOUNCE_MS / 1000)
+        if _latest.get(user_id) != query_id:
+            return
+        del _latest[user_id]
+        try:
+            await run()
+        except Exception:
+            logger.exception(f"Ошибка inline-запроса {query_id}")
+
+    task = asyncio.get_running_loop().create_task(later())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def close():
+    """Дождаться отложенных ответов (на остановке)."""
+    if _tasks:
+        await asyncio.gather(*list(_tasks), return_exceptions=True)
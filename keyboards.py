@@ -13,12 +13,52 @@ def main_kb():
     kb.add(KeyboardButton("⭐ Избранное"), KeyboardButton("🧾 Список покупок"))
     return kb
 
-def cook_button(recipe_id: int):
+def cook_button(recipe_id: int, similar: bool = True):
+    """similar=False — для карточки из inline-режима: список похожих некуда прислать (чат чужой)."""
     kb = InlineKeyboardMarkup()
     kb.add(InlineKeyboardButton("🍳 Хочу готовить", callback_data=f"cook:{recipe_id}:0"))
+    row = [InlineKeyboardButton("⭐ В избранное", callback_data=f"fav:{recipe_id}")]
+    if similar:
+        row.append(InlineKeyboardButton("🔁 Похожие", callback_data=f"sim:{recipe_id}"))
+    kb.row(*row)
+    return kb
+
+def similar_button(recipe_id: int):
+    kb = InlineKeyboardMarkup()
+    kb.add(InlineKeyboardButton("🔁 Похожие блюда", callback_data=f"sim:{recipe_id}"))
     return kb
 
 def next_step_btn(recipe_id: int, step_idx: int):
     kb = InlineKeyboardMarkup()
     kb.add(InlineKeyboardButton("➡️ Далее", callback_data=f"cook:{recipe_id}:{step_idx}"))
-    return kb
\ No newline at end of file
+    return kb
+
+def pager_kb(kind: str, first_key: str, last_key: str, has_prev: bool, has_next: bool):
+    """Кнопки листания списка: callback_data = page:<kind>:<b|f>:<курсор>."""
+    kb = InlineKeyboardMarkup(row_width=2)
+    row = []
+    if has_prev:
+        row.append(InlineKeyboardButton("◀️", callback_data=f"page:{kind}:b:{first_key}"))
+    if has_next:
+        row.append(InlineKeyboardButton("▶️", callback_data=f"page:{kind}:f:{last_key}"))
+    if row:
+        kb.row(*row)
+    return kb
+
+def shop_source_kb(source: str):
+    """Кнопка «собрать список покупок» под избранным/рационом: callback_data = shop:<источник>."""
+    kb = InlineKeyboardMarkup()
+    kb.add(InlineKeyboardButton("🧾 Список покупок", callback_data=f"shop:{source}"))
+    return kb
+
+def shop_pager_kb(page: int, pages: int):
+    """Листание последнего списка покупок: callback_data = shoppage:<номер страницы>."""
+    kb = InlineKeyboardMarkup(row_width=2)
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀️", callback_data=f"shoppage:{page - 1}"))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton("▶️", callback_data=f"shoppage:{page + 1}"))
+    if row:
+        kb.row(*row)
+    return kb
@@ -0,0 +1,61 @@
+# manage.py — служебные команды для базы рецептов
+#
+#   python manage.py import [--force]   импорт recipes.json (инкрементально)
+#   python manage.py dedup              схлопнуть дубли общей базы + VACUUM
+#   python manage.py similar            пересобрать списки похожих рецептов
+import argparse
+import logging
+
+import db
+import similar
+from config import RECIPES_JSON_PATH
+from helpers import load_recipes_from_json
+
+
+def cmd_import(args):
+    n = load_recipes_from_json(args.path, force=args.force)
+    print(f"Добавлено/обновлено: {n}")
+    if n:
+        print(f"Похожие рецепты: {similar.build_all()} связей")
+
+
+def cmd_dedup(args):
+    removed = db.dedup_shared()
+    print(f"Удалено дублей: {removed}")
+    if removed and not args.no_vacuum:
+        db.vacuum()
+        print("VACUUM выполнен")
+    # после очистки сразу досинхронизируем содержимое с JSON
+    n = load_recipes_from_json(RECIPES_JSON_PATH)
+    print(f"Добавлено/обновлено из JSON: {n}")
+
+
+def cmd_similar(args):
+    print(f"Похожие рецепты: {similar.build_all()} связей")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+    p = argparse.ArgumentParser(description="Обслуживание базы рецептов")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("import", help="импорт рецептов из JSON")
+    sp.add_argument("--path", default=RECIPES_JSON_PATH)
+    sp.add_argument("--force", action="store_true", help="игнорировать отпечаток файла")
+    sp.set_defaults(func=cmd_import)
+
+    sp = sub.add_parser("dedup", help="удалить дубли общей базы (одноразовая миграция)")
+    sp.add_argument("--no-vacuum", action="store_true")
+    sp.set_defaults(func=cmd_dedup)
+
+
+    sp = sub.add_parser("similar", help="пересобрать соседей для «🔁 Похожие»")
+    sp.set_defaults(func=cmd_similar)
+
+    args = p.parse_args()
+    db.init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# metrics.py — метрики в формате Prometheus и выборочный профилировщик
+#
+# Без внешних зависимостей: счётчики и гистограммы с фиксированными корзинами
+# (observe — bisect и пара сложений под локом, можно держать включённым всегда).
+# Снимки состояния компонентов (пул БД, очередь записи, FSM, отправка, конвейер)
+# собираются в момент запроса /metrics из их metrics().
+#
+#   GET  /metrics          — текстовый формат Prometheus
+#   POST /profile/start    — включить профилировщик (?interval_ms=5)
+#   POST /profile/stop     — выключить и вернуть стеки в collapsed-формате (для flamegraph)
+#   GET  /profile?seconds=10 — профиль за N секунд одним запросом
+import asyncio
+import bisect
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as _Tally
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("cooking-bot.metrics")
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List["_Metric"] = []
+_collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, value: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {v:.17g}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple, list] = {}    # labels -> [счётчики корзин..., +Inf, сумма]
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    def time(self, *labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        out = self._header()
+        for k, row in items:
+            acc = 0
+            for le, n in zip(self.buckets + (float("inf"),), row):
+                acc += n
+                bound = 'le="+Inf"' if le == float("inf") else f'le="{le:g}"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, bound)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {row[-1]:.6f}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {acc}")
+        return out
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "t0")
+
+    def __init__(self, hist: Histogram, labels: Tuple):
+        self.hist, self.labels = hist, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, *self.labels)
+
+
+def register(prefix: str, collect: Callable[[], Dict[str, float]]):
+    """Снимок компонента как gauge'и: bot_<prefix>_<ключ>. Нечисловые значения пропускаются."""
+    _collectors[prefix] = collect
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _registry:
+        lines.extend(m.render())
+    for prefix, collect in list(_collectors.items()):
+        try:
+            snapshot = collect()
+        except Exception as e:
+            logger.warning(f"metrics collector {prefix}: {e}")
+            continue
+        for key, value in snapshot.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"bot_{prefix}_{key}"
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+#  Общие метрики горячего пути
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время хендлера", ["handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в хендлерах", ["handler", "error"])
+UPDATE_SECONDS = Histogram("bot_update_seconds", "Полная обработка апдейта (фильтры + хендлер)", ["kind"])
+DB_SECONDS = Histogram("bot_db_seconds", "Выполнение функции db.* в пуле", ["fn"])
+DB_WAIT_SECONDS = Histogram("bot_db_wait_seconds", "Ожидание свободного потока пула БД", ["fn"])
+DB_ROWS = Counter("bot_db_rows_total", "Строк/объектов возвращено функциями db.*", ["fn"])
+DB_ERRORS = Counter("bot_db_errors_total", "Исключения в функциях db.*", ["fn", "error"])
+DB_CONNECT_SECONDS = Histogram("bot_db_connect_seconds", "Открытие соединения SQLite")
+FSM_SECONDS = Histogram("bot_fsm_seconds", "Операции FSM-хранилища", ["op"])
+API_SECONDS = Histogram("bot_api_seconds", "Запросы к Bot API (без ожидания лимитов)", ["method"])
+API_WAIT_SECONDS = Histogram("bot_api_throttle_seconds", "Ожидание лимитов перед запросом к Bot API")
+API_ERRORS = Counter("bot_api_errors_total", "Ошибки запросов к Bot API", ["method", "error"])
+
+
+def rows_of(result) -> int:
+    """Сколько строк вернула функция db.*: длина списка, список в кортеже (list_page), 1 или 0."""
+    if result is None or isinstance(result, bool):
+        return 0
+    if isinstance(result, (list, tuple)):
+        if result and isinstance(result[0], list):
+            return len(result[0])
+        return len(result)
+    return 1
+
+
+#  Выборочный профилировщик
+
+class SamplingProfiler:
+    """Раз в interval снимает стеки всех потоков (sys._current_frames) и считает
+    одинаковые стеки. Цена — пропорциональна частоте, а не числу вызовов в программе."""
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: _Tally = _Tally()
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = 5.0):
+        if self.running:
+            return
+        self._stacks, self.samples = _Tally(), 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval_ms / 1000,),
+                                        name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self, interval: float):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(interval):
+            names = {t.ident: t.name for t in threading.enumerate()} if self.samples % 200 == 0 else names
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = ";".join(f"{f.name} ({f.filename.rsplit('/', 1)[-1]}:{f.lineno})"
+                                 for f in traceback.extract_stack(frame, limit=64))
+                self._stacks[f"{names.get(ident, ident)};{stack}"] += 1
+            self.samples += 1
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self._stacks.most_common())
+
+
+profiler = SamplingProfiler()
+
+
+#  HTTP
+
+async def serve(host: str, port: int):
+    """Поднять /metrics и /profile; возвращает AppRunner (остановка — runner.cleanup())."""
+    from aiohttp import web
+
+    async def get_metrics(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def profile_start(request):
+        profiler.start(float(request.query.get("interval_ms", 5)))
+        return web.Response(text="profiler started\n")
+
+    async def profile_stop(request):
+        return web.Response(text=profiler.stop())
+
+    async def profile_for(request):
+        if profiler.running:
+            return web.Response(status=409, text="profiler already running\n")
+        profiler.start(float(request.query.get("interval_ms", 5)))
+        await asyncio.sleep(min(float(request.query.get("seconds", 10)), 300))
+        return web.Response(text=profiler.stop())
+
+    app = web.Application()
+    app.router.add_get("/metrics", get_metrics)
+    app.router.add_post("/profile/start", profile_start)
+    app.router.add_post("/profile/stop", profile_stop)
+    app.router.add_get("/profile", profile_for)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики: http://{host}:{port}/metrics")
+    return runner
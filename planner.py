@@ -0,0 +1,154 @@
+# planner.py — рацион на N дней из рецептов базы
+#
+# Каждый приём пищи — порция реального рецепта, масштабированная по весу (total_grams)
+# так, чтобы день попал в диапазон ккал цели. Ограничения:
+#   • вес порции в PORTION_GRAMS, не больше всего блюда;
+#   • время готовки не больше лимита приёма пищи (завтрак — быстрый);
+#   • одно и то же блюдо (без «(вариант N)») не повторяется за весь план.
+# Массивы ккал/веса/времени общих рецептов грузятся один раз (numpy) и перечитываются,
+# только когда меняется общая база; личные рецепты добавляются к ним на лету.
+# Выбор — векторная оценка всех кандидатов на слот и argmin, поэтому план на 100k
+# рецептов строится за миллисекунды. Готовый план кэшируется на (цель, пользователь)
+# до изменения набора рецептов (db.recipes_version).
+import re
+import threading
+import zlib
+from html import escape
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import db
+from cache import LRUCache
+from config import (CUT_KCAL_RANGE, BULK_KCAL_RANGE, CUT_CAL_TARGET, BULK_CAL_TARGET,
+                    MEAL_SLOTS, PORTION_GRAMS, PLAN_DAYS)
+
+GOALS = {"Похудение": (CUT_KCAL_RANGE, CUT_CAL_TARGET), "Набор массы": (BULK_KCAL_RANGE, BULK_CAL_TARGET)}
+NATURAL_PORTION_G = 350      # к какому весу порции тянемся при выборе
+JITTER = 0.35                # доля случайности в оценке — чтобы планы разных людей различались
+
+_FAMILY_RE = re.compile(r"(\s*(\([^)]*\)|·.*))+\s*$")
+
+
+def family(title: str) -> str:
+    """«Борщ украинский (вариант 5)» → «борщ украинский»: варианты одного блюда — одна семья."""
+    return _FAMILY_RE.sub("", title).strip().lower()
+
+
+class _Arrays:
+    __slots__ = ("ids", "kcal", "grams", "tmin", "fam", "titles")
+
+    def __init__(self, rows: List[Tuple], families: Dict[str, int]):
+        self.ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        self.kcal = np.fromiter((r[1] for r in rows), dtype=np.float32, count=len(rows))
+        self.grams = np.fromiter((r[2] for r in rows), dtype=np.float32, count=len(rows))
+        self.tmin = np.fromiter((r[3] for r in rows), dtype=np.int32, count=len(rows))
+        self.fam = np.fromiter((families.setdefault(family(r[4]), len(families)) for r in rows),
+                               dtype=np.int32, count=len(rows))
+        self.titles = [r[4] for r in rows]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def extend(self, other: "_Arrays") -> "_Arrays":
+        out = _Arrays.__new__(_Arrays)
+        for name in ("ids", "kcal", "grams", "tmin", "fam"):
+            setattr(out, name, np.concatenate((getattr(self, name), getattr(other, name))))
+        out.titles = self.titles + other.titles
+        return out
+
+
+_lock = threading.Lock()
+_shared: Optional[Tuple[int, _Arrays, Dict[str, int]]] = None   # (версия общей базы, массивы, семьи)
+_plans = LRUCache(max_items=20_000)                               # (цель, user, дни) -> (версия, план)
+
+
+def _arrays(user_id: int, shared_version: int) -> _Arrays:
+    global _shared
+    with _lock:
+        if _shared is None or _shared[0] != shared_version:
+            families: Dict[str, int] = {}
+            _shared = (shared_version, _Arrays(db.plan_rows(), families), families)
+        _, shared, families = _shared
+    own = db.plan_rows(user_id)
+    if not own:
+        return shared
+    return shared.extend(_Arrays(own, dict(families)))
+
+
+def _pick(a: _Arrays, target: float, max_min: int, used: np.ndarray, rng: np.random.Generator,
+          strict: int) -> Optional[Tuple[int, float]]:
+    """Лучший рецепт на слот с target ккал: (индекс, граммы порции) или None.
+    strict: 2 — все ограничения, 1 — без времени готовки, 0 — только вес порции."""
+    density = a.kcal / np.maximum(a.grams, 1.0)               # ккал на грамм
+    portion = target / np.maximum(density, 1e-3)
+    ok = (portion >= PORTION_GRAMS[0]) & (portion <= np.minimum(PORTION_GRAMS[1], a.grams)) & (a.kcal > 0)
+    if strict >= 1:
+        ok &= ~used[a.fam]
+    if strict >= 2:
+        ok &= a.tmin <= max_min
+    if not ok.any():
+        return None
+    score = np.abs(np.log(portion / NATURAL_PORTION_G)) + JITTER * rng.random(len(a), dtype=np.float32)
+    score[~ok] = np.inf
+    i = int(np.argmin(score))
+    return i, float(portion[i])
+
+
+def make_plan(goal: str, user_id: int, days: int = PLAN_DAYS) -> Optional[Dict[str, Any]]:
+    """План {"goal", "range", "label", "days": [{"kcal", "meals": [...]}, ...]} или None, если рецептов нет."""
+    (lo, hi), label = GOALS[goal]
+    version = db.recipes_version(user_id)
+    key = (goal, user_id, days)
+    hit = _plans.get(key)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    a = _arrays(user_id, version[0])
+    if not len(a):
+        return None
+    rng = np.random.default_rng(zlib.crc32(f"{goal}:{user_id}:{version}".encode()))
+    used = np.zeros(int(a.fam.max()) + 1, dtype=bool)
+    plan_days = []
+    for _ in range(days):
+        day_target = float(rng.uniform(lo, hi))
+        eaten, meals = 0.0, []
+        for n, (meal, share, max_min) in enumerate(MEAL_SLOTS):
+            # последний приём добирает остаток — округления порций не выводят день из диапазона
+            target = day_target - eaten if n == len(MEAL_SLOTS) - 1 else day_target * share
+            pick = None
+            for strict in (2, 1, 0):
+                pick = _pick(a, target, max_min, used, rng, strict)
+                if pick is not None:
+                    break
+            if pick is None:
+                continue
+            i, grams = pick
+            grams = max(10, round(grams / 10) * 10)
+            kcal = round(float(a.kcal[i]) * grams / float(a.grams[i]))
+            used[a.fam[i]] = True
+            eaten += kcal
+            meals.append({"meal": meal, "id": int(a.ids[i]), "title": a.titles[i], "grams": grams, "kcal": kcal,
+                          "part": grams / float(a.grams[i])})
+        plan_days.append({"kcal": int(eaten), "meals": meals})
+    plan = {"goal": goal, "range": (lo, hi), "label": label, "days": plan_days}
+    _plans.put(key, (version, plan))
+    return plan
+
+
+def _days_word(n: int) -> str:
+    if n % 10 == 1 and n % 100 != 11:
+        return "день"
+    return "дня" if n % 10 in (2, 3, 4) and n % 100 not in (12, 13, 14) else "дней"
+
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    n = len(plan["days"])
+    out = [f"📅 <b>Рацион на {n} {_days_word(n)} — {plan['goal']}</b>\nЦель по калорийности: {plan['label']}\n"]
+    for d, day in enumerate(plan["days"], 1):
+        lines = [f"<u>День {d}</u> — {day['kcal']} ккал:"]
+        for m in day["meals"]:
+            lines.append(f"• {m['meal']}: {escape(m['title'], quote=False)} — {m['grams']} г, "
+                         f"{m['kcal']} ккал (#{m['id']})")
+        out.append("\n".join(lines))
+    out.append("Отправь номер рецепта, чтобы открыть карточку.")
+    return "\n\n".join(out)
@@ -0,0 +1,78 @@
+# render.py — готовый HTML карточек и шагов рецепта
+#
+# Чистое форматирование (без aiogram и БД): рецепт рендерится при первом чтении,
+# когда попадает в кэш рецептов db, и дальше карточка и шаги отдаются оттуда без
+# повторной сборки строк. В базе HTML не хранится — только сами рецепты.
+# Всё, что пришло от пользователя или из JSON, экранируется: parse_mode у бота — HTML.
+from html import escape
+from typing import Any, Dict, List
+
+MAX_MESSAGE = 4096  # лимит длины текста сообщения Telegram
+
+
+def _e(text: Any) -> str:
+    return escape(str(text), quote=False)
+
+
+def ingredients_html(ings: List[Dict[str, Any]]) -> str:
+    lines = ["<u>Ингредиенты (с граммовками и ккал):</u>"]
+    for i in ings:
+        grams = int(float(i.get("grams", 0)))
+        kcal = int(float(i.get("kcal", 0)))
+        lines.append(f"• {_e(i.get('name', '?'))} — {grams} г ({kcal} ккал)")
+    return "\n".join(lines)
+
+
+def card_html(r: Dict[str, Any]) -> str:
+    return (f"<b>{_e(r['title'])}</b>\n"
+            f"{_e(r['description'])}\n\n"
+            f"⏱️ Время: <b>{r['cook_time_min']} мин</b>\n"
+            f"⚖️ Выход: <b>{r['total_grams']} г</b>\n"
+            f"🔥 Калории: <b>{r['total_kcal']} ккал</b>\n\n"
+            f"{ingredients_html(r['ingredients'])}\n\n"
+            f"Нажми кнопку снизу, если хочешь готовить пошагово ⤵️")
+
+
+def _cut(text: str, limit: int) -> int:
+    """Где резать строку длиннее limit: по пробелу, иначе жёстко, но не внутри &entity;."""
+    pos = text.rfind(" ", 0, limit)
+    if pos > limit // 2:
+        return pos
+    amp = text.rfind("&", max(0, limit - 8), limit)
+    return amp if amp > 0 and ";" not in text[amp:limit] else limit
+
+
+def split_pages(text: str, limit: int = MAX_MESSAGE) -> List[str]:
+    """Делит текст на сообщения не длиннее limit по границам строк. Теги в карточке
+    не переносятся через строку, так что каждая страница остаётся валидным HTML."""
+    pages, cur = [], ""
+    for line in text.split("\n"):
+        while len(line) > limit:                 # одна строка сама не влезает
+            if cur:
+                pages.append(cur); cur = ""
+            n = _cut(line, limit)
+            pages.append(line[:n]); line = line[n:].lstrip(" ")
+        if not cur:
+            cur = line
+        elif len(cur) + 1 + len(line) <= limit:
+            cur += "\n" + line
+        else:
+            pages.append(cur); cur = line
+    if cur or not pages:
+        pages.append(cur)
+    return pages
+
+
+def step_html(r: Dict[str, Any], idx: int) -> str:
+    steps = r["steps"]
+    head = f"<b>{_e(r['title'])}</b>\nШаг {idx + 1}/{len(steps)}:\n\n"
+    body = _e(steps[idx])
+    if len(head) + len(body) > MAX_MESSAGE:     # шаг редактирует одно сообщение — только обрезаем
+        body = body[:_cut(body, MAX_MESSAGE - len(head) - 1)] + "…"
+    return head + body
+
+
+def render_recipe(r: Dict[str, Any]) -> Dict[str, List[str]]:
+    """{"pages": страницы карточки, "steps": текст каждого шага} для разобранного рецепта."""
+    return {"pages": split_pages(card_html(r)),
+            "steps": [step_html(r, i) for i in range(len(r["steps"]))]}
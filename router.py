@@ -0,0 +1,101 @@
+# router.py — маршрутизация текстовых сообщений одной проверкой словаря
+#
+# Вместо цепочки lambda-фильтров (aiogram проверяет их по очереди на каждом апдейте)
+# в Dispatcher регистрируется один текстовый хендлер, который:
+#   1) ищет текст среди кнопок (dict) — O(1) независимо от их числа;
+#   2) иначе смотрит «ожидаемое намерение» чата (поиск, ингредиенты, удаление…),
+#      выставленное предыдущей кнопкой;
+#   3) иначе — обработчик по умолчанию для чисел и для свободного текста.
+# Намерение живёт intent_ttl и сбрасывается любым сообщением, которое ушло мимо роутера
+# (команды, шаги FSM, «➕ Добавить рецепт»): иначе «1» после добавления рецепта попало бы
+# в давно начатое «🗑️ Удалить рецепты» — см. IntentReset.
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Optional
+
+from aiogram import types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from cache import LRUCache
+
+Handler = Callable[[types.Message], Awaitable[None]]
+
+# Имя хендлера, выбранного роутером для текущего апдейта (для замеров и метрик)
+current_route: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+
+
+class TextRouter:
+    def __init__(self, intent_ttl: float = 30 * 60, max_chats: int = 100_000):
+        self.buttons: Dict[str, Handler] = {}
+        self.intents: Dict[str, Handler] = {}
+        self.on_number: Optional[Handler] = None
+        self.on_text: Optional[Handler] = None
+        self._pending = LRUCache(max_items=max_chats, ttl=intent_ttl)
+
+    def button(self, *texts: str, intent: Optional[str] = None):
+        """Хендлер для точного текста кнопки. intent — какое намерение ждать после неё."""
+        def deco(fn: Handler) -> Handler:
+            async def run(m: types.Message):
+                if intent:
+                    self._pending.put(m.chat.id, intent)
+                await fn(m)
+            run.__name__ = fn.__name__
+            for t in texts:
+                self.buttons[t] = run
+            return fn
+        return deco
+
+    def intent(self, name: str):
+        """Хендлер для свободного текста, если чат ждёт намерение name."""
+        def deco(fn: Handler) -> Handler:
+            self.intents[name] = fn
+            return fn
+        return deco
+
+    def number(self, fn: Handler) -> Handler:
+        self.on_number = fn
+        return fn
+
+    def text(self, fn: Handler) -> Handler:
+        self.on_text = fn
+        return fn
+
+    def set_intent(self, chat_id: int, name: Optional[str]):
+        if name is None:
+            self._pending.pop(chat_id)
+        else:
+            self._pending.put(chat_id, name)
+
+    def resolve(self, m: types.Message) -> Optional[Handler]:
+        text = m.text or ""
+        handler = self.buttons.get(text)
+        if handler is not None:
+            self._pending.pop(m.chat.id)
+            return handler
+        intent = self._pending.pop(m.chat.id)  # намерение одноразовое
+        if intent is not None:
+            return self.intents.get(intent)
+        if text.strip().isdigit():
+            return self.on_number
+        return self.on_text
+
+    async def dispatch(self, m: types.Message) -> bool:
+        handler = self.resolve(m)
+        if handler is None:
+            return False
+        current_route.set(handler.__name__)
+        await handler(m)
+        return True
+
+
+class IntentReset(BaseMiddleware):
+    """Сбрасывает ожидаемое намерение чата, если сообщение обработал не entry — хендлер,
+    через который сообщения попадают в роутер (router.dispatch)."""
+
+    def __init__(self, router: TextRouter, entry: Handler):
+        super().__init__()
+        self.router, self.entry = router, entry
+
+    async def on_process_message(self, m: types.Message, data: dict):
+        if current_handler.get() is not self.entry:
+            self.router.set_intent(m.chat.id, None)
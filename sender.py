@@ -0,0 +1,189 @@
+# sender.py — исходящие запросы к Bot API с учётом лимитов Telegram
+#
+# ThrottledBot подменяет Bot.request, через который проходят все методы aiogram
+# (m.answer, edit_text, c.answer и т.д.), поэтому хендлеры менять не нужно:
+#   • token bucket на весь бот (~30 сообщений/с) и на каждый чат (1/с, в группах 20/мин);
+#   • 429 с retry_after: чат «замораживается» на указанное время, запрос повторяется;
+#   • editMessageText одного сообщения, ещё ждущий очереди, заменяется более новым
+#     (быстрые нажатия «Далее» в пошаговой готовке уходят одним запросом);
+#   • ответы на callback/inline-запросы идут вне очереди (не ждут общего лимита);
+#   • detach(): запрос уходит фоном, хендлер не ждёт лимита. Так правки по кнопкам
+#     и склеиваются: апдейты чата идут по очереди, и ждущий в хендлере edit не дал бы
+#     следующему нажатию даже начаться.
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter
+
+import metrics
+from cache import LRUCache
+from config import SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_GROUP_RATE, SEND_MAX_RETRIES
+
+logger = logging.getLogger("cooking-bot.sender")
+
+# Методы вне очереди: пользователь ждёт «часики» на кнопке
+PRIORITY_METHODS = {"answerCallbackQuery", "answerInlineQuery"}
+COALESCE_METHODS = {"editMessageText", "editMessageReplyMarkup"}
+
+
+class TokenBucket:
+    """Бакет с резервированием: reserve() сразу списывает токен и говорит, сколько ждать.
+    Порядок ожидающих — порядок вызовов, никаких очередей и таймеров."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def reserve(self, now: Optional[float] = None) -> float:
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        """Запретить отправку на seconds (ответ 429 retry_after)."""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class _PendingEdit:
+    __slots__ = ("data", "future", "sent")
+
+    def __init__(self, data: Dict, future: asyncio.Future):
+        self.data = data
+        self.future = future
+        self.sent = False
+
+
+class ThrottledBot(Bot):
+    def __init__(self, *args, global_rate: float = SEND_GLOBAL_RATE, chat_rate: float = SEND_CHAT_RATE,
+                 group_rate: float = SEND_GROUP_RATE, max_retries: int = SEND_MAX_RETRIES, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._global = TokenBucket(global_rate)  # ровный поток, без всплеска в начале секунды
+        self._chat_rate, self._group_rate = chat_rate, group_rate
+        self._chats = LRUCache(max_items=100_000)     # chat_id -> TokenBucket
+        self._edits: Dict[Tuple[Any, Any], _PendingEdit] = {}
+        self.max_retries = max_retries
+        self._detached: Set[asyncio.Task] = set()
+        self.stats = {"sent": 0, "retry_after": 0, "coalesced": 0, "priority": 0, "wait_s": 0.0}
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "wait_s": round(self.stats["wait_s"], 2), "chats": len(self._chats),
+                "pending_edits": len(self._edits), "detached": len(self._detached)}
+
+    def detach(self, request: Awaitable) -> asyncio.Task:
+        """Выполнить запрос фоном (правка сообщения из хендлера кнопки). Ошибки — в лог."""
+        task = asyncio.get_running_loop().create_task(self._quietly(request))
+        self._detached.add(task)
+        task.add_done_callback(self._detached.discard)
+        return task
+
+    @staticmethod
+    async def _quietly(request: Awaitable):
+        try:
+            await request
+        except Exception as e:
+            logger.warning(f"Фоновый запрос не выполнен: {type(e).__name__}: {e}")
+
+    async def drain(self):
+        """Дождаться запросов, отправленных через detach (на остановке)."""
+        if self._detached:
+            await asyncio.gather(*list(self._detached), return_exceptions=True)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            group = isinstance(chat_id, str) or int(chat_id) < 0
+            rate = self._group_rate if group else self._chat_rate
+            bucket = TokenBucket(rate)
+            self._chats.put(chat_id, bucket)
+        return bucket
+
+    async def _acquire(self, method: str, chat_id):
+        if method in PRIORITY_METHODS:
+            self._global.reserve()  # токен тратится, но вперёд не ждём
+            self.stats["priority"] += 1
+            return
+        t0 = time.perf_counter()
+        wait = self._chat_bucket(chat_id).reserve() if chat_id is not None else 0.0
+        if wait:
+            self.stats["wait_s"] += wait
+            await asyncio.sleep(wait)
+        wait = self._global.reserve()
+        if wait:
+            self.stats["wait_s"] += wait
+            await asyncio.sleep(wait)
+        metrics.API_WAIT_SECONDS.observe(time.perf_counter() - t0)
+
+    async def _send(self, method: str, data: Optional[Dict], files, chat_id, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            t0 = time.perf_counter()
+            try:
+                result = await super().request(method, data, files, **kwargs)
+                self.stats["sent"] += 1
+                return result
+            except RetryAfter as e:
+                metrics.API_ERRORS.inc(method, "RetryAfter")
+                self.stats["retry_after"] += 1
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"429 на {method} (chat {chat_id}): ждём {e.timeout} с")
+                if method in PRIORITY_METHODS:
+                    # ответ на кнопку/inline ждёт сам: _acquire его не задержит, а общий
+                    # бакет из-за него замораживать нельзя — встанут все остальные отправки
+                    await asyncio.sleep(e.timeout)
+                elif chat_id is not None:
+                    self._chat_bucket(chat_id).pause(e.timeout)
+                    await self._acquire(method, chat_id)
+                else:
+                    self._global.pause(e.timeout)
+                    await asyncio.sleep(e.timeout)
+            except Exception as e:
+                metrics.API_ERRORS.inc(method, type(e).__name__)
+                raise
+            finally:
+                metrics.API_SECONDS.observe(time.perf_counter() - t0, method)
+
+    async def request(self, method: str, data: Optional[Dict] = None, files: Optional[Dict] = None, **kwargs):
+        chat_id = (data or {}).get("chat_id")
+        if chat_id is None and method not in PRIORITY_METHODS:
+            return await self._send(method, data, files, None, **kwargs)  # getUpdates, getMe, ...
+        if method in COALESCE_METHODS and chat_id is not None and not files:
+            return await self._edit(method, data, chat_id, **kwargs)
+        await self._acquire(method, chat_id)
+        return await self._send(method, data, files, chat_id, **kwargs)
+
+    async def _edit(self, method: str, data: Dict, chat_id, **kwargs):
+        key = (method, chat_id, data.get("message_id"))
+        entry = self._edits.get(key)
+        if entry is not None and not entry.sent:
+            entry.data = data                 # ещё не отправлен — просто подменяем содержимое
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(entry.future)
+        entry = _PendingEdit(data, asyncio.get_running_loop().create_future())
+        self._edits[key] = entry
+        try:
+            await self._acquire(method, chat_id)
+            entry.sent = True
+            result = await self._send(method, entry.data, None, chat_id, **kwargs)
+            entry.future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            entry.future.cancel()
+            raise
+        except Exception as e:
+            if not entry.future.done():
+                entry.future.set_exception(e)
+                entry.future.exception()  # помечаем как полученное, если ждущих нет
+            raise
+        finally:
+            if self._edits.get(key) is entry:
+                del self._edits[key]
@@ -0,0 +1,77 @@
+# shopping.py — сводный список покупок
+#
+# Источники: избранное, рацион из planner.py или произвольные номера рецептов («12, 15x2»).
+# Любой источник сводится к {recipe_id: доля рецепта}, а дальше — один запрос
+# db.shopping_list, который складывает ингредиенты по каноническому имени.
+# Последний собранный список пользователя хранится (LRU + TTL) уже разбитым на страницы:
+# листание — это только выбор страницы, без повторного запроса к базе.
+import re
+from html import escape
+from typing import Any, Dict, List, Optional
+
+import db
+from cache import LRUCache
+from config import SHOP_PAGE_LINES, SHOP_TTL_S
+
+_last = LRUCache(max_items=50_000, ttl=SHOP_TTL_S)   # user_id -> собранный список
+
+_ID_RE = re.compile(r"#?(\d+)(?:\s*[xх×*]\s*(\d+(?:[.,]\d+)?))?", re.IGNORECASE)
+
+
+def parse_ids(text: str) -> Dict[int, float]:
+    """«12, #15 x2, 20×0.5» → {12: 1.0, 15: 2.0, 20: 0.5}; повторы складываются."""
+    portions: Dict[int, float] = {}
+    for m in _ID_RE.finditer(text):
+        k = float(m.group(2).replace(",", ".")) if m.group(2) else 1.0
+        rid = int(m.group(1))
+        portions[rid] = portions.get(rid, 0.0) + k
+    return portions
+
+
+def from_favorites(user_id: int) -> Dict[int, float]:
+    return {r["id"]: 1.0 for r in db.favorites(user_id)}
+
+
+def from_plan(plan: Dict[str, Any]) -> Dict[int, float]:
+    """Доли рецептов рациона: порция в граммах / выход рецепта, по всем дням."""
+    portions: Dict[int, float] = {}
+    for day in plan["days"]:
+        for meal in day["meals"]:
+            portions[meal["id"]] = portions.get(meal["id"], 0.0) + meal["part"]
+    return portions
+
+
+def _amount(grams: float) -> str:
+    if grams >= 1000:
+        return f"{grams / 1000:.1f}".replace(".", ",") + " кг"
+    return f"{max(1, round(grams))} г"
+
+
+def _pages(title: str, found: int, rows) -> List[str]:
+    total = round(sum(r["kcal"] for r in rows))
+    lines = []
+    for r in rows:
+        name = r["name"][:1].upper() + r["name"][1:]
+        more = f" <i>(в {r['recipes']} рец.)</i>" if r["recipes"] > 1 else ""
+        lines.append(f"• {escape(name, quote=False)} — {_amount(r['grams'])}{more}")
+    chunks = [lines[i:i + SHOP_PAGE_LINES] for i in range(0, len(lines), SHOP_PAGE_LINES)]
+    head = (f"🧾 <b>Список покупок</b> — {escape(title, quote=False)}\n"
+            f"Рецептов: {found} · позиций: {len(rows)} · ≈ {total} ккал")
+    if len(chunks) == 1:
+        return [head + "\n\n" + "\n".join(chunks[0])]
+    return [f"{head}\nСтр. {n}/{len(chunks)}\n\n" + "\n".join(c) for n, c in enumerate(chunks, 1)]
+
+
+def build(user_id: int, portions: Dict[int, float], title: str) -> Optional[List[str]]:
+    """Собрать список и запомнить его как последний; страницы или None, если собирать не из чего."""
+    rows, found = db.shopping_list(user_id, portions)
+    if not rows:
+        return None
+    pages = _pages(title, found, rows)
+    _last.put(user_id, pages)
+    return pages
+
+
+def last(user_id: int) -> Optional[List[str]]:
+    """Страницы последнего собранного списка (None — истёк или не собирался)."""
+    return _last.get(user_id)
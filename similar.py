@@ -0,0 +1,236 @@
+# similar.py — «похожие рецепты» по составу
+#
+# Рецепт — вектор признаков: ингредиенты (√доли по весу × idf — соль и лук не делают
+# похожим всё на всё) и калорийность на 100 г одной «корзиной». Ингредиентов-признаков
+# не больше SIMILAR_MAX_FEATURES (самые частые), матрица — float32, строки нормированы,
+# так что косинусное сходство — просто скалярное произведение.
+#
+# Построение (manage.py similar) — блоками: блок запросов × вся матрица, блок сходств
+# не больше SIMILAR_BLOCK_MB. Столбцы упорядочены по семье блюда (planner.family),
+# np.maximum.reduceat даёт лучшее сходство с каждой семьёй; берём top-k семей и из каждой
+# лучший рецепт. Варианты одного блюда («(вариант N)») друг другу не соседи и в списке
+# не повторяются. Готовые списки лежат в таблице similar: запрос — k строк по ключу.
+# Общие рецепты соседствуют только с общими; у личных — общие и свои рецепты автора
+# (пересчитываются после add_user_recipe, update_user).
+#
+# Матрица плотная: в строке ~10 ненулевых из сотен признаков, но блок сходств всё равно
+# плотный, а умножение блока на плотную матрицу — один вызов BLAS (scipy ради CSR не тянем).
+# Цена — одна копия на процесс: до ~200 МБ на 100k рецептов при потолке признаков. Общие
+# рецепты кодируются сразу в порядке семей, поэтому индекс держит ту же матрицу без
+# перестановки. Модель строится фоном при старте (warm), а не в первом «Похожие».
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from itertools import groupby
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import db
+from config import SIMILAR_TOP_K, SIMILAR_MAX_FEATURES, SIMILAR_BLOCK_MB, SIMILAR_MIN_SCORE
+from planner import family
+
+logger = logging.getLogger("cooking-bot.similar")
+
+KCAL_EDGES = np.array([60, 120, 180, 250, 350], dtype=np.float32)   # границы корзин, ккал на 100 г
+KCAL_WEIGHT = 0.35                                                  # вес корзины против состава (норма 1)
+
+
+class _Vocab:
+    """Словарь признаков и idf — по общей базе; личные рецепты кодируются им же."""
+
+    def __init__(self, groups: List[tuple]):
+        df = Counter(name for g in groups for name in set(g[2]))
+        top = [name for name, _ in df.most_common(SIMILAR_MAX_FEATURES)]
+        self.index = {name: j for j, name in enumerate(top)}
+        n = len(groups)
+        self.idf = np.array([math.log((1 + n) / (1 + df[name])) + 1 for name in top], dtype=np.float32)
+        self.families: Dict[str, int] = {}
+
+    @property
+    def width(self) -> int:
+        return len(self.index) + len(KCAL_EDGES) + 1
+
+
+def _groups(rows) -> List[tuple]:
+    """Строки db.feature_rows → [(id, title, [имена], [граммы], [ккал])] по рецептам."""
+    out = []
+    for rid, items in groupby(rows, key=lambda r: r[0]):
+        items = list(items)
+        out.append((rid, items[0][1], [r[2] for r in items], [r[3] for r in items], [r[4] for r in items]))
+    return out
+
+
+class _Matrix:
+    __slots__ = ("ids", "fam", "x")
+
+    def __init__(self, ids: np.ndarray, fam: np.ndarray, x: np.ndarray):
+        self.ids, self.fam, self.x = ids, fam, x
+
+    @classmethod
+    def encode(cls, groups: List[tuple], vocab: _Vocab) -> "_Matrix":
+        n, nv = len(groups), len(vocab.index)
+        x = np.zeros((n, vocab.width), dtype=np.float32)
+        rows, cols, vals = [], [], []
+        density = np.zeros(n, dtype=np.float32)
+        for i, (_, _, names, grams, kcal) in enumerate(groups):
+            total = sum(grams) or 1.0
+            density[i] = 100.0 * sum(kcal) / total
+            for name, g in zip(names, grams):
+                j = vocab.index.get(name)
+                if j is not None and g > 0:
+                    rows.append(i); cols.append(j); vals.append(math.sqrt(g / total))
+        if rows:
+            cols_a = np.array(cols, dtype=np.int64)
+            np.add.at(x, (np.array(rows, dtype=np.int64), cols_a), np.array(vals, dtype=np.float32) * vocab.idf[cols_a])
+        x[:, :nv] /= np.maximum(np.linalg.norm(x[:, :nv], axis=1, keepdims=True), 1e-6)
+        x[np.arange(n), nv + np.searchsorted(KCAL_EDGES, density)] = KCAL_WEIGHT
+        x /= np.linalg.norm(x, axis=1, keepdims=True)
+        ids = np.fromiter((g[0] for g in groups), dtype=np.int64, count=n)
+        fam = np.fromiter((vocab.families.setdefault(family(g[1]), len(vocab.families)) for g in groups),
+                          dtype=np.int64, count=n)
+        return cls(ids, fam, x)
+
+
+class _Index:
+    """Кандидаты, упорядоченные по семье: сегменты [starts[s], ends[s]) — одна семья.
+    Если строки m уже идут по семьям, матрица не копируется."""
+
+    def __init__(self, m: _Matrix):
+        if len(m.fam) > 1 and np.any(m.fam[1:] < m.fam[:-1]):
+            order = np.argsort(m.fam, kind="stable")
+            m = _Matrix(m.ids[order], m.fam[order], m.x[order])
+        self.ids, self.fam, self.x = m.ids, m.fam, m.x
+        self.by_id = np.argsort(self.ids)
+        fam = self.fam
+        self.starts = np.flatnonzero(np.r_[True, fam[1:] != fam[:-1]]) if len(fam) else np.zeros(0, np.int64)
+        self.ends = np.r_[self.starts[1:], len(fam)]
+        self.seg_of_fam = np.full(int(fam.max()) + 1 if len(fam) else 1, -1, dtype=np.int64)
+        self.seg_of_fam[fam[self.starts]] = np.arange(len(self.starts))
+        self.seg_fam = fam[self.starts]
+
+    def find(self, recipe_id: int) -> int:
+        """Строка рецепта в индексе или -1."""
+        i = int(np.searchsorted(self.ids, recipe_id, sorter=self.by_id))
+        if i < len(self.ids) and self.ids[self.by_id[i]] == recipe_id:
+            return int(self.by_id[i])
+        return -1
+
+    def neighbours(self, xq: np.ndarray, famq: np.ndarray, k: int = SIMILAR_TOP_K) -> List[List[Tuple[int, float, int]]]:
+        """Для каждой строки xq — до k (id, сходство, семья) из разных семей, кроме своей."""
+        nseg = len(self.starts)
+        if not nseg:
+            return [[] for _ in range(len(xq))]
+        kk = min(k, nseg)
+        block = max(1, SIMILAR_BLOCK_MB * 1024 * 1024 // (4 * len(self.ids)))
+        out: List[List[Tuple[int, float, int]]] = []
+        for b0 in range(0, len(xq), block):
+            s = xq[b0:b0 + block] @ self.x.T                       # (блок, кандидаты)
+            fmax = np.maximum.reduceat(s, self.starts, axis=1)     # (блок, семьи)
+            own = self.seg_of_fam[np.minimum(famq[b0:b0 + block], len(self.seg_of_fam) - 1)]
+            own[famq[b0:b0 + block] >= len(self.seg_of_fam)] = -1
+            rows = np.flatnonzero(own >= 0)
+            fmax[rows, own[rows]] = -np.inf
+            top = np.argpartition(-fmax, kk - 1, axis=1)[:, :kk] if kk < nseg else np.tile(np.arange(nseg), (len(s), 1))
+            for r in range(len(s)):
+                picked = []
+                for seg in sorted(top[r], key=lambda f: -fmax[r, f]):
+                    score = float(fmax[r, seg])
+                    if score < SIMILAR_MIN_SCORE:
+                        break
+                    a, b = self.starts[seg], self.ends[seg]
+                    picked.append((int(self.ids[a + int(np.argmax(s[r, a:b]))]), score, int(self.seg_fam[seg])))
+                out.append(picked)
+        return out
+
+
+_lock = threading.Lock()
+_shared: Optional[Tuple[int, _Vocab, _Index]] = None   # (версия общей базы, словарь, индекс)
+
+
+def _model() -> Tuple[_Vocab, _Index]:
+    global _shared
+    version = db.recipes_version(0)[0]
+    with _lock:
+        if _shared is None or _shared[0] != version:
+            _shared = None       # старая матрица не должна жить рядом с новой
+            groups = _groups(db.feature_rows())
+            groups.sort(key=lambda g: family(g[1]))   # номера семей — по порядку появления, т. е. по возрастанию
+            vocab = _Vocab(groups)
+            _shared = (version, vocab, _Index(_Matrix.encode(groups, vocab)))
+        return _shared[1:]
+
+
+def warm() -> threading.Thread:
+    """Построить модель в фоновом потоке (при старте бота), чтобы первый «Похожие» не ждал её."""
+    def run():
+        t0 = time.perf_counter()
+        try:
+            _, index = _model()
+        except Exception:
+            logger.exception("Не удалось построить модель похожих рецептов")
+            return
+        logger.info(f"Модель похожих рецептов: {len(index.ids)} рецептов, "
+                    f"{index.x.nbytes / 2**20:.0f} МБ, {time.perf_counter() - t0:.1f} с")
+    thread = threading.Thread(target=run, name="similar-warm", daemon=True)
+    thread.start()
+    return thread
+
+
+def _rows(ids, lists) -> List[Tuple[int, int, int, float]]:
+    return [(int(rid), rank, sid, score) for rid, picked in zip(ids, lists) for rank, (sid, score, _) in enumerate(picked)]
+
+
+def _merge(a: List[Tuple[int, float, int]], b: List[Tuple[int, float, int]], k: int = SIMILAR_TOP_K):
+    """Два списка neighbours() по разным кандидатам → top-k семей объединения. Семья, не попавшая
+    в top-k своего списка, не попадёт и в общий: k семей того списка сильнее её."""
+    best: Dict[int, Tuple[int, float, int]] = {}
+    for n in a + b:
+        if n[2] not in best or n[1] > best[n[2]][1]:
+            best[n[2]] = n
+    return sorted(best.values(), key=lambda n: -n[1])[:k]
+
+
+def build_all() -> int:
+    """Полная перестройка: соседи всех общих рецептов и личных рецептов всех авторов. Возвращает число строк."""
+    vocab, index = _model()
+    rows = _rows(index.ids, index.neighbours(index.x, index.fam))
+    db.save_similar([], rows, replace_all=True)
+    return len(rows) + sum(update_user(uid) for uid in db.users_with_recipes())
+
+
+def update_user(user_id: int) -> int:
+    """Пересчитать соседей личных рецептов автора (после добавления рецепта)."""
+    vocab, index = _model()
+    groups = _groups(db.feature_rows(user_id))
+    if not groups:
+        return 0
+    with _lock:  # словарь семей общий: личные семьи дописываются в него
+        own = _Matrix.encode(groups, vocab)
+    # общий индекс не пересобираем: общие и свои кандидаты — отдельно, списки сливаются
+    lists = map(_merge, index.neighbours(own.x, own.fam), _Index(own).neighbours(own.x, own.fam))
+    rows = _rows(own.ids, lists)
+    db.save_similar([int(i) for i in own.ids], rows)
+    return len(rows)
+
+
+def similar(recipe_id: int, user_id: int) -> List:
+    """Похожие рецепты: готовый список из таблицы, а если его нет (новый или изменённый рецепт) —
+    посчитать для одного рецепта и сохранить."""
+    rows = db.similar_to(recipe_id, user_id)
+    if rows:
+        return rows
+    exists, owner = db.recipe_owner(recipe_id)
+    if not exists or (owner is not None and owner != user_id):
+        return []
+    if owner is not None:
+        update_user(owner)
+    else:
+        vocab, index = _model()
+        i = index.find(recipe_id)
+        if i < 0:
+            return []
+        db.save_similar([recipe_id], _rows([recipe_id], index.neighbours(index.x[i:i + 1], index.fam[i:i + 1])))
+    return db.similar_to(recipe_id, user_id)
@@ -0,0 +1,183 @@
+# storage.py — хранилище состояний FSM поверх recipes.db
+#
+# Замена MemoryStorage: черновики AddRecipe переживают рестарт, а память не растёт
+# от брошенных сценариев.
+#   • горячий слой — LRU с лимитом по числу записей и байтам (FSM_CACHE_ITEMS / FSM_CACHE_MB);
+#   • изменения копятся в _dirty и пишутся одной транзакцией раз в FSM_FLUSH_MS:
+#     серия add_ings — одна запись на интервал, а не перезапись черновика на каждое сообщение;
+#   • TTL: состояние, не менявшееся FSM_TTL_S, не читается и удаляется из базы (fsm_expire);
+#   • на close() несохранённое дописывается.
+import asyncio
+import copy
+import functools
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.dispatcher.storage import BaseStorage
+
+import db
+import metrics
+from cache import LRUCache
+from config import FSM_TTL_S, FSM_CACHE_ITEMS, FSM_CACHE_MB, FSM_FLUSH_MS, FSM_SWEEP_S
+
+logger = logging.getLogger("cooking-bot.storage")
+
+Key = Tuple[Any, Any]
+
+
+def _timed(fn):
+    """Время операции хранилища в metrics.FSM_SECONDS{op=<имя метода>}."""
+    op = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with metrics.FSM_SECONDS.time(op):
+            return await fn(*args, **kwargs)
+    return wrapper
+
+
+def _empty() -> Dict[str, Any]:
+    return {"state": None, "data": {}, "bucket": {}, "ts": 0}
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, ttl: float = FSM_TTL_S, max_items: int = FSM_CACHE_ITEMS, max_mb: int = FSM_CACHE_MB,
+                 flush_ms: int = FSM_FLUSH_MS, sweep_s: float = FSM_SWEEP_S):
+        self.ttl = ttl
+        self.flush_s = flush_ms / 1000
+        self.sweep_s = sweep_s
+        self._hot = LRUCache(max_items=max_items, max_bytes=max_mb * 1024 * 1024, ttl=ttl)
+        self._dirty: Dict[Key, Dict[str, Any]] = {}   # не записанные в базу (из LRU не вытесняются)
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._next_sweep = 0.0
+        self.loads = 0
+        self.writes = 0
+        self.flushes = 0
+        self.expired = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self._hot.stats(), "dirty": len(self._dirty), "loads": self.loads,
+                "writes": self.writes, "flushes": self.flushes, "expired": self.expired}
+
+    def _key(self, chat, user) -> Key:
+        return tuple(self.check_address(chat=chat, user=user))
+
+    async def _record(self, key: Key) -> Dict[str, Any]:
+        rec = self._dirty.get(key) or self._hot.get(key)
+        if rec is not None:
+            return rec
+        self.loads += 1
+        with metrics.FSM_SECONDS.time("load"):
+            row = await db.aio.fsm_load(*key, int(time.time() - self.ttl))
+        rec = self._dirty.get(key) or self._hot.get(key)  # пока читали, запись могла появиться
+        if rec is None:
+            rec = _empty()
+            if row is not None:
+                rec.update(state=row["state"], data=json.loads(row["data"]), bucket=json.loads(row["bucket"]))
+            self._hot.put(key, rec)
+        return rec
+
+    def _touch(self, key: Key, rec: Dict[str, Any]):
+        rec["ts"] = int(time.time())
+        self._hot.put(key, rec)      # заново: пересчёт размера и срока жизни
+        self._dirty[key] = rec
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    #  Фоновая запись
+
+    async def _run(self):
+        while not self._closed:
+            await asyncio.sleep(self.flush_s)
+            await self.flush()
+            if time.monotonic() >= self._next_sweep:
+                self._next_sweep = time.monotonic() + self.sweep_s
+                try:
+                    self.expired += await db.aio.fsm_expire(int(time.time() - self.ttl))
+                except Exception:
+                    logger.exception("Не удалось удалить просроченные состояния")
+
+    @_timed
+    async def flush(self):
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        # снимок сериализуем здесь, в event loop: хендлеры не успеют поменять его посреди записи
+        rows = [(k[0], k[1], r["state"], json.dumps(r["data"], ensure_ascii=False),
+                 json.dumps(r["bucket"], ensure_ascii=False), r["ts"]) for k, r in batch.items()]
+        try:
+            await db.aio.fsm_save(rows)
+            self.writes += len(rows); self.flushes += 1
+        except Exception:
+            for k, r in batch.items():      # вернём в очередь, если их не перезаписали
+                self._dirty.setdefault(k, r)
+            logger.exception(f"Не удалось сохранить состояния FSM ({len(rows)} шт.)")
+
+    async def close(self):
+        self._closed = True
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    async def wait_closed(self):
+        pass
+
+    #  API BaseStorage
+
+    @_timed
+    async def get_state(self, *, chat=None, user=None, default: Optional[str] = None) -> Optional[str]:
+        rec = await self._record(self._key(chat, user))
+        return rec["state"] if rec["state"] is not None else self.resolve_state(default)
+
+    @_timed
+    async def get_data(self, *, chat=None, user=None, default: Optional[Dict] = None) -> Dict:
+        rec = await self._record(self._key(chat, user))
+        return copy.deepcopy(rec["data"]) if rec["data"] or default is None else copy.deepcopy(default)
+
+    @_timed
+    async def set_state(self, *, chat=None, user=None, state=None):
+        key = self._key(chat, user)
+        rec = await self._record(key)
+        rec["state"] = self.resolve_state(state)
+        self._touch(key, rec)
+
+    @_timed
+    async def set_data(self, *, chat=None, user=None, data: Dict = None):
+        key = self._key(chat, user)
+        rec = await self._record(key)
+        rec["data"] = copy.deepcopy(data or {})
+        self._touch(key, rec)
+
+    @_timed
+    async def update_data(self, *, chat=None, user=None, data: Dict = None, **kwargs):
+        key = self._key(chat, user)
+        rec = await self._record(key)
+        rec["data"].update(copy.deepcopy(data or {}), **kwargs)
+        self._touch(key, rec)
+
+    def has_bucket(self):
+        return True
+
+    @_timed
+    async def get_bucket(self, *, chat=None, user=None, default: Optional[Dict] = None) -> Dict:
+        rec = await self._record(self._key(chat, user))
+        return copy.deepcopy(rec["bucket"]) if rec["bucket"] or default is None else copy.deepcopy(default)
+
+    @_timed
+    async def set_bucket(self, *, chat=None, user=None, bucket: Dict = None):
+        key = self._key(chat, user)
+        rec = await self._record(key)
+        rec["bucket"] = copy.deepcopy(bucket or {})
+        self._touch(key, rec)
+
+    @_timed
+    async def update_bucket(self, *, chat=None, user=None, bucket: Dict = None, **kwargs):
+        key = self._key(chat, user)
+        rec = await self._record(key)
+        rec["bucket"].update(copy.deepcopy(bucket or {}), **kwargs)
+        self._touch(key, rec)
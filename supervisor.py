@@ -0,0 +1,654 @@
+# supervisor.py — бот в несколько процессов: воркеры по chat_id и один писатель БД
+#
+#   python supervisor.py                                  # как bot.py (BOT_MODE), BOT_WORKERS процессов
+#   python tools/bench.py cluster --workers 4 --updates 20000   # локально, на поддельном Bot API
+#
+# Схема:
+#   • supervisor принимает апдейты (getUpdates или webhook) и, не разбирая их
+#     в types.Update, отдаёт JSON воркеру raw_chat_key % N: апдейты чата всегда в одном
+#     процессе и по порядку, там же его состояние FSM и лимиты отправки;
+#   • воркер — тот же Dispatcher, что в bot.py, со своим UpdatePipeline. Читает базу сам:
+#     SQLite в WAL читается параллельно, страницы файла общие через page cache ОС,
+#     разобранные рецепты, планы и словари — в кэшах процесса;
+#   • писатель — единственный процесс, который пишет в базу. Функции db с @_writes воркер
+#     вызывает через сокет (db.write_proxy). Изменения набора рецептов писатель присылает
+#     supervisor'у, а тот рассылает их остальным воркерам — кэши сбрасываются везде;
+#   • каждый процесс шлёт heartbeat. Упавший перезапускается с растущей паузой (до
+#     WORKER_RESTART_MAX_S), зависший (нет heartbeat WORKER_HEARTBEAT_TIMEOUT_S) убивается
+#     и перезапускается. Апдейты, ждущие в очереди supervisor'а, достаются новому процессу;
+#     взятые упавшим воркером теряются — как при падении bot.py;
+#   • getUpdates уходит с offset=done_offset() — до первого апдейта, который воркер ещё не
+#     доработал (как updates.poll): повторно доставленные отсеивает seen(), а всё
+#     недоработанное к падению или остановке supervisor'а Telegram пришлёт снова.
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener, wait
+from typing import Any, Dict, List, Optional, Set
+
+from config import (MODE, RECIPES_JSON_PATH, SKIP_UPDATES, TELEGRAM_API_SERVER, API_TOKEN, WEBHOOK_URL, WEBHOOK_PATH,
+                    WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT, METRICS_HOST, METRICS_PORT, SEND_GLOBAL_RATE,
+                    WORKER_PROCESSES, WORKER_QUEUE, WORKER_HEARTBEAT_S, WORKER_HEARTBEAT_TIMEOUT_S,
+                    WORKER_RESTART_MAX_S, WRITER_TIMEOUT_S, WORKER_INFLIGHT)
+
+logger = logging.getLogger("cooking-bot.supervisor")
+
+_ctx = multiprocessing.get_context("spawn")   # без fork: у детей нет копий соединений и потоков родителя
+
+
+def _setup_logging(name: str):
+    logging.basicConfig(level=logging.INFO,
+                        format=f"%(asctime)s | %(levelname)s | {name} | %(name)s | %(message)s")
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # Ctrl+C ловит supervisor и останавливает всех по порядку
+
+
+#  Писатель
+
+def _writer_main(address: str, authkey: bytes, control):
+    """Процесс-писатель: запросы (имя, args, kwargs) от воркеров по одному, ответ —
+    ("ok"|"err", результат|исключение, изменения)."""
+    _setup_logging("writer")
+    import db
+    if os.path.exists(address):        # сокет остался от упавшего предшественника
+        os.unlink(address)
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    conns: Dict[Any, int] = {}
+    fresh: List = []
+    wake_r, wake_w = os.pipe()      # поток accept будит основной цикл
+
+    def accept():
+        while True:
+            try:
+                fresh.append(listener.accept())
+                os.write(wake_w, b"!")
+            except OSError:
+                return
+            except Exception as e:   # чужой клиент / неверный ключ
+                logger.warning(f"Писатель: отклонено подключение: {e}")
+
+    threading.Thread(target=accept, name="accept", daemon=True).start()
+    done = errors = 0
+    next_hb = 0.0
+    while True:
+        while fresh:
+            conn = fresh.pop()
+            try:
+                conns[conn] = conn.recv()        # первым сообщением воркер называет свой номер
+            except (EOFError, OSError):
+                conn.close()
+        if time.monotonic() >= next_hb:
+            next_hb = time.monotonic() + WORKER_HEARTBEAT_S
+            control.send(("hb", done, errors))
+        ready = wait([control, wake_r, *conns], timeout=WORKER_HEARTBEAT_S)
+        if control in ready and control.recv() is None:
+            break
+        if wake_r in ready:
+            os.read(wake_r, 1024)
+        for conn in ready:
+            if conn is control or conn is wake_r:
+                continue
+            try:
+                name, args, kwargs = conn.recv()
+            except (EOFError, OSError):          # воркер упал или перезапускается
+                del conns[conn]
+                conn.close()
+                continue
+            try:
+                result, changes = db.execute_write(name, args, kwargs)
+                reply = ("ok", result, changes)
+                done += 1
+            except Exception as e:
+                logger.exception(f"Ошибка записи {name}")
+                reply, changes = ("err", e, []), []
+                errors += 1
+            try:
+                conn.send(reply)
+            except OSError:
+                pass
+            if changes:
+                control.send(("changed", conns.get(conn), changes))
+    listener.close()
+    db.close()
+
+
+class _WriterClient:
+    """db.write_proxy в воркере: синхронный вызов писателя (из потоков пула db.aio)."""
+
+    def __init__(self, n: int, address: str, authkey: bytes):
+        self.n, self.address, self.authkey = n, address, authkey
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        deadline = time.monotonic() + WRITER_TIMEOUT_S
+        while True:
+            try:
+                conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+                conn.send(self.n)
+                return conn
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.2)                  # писатель перезапускается
+
+    def __call__(self, name: str, args: tuple, kwargs: dict):
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                self._conn.send((name, args, kwargs))
+                if not self._conn.poll(WRITER_TIMEOUT_S):
+                    raise TimeoutError(f"писатель не ответил на {name} за {WRITER_TIMEOUT_S} с")
+                status, value, changes = self._conn.recv()
+            except (OSError, EOFError, TimeoutError):
+                self._conn.close()
+                self._conn = None                # следующий вызов переподключится
+                raise
+        if status == "err":
+            raise value
+        return value, changes
+
+
+#  Воркер
+
+def _worker_main(n: int, workers: int, address: str, authkey: bytes, control):
+    _setup_logging(f"worker-{n}")
+    asyncio.run(_worker(n, workers, control, address, authkey))
+
+
+async def _worker(n: int, workers: int, control, address: str, authkey: bytes):
+    from aiogram import Dispatcher, types
+    from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
+
+    import db
+    import inline
+    import metrics
+    import similar
+    import updates
+    from handlers import register_handlers
+    from sender import ThrottledBot
+    from storage import SQLiteStorage
+    from writer import events
+
+    db.write_proxy = _WriterClient(n, address, authkey)
+    db.init_db()    # схема уже актуальна (supervisor), здесь — только словарь имён ингредиентов
+
+    # общий лимит Telegram делится между процессами; лимит на чат — целиком у своего воркера
+    server = TelegramAPIServer.from_base(TELEGRAM_API_SERVER) if TELEGRAM_API_SERVER else TELEGRAM_PRODUCTION
+    bot = ThrottledBot(API_TOKEN, parse_mode="HTML", server=server, global_rate=SEND_GLOBAL_RATE / workers)
+    dp = Dispatcher(bot, storage=SQLiteStorage())
+    register_handlers(dp)
+    updates.setup_metrics(dp)
+    metrics.register("db_pool", db.aio.metrics)
+    metrics.register("recipe_cache", db.cache_stats)
+    metrics.register("writer", events.metrics)
+    metrics.register("fsm", dp.storage.metrics)
+    metrics.register("sender", bot.metrics)
+    metrics.register("inline", inline.metrics)
+    runner = None
+    if METRICS_PORT:
+        try:
+            runner = await metrics.serve(METRICS_HOST, METRICS_PORT + 1 + n)
+        except OSError as e:
+            logger.warning(f"Не удалось поднять метрики на {METRICS_HOST}:{METRICS_PORT + 1 + n}: {e}")
+
+    pipeline = updates.UpdatePipeline(dp, max_pending=WORKER_INFLIGHT)
+    pipeline.start()
+    events.start()
+    similar.warm()
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    ack_pending = False
+    finished: List[int] = []
+
+    def ack():
+        nonlocal ack_pending
+        ack_pending = False
+        control.send(("done", pipeline.processed + pipeline.errors, finished[:]))
+        finished.clear()
+
+    def on_done(update_id: int):
+        # подтверждения за одну итерацию цикла — одним сообщением
+        nonlocal ack_pending
+        finished.append(update_id)
+        if not ack_pending:
+            ack_pending = True
+            loop.call_soon(ack)
+
+    pipeline.on_done = on_done
+
+    async def accept(data: dict):
+        await pipeline.submit(types.Update(**data))
+
+    def read():
+        # чтение из трубы блокирующее — в отдельном потоке; submit ждёт места в конвейере,
+        # и поток вместе с ним (обратное давление до очереди supervisor'а)
+        while True:
+            try:
+                msg = control.recv()
+            except (EOFError, OSError):
+                msg = None
+            if msg is None:
+                loop.call_soon_threadsafe(stop.set)
+                return
+            if msg[0] == "update":
+                asyncio.run_coroutine_threadsafe(accept(msg[1]), loop).result()
+            elif msg[0] == "changed":
+                for recipe_ids, user_id in msg[1]:
+                    db._recipes_changed(recipe_ids, user_id)
+
+    threading.Thread(target=read, name="inbox", daemon=True).start()
+    while not stop.is_set():
+        control.send(("hb", pipeline.processed + pipeline.errors))
+        try:
+            await asyncio.wait_for(stop.wait(), WORKER_HEARTBEAT_S)
+        except asyncio.TimeoutError:
+            pass
+
+    await pipeline.drain()
+    await inline.close()
+    await bot.drain()
+    await events.close()
+    await dp.storage.close(); await dp.storage.wait_closed()
+    if runner is not None:
+        await runner.cleanup()
+    control.send(("hb", pipeline.processed + pipeline.errors))
+    logger.info(f"Остановлен: {pipeline.metrics()}, отправка {bot.metrics()}")
+    session = await bot.get_session()
+    await session.close()
+    db.close()
+
+
+#  Supervisor
+
+class _Child:
+    """Процесс-воркер (или писатель) под присмотром: перезапуск, heartbeat, очередь апдейтов.
+
+    Апдейты уходят в трубу не больше WORKER_INFLIGHT сверх подтверждённых: остальное ждёт
+    в inbox supervisor'а и после падения процесса достаётся следующему, а не пропадает
+    в буфере сокета мёртвого процесса. update_id недоработанных хранятся до подтверждения
+    воркером — по ним supervisor подтверждает getUpdates на остановке."""
+
+    def __init__(self, name: str, target, args: tuple):
+        self.name, self.target, self.args = name, target, args
+        self.process = None
+        self.control = None
+        self.inbox: queue.Queue = queue.Queue(WORKER_QUEUE)   # JSON апдейтов и рассылки для процесса
+        self.seen = 0.0            # время последнего heartbeat
+        self.sent = 0              # апдейтов отдано текущему процессу
+        self.done = 0              # … и обработано им
+        self.done_before = 0       # обработано его предшественниками
+        self.restarts = 0          # подряд — от них растёт пауза
+        self.crashes = 0           # всего
+        self.restart_at = 0.0
+        self.started = 0.0
+        self.open_ids: Set[int] = set()    # отданы в inbox и ещё не доработаны
+        self._sent_ids: Set[int] = set()   # … из них уже в трубе текущего процесса
+        self.stopping = False
+        self._gen = 0              # номер запуска: по нему поток отправки узнаёт о новом процессе
+        self._cond = threading.Condition()
+        self._sender: Optional[threading.Thread] = None
+
+    @property
+    def total(self) -> int:
+        return self.done_before + self.done
+
+    @property
+    def queued(self) -> int:
+        return self.inbox.qsize() + self.sent - self.done
+
+    def start(self, loop: asyncio.AbstractEventLoop, on_message):
+        ours, theirs = _ctx.Pipe()
+        self.process = _ctx.Process(target=self.target, args=self.args + (theirs,), name=self.name, daemon=True)
+        self.process.start()
+        theirs.close()
+        loop.add_reader(ours.fileno(), self._read, ours, on_message)
+        with self._cond:
+            self.control, self.seen = ours, time.monotonic()
+            self.started = self.seen
+            self.done_before += self.done
+            self.sent = self.done = 0
+            if self._sent_ids:     # были у упавшего процесса — уже не доработаются
+                logger.warning(f"{self.name}: потеряно апдейтов: {len(self._sent_ids)}")
+                self.open_ids -= self._sent_ids
+                self._sent_ids.clear()
+            self._gen += 1
+            self._cond.notify_all()
+        if self._sender is None:
+            self._sender = threading.Thread(target=self._send_loop, name=f"{self.name}-send", daemon=True)
+            self._sender.start()
+
+    def _read(self, conn, on_message):
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            asyncio.get_running_loop().remove_reader(conn.fileno())
+            return
+        if msg[0] == "hb" or msg[0] == "done":
+            with self._cond:
+                self.seen = time.monotonic()
+                self.done = msg[1]
+                if msg[0] == "done":
+                    self.open_ids.difference_update(msg[2])
+                    self._sent_ids.difference_update(msg[2])
+                self._cond.notify_all()
+        if msg[0] != "hb":
+            on_message(self, msg)
+
+    def _send_loop(self):
+        # отдельный поток: блокирующая запись в трубу не держит цикл событий
+        while True:
+            msg = self.inbox.get()
+            update = msg is not None and msg[0] == "update"
+            while True:
+                with self._cond:
+                    gen = self._gen
+                    while update and self.sent - self.done >= WORKER_INFLIGHT and self._gen == gen:
+                        self._cond.wait()
+                    if self._gen != gen:
+                        continue
+                    conn = self.control
+                try:
+                    conn.send(msg)
+                except (OSError, ValueError):
+                    # процесс умер — то же сообщение получит следующий
+                    with self._cond:
+                        self._cond.wait_for(lambda: self._gen != gen or self.stopping and msg is None)
+                        if self.stopping and msg is None and self._gen == gen:
+                            return
+                    continue
+                if update:
+                    with self._cond:
+                        self.sent += 1
+                        self._sent_ids.add(msg[1]["update_id"])
+                break
+            if msg is None:
+                return
+
+    def detach(self, loop: asyncio.AbstractEventLoop):
+        try:
+            loop.remove_reader(self.control.fileno())
+        except (OSError, ValueError):
+            pass
+        self.control.close()
+        with self._cond:
+            self._cond.notify_all()
+
+    async def put(self, msg):
+        if msg is not None and msg[0] == "update":
+            with self._cond:
+                self.open_ids.add(msg[1]["update_id"])
+        try:
+            self.inbox.put_nowait(msg)
+        except queue.Full:      # воркер не успевает — ждём вместе с источником апдейтов
+            await asyncio.get_running_loop().run_in_executor(None, self.inbox.put, msg)
+
+
+class Supervisor:
+    def __init__(self, workers: int):
+        self.n = workers
+        self.authkey = os.urandom(16)
+        self._dir = tempfile.mkdtemp(prefix="cooking-bot-")
+        self.address = os.path.join(self._dir, "writer.sock")
+        self.writer = _Child("writer", _writer_main, (self.address, self.authkey))
+        self.workers = [_Child(f"worker-{n}", _worker_main, (n, workers, self.address, self.authkey))
+                        for n in range(workers)]
+        self.routed = 0
+        self.finished = 0          # апдейтов доработано воркерами (по подтверждениям "done")
+        self.last_id: Optional[int] = None
+        self._done: Set[int] = set()       # доработанные, пока ниже них есть недоработанный
+        self._progress = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._health: Optional[asyncio.Task] = None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"routed": self.routed, "processed": sum(w.total for w in self.workers),
+                "restarts": sum(c.crashes for c in (self.writer, *self.workers)),
+                "queued": [w.queued for w in self.workers]}
+
+    def _on_message(self, child: _Child, msg):
+        if msg[0] == "done":
+            self.finished += len(msg[2])
+            low = self._low()
+            self._done = {i for i in self._done if low is not None and i > low}
+            if low is not None:
+                self._done.update(i for i in msg[2] if i > low)
+            self._progress.set()
+        elif msg[0] == "changed":      # от писателя: сбросить кэши рецептов во всех воркерах, кроме автора
+            _, origin, changes = msg
+            for n, w in enumerate(self.workers):
+                if n != origin and not w.stopping:
+                    try:
+                        w.inbox.put_nowait(("changed", changes))
+                    except queue.Full:
+                        self._loop.run_in_executor(None, w.inbox.put, ("changed", changes))
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.writer.start(self._loop, self._on_message)
+        for w in self.workers:
+            w.start(self._loop, self._on_message)
+        self._health = asyncio.create_task(self._watch())
+        logger.info(f"Запущено воркеров: {self.n} + писатель БД")
+
+    async def route(self, data: dict):
+        from updates import raw_chat_key
+        self.routed += 1
+        self.last_id = data["update_id"] if self.last_id is None else max(self.last_id, data["update_id"])
+        await self.workers[raw_chat_key(data) % self.n].put(("update", data))
+
+    def _restart(self, child: _Child, reason: str):
+        child.restarts += 1
+        child.crashes += 1
+        delay = min(WORKER_RESTART_MAX_S, 0.5 * 2 ** min(child.restarts - 1, 10))
+        logger.warning(f"{child.name}: {reason}, перезапуск через {delay:.1f} с")
+        child.detach(self._loop)
+        child.restart_at = time.monotonic() + delay
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(WORKER_HEARTBEAT_S)
+            now = time.monotonic()
+            for child in (self.writer, *self.workers):
+                if child.stopping:
+                    continue
+                if child.restart_at:
+                    if now >= child.restart_at:
+                        child.restart_at = 0.0
+                        child.start(self._loop, self._on_message)
+                    continue
+                if not child.process.is_alive():
+                    child.process.join()
+                    self._restart(child, f"процесс завершился с кодом {child.process.exitcode}")
+                elif now - child.seen > WORKER_HEARTBEAT_TIMEOUT_S:
+                    child.process.kill()
+                    child.process.join(5)
+                    self._restart(child, f"нет heartbeat {now - child.seen:.0f} с")
+                elif child.restarts and now - child.started > 2 * WORKER_RESTART_MAX_S:
+                    child.restarts = 0     # проработал спокойно — следующая пауза снова короткая
+
+    def _low(self) -> Optional[int]:
+        unfinished = [min(w.open_ids) for w in self.workers if w.open_ids]
+        return min(unfinished) if unfinished else None
+
+    def done_offset(self) -> Optional[int]:
+        """offset для getUpdates, подтверждающий только доработанное воркерами (как
+        UpdatePipeline.done_offset); потерянные упавшим воркером не держат подтверждение."""
+        if self.last_id is None:
+            return None
+        low = self._low()
+        return low if low is not None else self.last_id + 1
+
+    def seen(self, update_id: int) -> bool:
+        """Апдейт уже разослан (повторная доставка после getUpdates с offset=done_offset())."""
+        offset = self.done_offset()
+        return offset is not None and (update_id < offset or update_id in self._done or
+                                       any(update_id in w.open_ids for w in self.workers))
+
+    async def progressed(self, since: int, timeout: float):
+        """Дождаться, пока доработанных станет больше since (self.finished), не дольше timeout."""
+        if self.finished > since:
+            return
+        self._progress.clear()
+        try:
+            await asyncio.wait_for(self._progress.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def idle(self, timeout: float, stop: asyncio.Event) -> bool:
+        """Дождаться, пока воркеры доработают всё разосланное (tools/bench.py cluster)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not stop.is_set():
+            if not any(w.queued for w in self.workers):
+                return True
+            await asyncio.sleep(0.05)
+        return False
+
+    async def stop(self):
+        """Сначала воркеры дорабатывают очереди (их записи ещё идут через писателя), потом писатель."""
+        if self._health is not None:
+            self._health.cancel()
+        for group in (self.workers, [self.writer]):
+            for child in group:
+                child.stopping = True
+                await child.put(None)
+            for child in group:
+                if child.process is not None:
+                    await self._loop.run_in_executor(None, child.process.join, WORKER_HEARTBEAT_TIMEOUT_S)
+                    if child.process.is_alive():
+                        logger.warning(f"{child.name} не остановился, завершаем принудительно")
+                        child.process.kill()
+                child.detach(self._loop)
+        logger.info(f"Supervisor: {self.metrics()}")
+        try:
+            os.unlink(self.address)
+            os.rmdir(self._dir)
+        except OSError:
+            pass
+
+
+#  Источники апдейтов
+
+async def poll(sup: Supervisor, bot, stop: asyncio.Event, timeout: int = 20):
+    """getUpdates как в updates.poll, но без разбора: сырые апдейты сразу уходят воркерам.
+    offset — done_offset(); доработанное за остановку подтверждает confirm."""
+    from updates import REDELIVERY_WAIT_S
+    if SKIP_UPDATES:
+        await bot.delete_webhook(drop_pending_updates=True)
+    stopper = asyncio.create_task(stop.wait())
+    while not stop.is_set():
+        offset, finished = sup.done_offset(), sup.finished
+        params = {"timeout": timeout} if offset is None else {"offset": offset, "timeout": timeout}
+        fetch = asyncio.create_task(bot.request("getUpdates", params))
+        await asyncio.wait({fetch, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        if not fetch.done():
+            fetch.cancel()
+            await asyncio.gather(fetch, return_exceptions=True)
+            break
+        try:
+            batch = fetch.result()
+        except Exception as e:
+            logger.warning(f"get_updates error: {e}")
+            await asyncio.sleep(1)
+            continue
+        fresh = [data for data in batch if not sup.seen(data["update_id"])]
+        for data in fresh:
+            await sup.route(data)
+        if batch and not fresh:
+            await sup.progressed(finished, REDELIVERY_WAIT_S)
+    stopper.cancel()
+
+
+async def confirm(sup: Supervisor, bot):
+    """Подтвердить Telegram доработанное воркерами (после Supervisor.stop): не успевшее
+    за остановку придёт снова."""
+    offset = sup.done_offset()
+    if offset is not None:
+        try:
+            await bot.request("getUpdates", {"offset": offset, "limit": 1, "timeout": 0})
+        except Exception as e:
+            logger.warning(f"get_updates (confirm) error: {e}")
+
+
+async def webhook(sup: Supervisor, stop: asyncio.Event):
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        if stop.is_set():
+            return web.Response(status=503)
+        try:
+            data = await request.json()
+        except Exception:
+            return web.Response(status=400, text="bad update")
+        await sup.route(data)
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    await stop.wait()
+    await runner.cleanup()
+
+
+#  Запуск
+
+async def main(args):
+    from aiogram import Bot
+    from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
+
+    import db
+    from helpers import load_recipes_from_json
+
+    # миграции и импорт JSON — один раз, до запуска процессов
+    db.init_db()
+    added = load_recipes_from_json(args.json)
+    if added:
+        logger.info(f"Добавлено/обновлено рецептов из JSON: {added}")
+
+    server = TelegramAPIServer.from_base(TELEGRAM_API_SERVER) if TELEGRAM_API_SERVER else TELEGRAM_PRODUCTION
+    bot = Bot(API_TOKEN, server=server)
+
+    sup = Supervisor(args.workers)
+    await sup.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        if args.source == "webhook":
+            if WEBHOOK_URL:
+                await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET or None,
+                                      drop_pending_updates=SKIP_UPDATES)
+                logger.info(f"Webhook установлен: {WEBHOOK_URL} ✅")
+            await webhook(sup, stop)
+        else:
+            await bot.delete_webhook(drop_pending_updates=SKIP_UPDATES)
+            await poll(sup, bot, stop)
+    finally:
+        await sup.stop()
+        if args.source != "webhook":
+            await confirm(sup, bot)
+        session = await bot.get_session()
+        await session.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Бот в несколько процессов (шардирование по chat_id)")
+    p.add_argument("--workers", type=int, default=WORKER_PROCESSES or os.cpu_count() or 1)
+    p.add_argument("--source", choices=("polling", "webhook"), default=MODE)
+    p.add_argument("--json", default=RECIPES_JSON_PATH)
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | supervisor | %(name)s | %(message)s")
+    asyncio.run(main(args))
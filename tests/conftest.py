@@ -0,0 +1,89 @@
+# Тесты работают на временной базе: RECIPES_DB задаётся до первого импорта config/db.
+# BOT_TOKEN — любой токен правильного вида (aiogram проверяет формат), сеть не нужна.
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+_tmp = tempfile.mkdtemp(prefix="cooking-bot-test-")
+os.environ["RECIPES_DB"] = os.path.join(_tmp, "recipes.db")
+os.environ["BOT_TOKEN"] = "123456:TEST-token-for-pytest"
+os.environ["METRICS_PORT"] = "0"
+
+import asyncio  # noqa: E402
+import contextlib  # noqa: E402
+import itertools  # noqa: E402
+import time  # noqa: E402
+
+import pytest  # noqa: E402
+
+import db  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    db.init_db()
+    yield db.DB_PATH
+    db.close()
+
+
+def recipe(title: str, ingredients, description: str = "", cook_time_min: int = 20):
+    """Рецепт в формате recipes.json; ingredients — имена или (имя, граммы, ккал)."""
+    ings = [{"name": i, "grams": 100, "kcal": 50} if isinstance(i, str) else
+            {"name": i[0], "grams": i[1], "kcal": i[2]} for i in ingredients]
+    return {"title": title, "description": description, "ingredients": ings,
+            "steps": ["Смешать", "Подать"], "cook_time_min": cook_time_min}
+
+
+@contextlib.asynccontextmanager
+async def fake_telegram(bot_cls=None, chat_rate: float = 0.0, **bot_kwargs):
+    """Бот, подключённый к tools/fake_api.py на свободном порту: (api, bot)."""
+    from aiogram import Bot
+    from aiogram.bot.api import TelegramAPIServer
+    from aiohttp import web
+    from fake_api import FakeAPI, make_app
+
+    api = FakeAPI(chat_rate=chat_rate, global_rate=0)
+    runner = web.AppRunner(make_app(api), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    bot = (bot_cls or Bot)(os.environ["BOT_TOKEN"], parse_mode="HTML",
+                           server=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}"), **bot_kwargs)
+    try:
+        yield api, bot
+    finally:
+        await (await bot.get_session()).close()
+        await runner.cleanup()
+
+
+async def feed(dp, data: dict):
+    """Обработать апдейт как UpdatePipeline: отдельной задачей, со своим контекстом
+    (aiogram кэширует состояние FSM в contextvar на время апдейта)."""
+    from aiogram import types
+    await asyncio.create_task(dp.process_update(types.Update(**data)))
+
+
+_update_ids = itertools.count(1)
+
+
+def message_update(user_id: int, text: str) -> dict:
+    """Апдейт с текстовым сообщением из личного чата пользователя."""
+    uid = next(_update_ids)
+    user = {"id": user_id, "is_bot": False, "first_name": "Тест"}
+    return {"update_id": uid, "message": {"message_id": uid, "date": int(time.time()), "text": text,
+                                          "chat": {"id": user_id, "type": "private"}, "from": user}}
+
+
+def callback_update(user_id: int, data: str, message_id: int = 1) -> dict:
+    """Нажатие inline-кнопки под сообщением бота message_id."""
+    uid = next(_update_ids)
+    user = {"id": user_id, "is_bot": False, "first_name": "Тест"}
+    message = {"message_id": message_id, "date": int(time.time()), "text": "…",
+               "chat": {"id": user_id, "type": "private"}, "from": {"id": 1, "is_bot": True, "first_name": "Bot"}}
+    return {"update_id": uid, "callback_query": {"id": str(uid), "from": user, "chat_instance": "1",
+                                                 "data": data, "message": message}}
@@ -0,0 +1,92 @@
+# Двоичный формат ингредиентов и шагов (user-021): decode(encode(x)) == x и чтение старого JSON.
+import json
+import struct
+
+import pytest
+
+import codec
+
+
+class Names:
+    """Интернирование имён, как db.ingredient_names, но в памяти."""
+
+    def __init__(self):
+        self.ids, self.names = {}, []
+
+    def id(self, name: str) -> int:
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def name(self, nid: int) -> str:
+        return self.names[nid]
+
+
+@pytest.mark.parametrize("items", [
+    [],
+    [""],
+    ["Нарезать лук", "Обжарить 5 мин."],
+    ["🍲 готово!", "строка\nс переводом\tи табом", "\x00"],
+    ["ё" * 100_000],
+])
+def test_strings_roundtrip(items):
+    blob = codec.encode_strings(items)
+    assert codec.decode_strings(blob) == items
+    assert codec.decode_strings(memoryview(blob)) == items
+
+
+@pytest.mark.parametrize("ings", [
+    [],
+    [{"name": "Соль", "grams": 0.0, "kcal": 0.0}],
+    [{"name": "Лук", "grams": 150.0, "kcal": 61.5}, {"name": "Лук", "grams": 0.5, "kcal": 0.25},
+     {"name": "", "grams": 1e6, "kcal": 3.75e5}],
+])
+def test_ingredients_roundtrip(ings):
+    names = Names()
+    blob = codec.encode_ingredients(ings, names.id)
+    assert codec.decode_ingredients(blob, names.name) == ings
+    assert len(names.names) == len({i["name"] for i in ings})   # имя хранится один раз
+
+
+def test_ingredients_are_float32():
+    names = Names()
+    blob = codec.encode_ingredients([{"name": "Мука", "grams": 0.1, "kcal": 33.3}], names.id)
+    (got,) = codec.decode_ingredients(blob, names.name)
+    assert got["grams"] == pytest.approx(0.1, rel=1e-6) and got["kcal"] == pytest.approx(33.3, rel=1e-6)
+
+
+def test_json_text_is_read_as_before_migration():
+    steps = ["Смешать", "Запечь"]
+    ings = [{"name": "Мука", "grams": 200, "kcal": 680}]
+    assert codec.decode_strings(json.dumps(steps, ensure_ascii=False)) == steps
+    assert codec.decode_ingredients(json.dumps(ings, ensure_ascii=False), Names().name) == ings
+
+
+@pytest.mark.parametrize("blob", [
+    b"",
+    b"\x01\x00",                                        # короче заголовка
+    struct.pack("<BI", 2, 0),                           # неизвестная версия
+    codec.encode_strings(["abc"])[:-1],                 # обрезана строка
+    struct.pack("<BI", 1, 3),                           # n больше, чем данных
+])
+def test_broken_blobs_raise_codec_error(blob):
+    with pytest.raises(codec.CodecError):
+        codec.decode_strings(blob)
+
+
+def test_truncated_ingredients_raise_codec_error():
+    blob = codec.encode_ingredients([{"name": "Соль", "grams": 1, "kcal": 0}], Names().id)
+    with pytest.raises(codec.CodecError):
+        codec.decode_ingredients(blob[:-1], Names().name)
+
+
+def test_recipe_roundtrip_through_database():
+    import db
+    ings = [{"name": "Тыква", "grams": 500.0, "kcal": 130.0}, {"name": "Сливки 10%", "grams": 100.0, "kcal": 118.0}]
+    steps = ["Запечь тыкву", "Пюрировать со сливками", ""]
+    db.add_user_recipe(21001, "Крем-суп из тыквы", "", ings, steps, 45)
+    rid = db.search("тыква", 21001)[0]["id"]
+    db._recipe_cache.clear()                   # читаем из базы, а не из кэша
+    r = db.get_recipe(rid, 21001)
+    assert r["ingredients"] == ings and r["steps"] == steps
@@ -0,0 +1,36 @@
+# Подбор по ингредиентам (user-005): больше покрыто, затем меньше докупить; свои рецепты — вперемешку с общими.
+import db
+from conftest import recipe
+
+USER, OTHER = 5001, 5002
+
+
+def ranked(words, user_id: int = USER):
+    return [(r["title"], r["covered"], r["missing"]) for r in db.by_ingredients(words, user_id)]
+
+
+def test_ranking_by_covered_then_missing():
+    db.insert_many([
+        recipe("Фейхоа в сиропе", ["Фейхоа"]),
+        recipe("Фейхоа с тмином", ["Фейхоа", "Тмин"]),
+        recipe("Плов с фейхоа", ["Фейхоа", "Тмин", "Шафран", "Кардамон"]),
+        recipe("Рис с шафраном", ["Тмин", "Шафран"]),
+    ])
+    assert ranked(["фейхоа", "тмин"]) == [
+        ("Фейхоа с тмином", 2, 0),
+        ("Плов с фейхоа", 2, 2),
+        ("Фейхоа в сиропе", 1, 0),
+        ("Рис с шафраном", 1, 1),
+    ]
+    assert ranked(["шафран"])[0] == ("Рис с шафраном", 1, 1)
+    assert ranked(["несуществующее"]) == []
+
+
+def test_own_recipes_merge_into_shared_ranking():
+    ings = recipe("", ["Фейхоа", "Тмин", "Шафран"])["ingredients"]
+    db.add_user_recipe(USER, "Мой соус из фейхоа", "", ings, ["Смешать"], 10)
+    mine = ranked(["фейхоа", "тмин"])
+    assert [t for t, _, _ in mine[:3]] == ["Фейхоа с тмином", "Мой соус из фейхоа", "Плов с фейхоа"]
+    assert ("Мой соус из фейхоа", 2, 1) in mine
+    assert "Мой соус из фейхоа" not in [t for t, _, _ in ranked(["фейхоа", "тмин"], OTHER)]
+
@@ -0,0 +1,85 @@
+# Постраничный список (user-007): курсоры «после» и «перед», края списка, удалённые id.
+import db
+from conftest import recipe
+
+USER, OTHER = 7001, 7002
+LIMIT = 3
+
+
+def expected(quick_only: bool):
+    """Весь список в порядке показа — без курсоров, сортировкой в Python."""
+    rows = db.get_conn().execute("SELECT id, cook_time_min FROM recipes WHERE user_id IS NULL OR user_id=?",
+                                 (USER,)).fetchall()
+    if quick_only:
+        rows = sorted((r for r in rows if r["cook_time_min"] <= db.QUICK_MAX_MIN),
+                      key=lambda r: (r["cook_time_min"], -r["id"]))
+    else:
+        rows = sorted(rows, key=lambda r: -r["id"])
+    return [r["id"] for r in rows]
+
+
+def ids(rows):
+    return [r["id"] for r in rows]
+
+
+def walk_forward(quick_only: bool):
+    pages, after = [], None
+    while True:
+        rows, has_prev, has_next = db.list_page(USER, quick_only, after=after, limit=LIMIT)
+        pages.append((ids(rows), has_prev, has_next))
+        if not has_next:
+            return pages, rows
+        after = db.page_key(rows[-1], quick_only)
+
+
+def walk_back(last_rows, quick_only: bool):
+    pages, rows = [], last_rows
+    while True:
+        rows, has_prev, has_next = db.list_page(USER, quick_only, before=db.page_key(rows[0], quick_only), limit=LIMIT)
+        pages.append((ids(rows), has_prev, has_next))
+        if not has_prev:
+            return pages[::-1]
+
+
+def add_own(n: int):
+    ings = recipe("", ["Вода"])["ingredients"]
+    # время готовки с повторами и выше порога «быстрых»: порядок по (минуты, id DESC)
+    return [db.add_user_recipe(USER, f"Личный {i}", "", ings, ["Варить"], (5, 10, 10, 15, 40)[i % 5])
+            for i in range(n)]
+
+
+def test_pages_forward_and_back_match():
+    add_own(11)
+    db.add_user_recipe(OTHER, "Чужой", "", recipe("", ["Вода"])["ingredients"], ["Варить"], 10)
+    for quick_only in (False, True):
+        full = expected(quick_only)
+        pages, last = walk_forward(quick_only)
+        assert [i for p, _, _ in pages for i in p] == full           # ни пропусков, ни повторов
+        assert all(len(p) == LIMIT for p, _, _ in pages[:-1]) and 1 <= len(pages[-1][0]) <= LIMIT
+        assert pages[0][1] is False and pages[-1][2] is False          # края
+        assert all(prev for _, prev, _ in pages[1:]) and all(nxt for _, _, nxt in pages[:-1])
+        back = walk_back(last, quick_only)                           # от последней страницы к первой
+        assert [p for p, _, _ in back] == [p for p, _, _ in pages[:-1]]
+        assert back[0][1] is False and all(nxt for _, _, nxt in back)
+
+
+def test_cursor_survives_deleted_boundary():
+    add_own(7)
+    for quick_only in (False, True):
+        full = expected(quick_only)
+        first, _, _ = db.list_page(USER, quick_only, limit=LIMIT)
+        second, _, _ = db.list_page(USER, quick_only, after=db.page_key(first[-1], quick_only), limit=LIMIT)
+        after, before = db.page_key(first[-1], quick_only), db.page_key(second[0], quick_only)
+        assert db.delete_user_recipe(first[-1]["id"], USER) and db.delete_user_recipe(second[0]["id"], USER)
+        # курсоры удалённых рецептов всё ещё делят список в том же месте
+        rows, has_prev, _ = db.list_page(USER, quick_only, after=after, limit=LIMIT)
+        assert ids(rows) == full[LIMIT + 1:2 * LIMIT + 1] and has_prev
+        rows, _, has_next = db.list_page(USER, quick_only, before=before, limit=LIMIT)
+        assert ids(rows) == full[:LIMIT - 1] and has_next
+
+
+def test_first_and_only_page():
+    rows, has_prev, has_next = db.list_page(USER, limit=10_000)
+    assert ids(rows) == expected(False) and not has_prev and not has_next
+    rows, has_prev, has_next = db.list_page(USER, after=db.page_key(rows[-1], False))
+    assert rows == [] and has_prev and not has_next
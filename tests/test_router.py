@@ -0,0 +1,81 @@
+# Ожидаемое намерение чата (user-011): живёт intent_ttl и сбрасывается сообщением мимо роутера.
+import asyncio
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+import cache
+import db
+from conftest import fake_telegram, feed, message_update
+from handlers import register_handlers
+from router import TextRouter
+
+USER = 11001
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_pop_ignores_expired_entries(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    c = cache.LRUCache(ttl=10)
+    c.put("a", 1); c.put("b", 2)
+    assert c.pop("a") == 1
+    clock.now += 11
+    assert c.pop("b") is None and len(c) == 0
+
+
+def test_intent_expires_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    router = TextRouter(intent_ttl=60)
+    calls = []
+
+    @router.button("🗑️ Удалить", intent="delete")
+    async def hint(m): calls.append("hint")
+
+    @router.intent("delete")
+    async def delete(m): calls.append("delete")
+
+    @router.number
+    async def show(m): calls.append("show")
+
+    async def send(*texts):
+        for text in texts:
+            await router.dispatch(types.Message(**message_update(USER, text)["message"]))
+
+    asyncio.run(send("🗑️ Удалить", "1"))
+    assert calls == ["hint", "delete"]
+    asyncio.run(send("🗑️ Удалить"))
+    clock.now += 61
+    asyncio.run(send("1"))
+    assert calls == ["hint", "delete", "hint", "show"]
+
+
+async def _delete_then_add_then_open():
+    async with fake_telegram() as (api, bot):
+        dp = Dispatcher(bot, storage=MemoryStorage())
+        Bot.set_current(bot); Dispatcher.set_current(dp)
+        register_handlers(dp)
+        for text in ["🗑️ Удалить рецепты", "➕ Добавить рецепт", "Окрошка на квасе", "Летний суп",
+                     "Квас; 500; 135", "ГОТОВО", "Нарезать овощи", "ГОТОВО", "15"]:
+            await feed(dp, message_update(USER, text))
+        rid = db.search("окрошка", USER)[0]["id"]
+        api.reset()
+        await feed(dp, message_update(USER, str(rid)))
+        replies = [p.get("text", "") for method, p in api.log if method == "sendMessage"]
+        await dp.storage.close()
+        return rid, replies
+
+
+def test_unrelated_action_cancels_pending_intent():
+    rid, replies = asyncio.run(_delete_then_add_then_open())
+    assert db.get_recipe(rid, USER) is not None           # рецепт на месте
+    assert not any("Удалено" in t for t in replies)
+    assert any("Окрошка на квасе" in t for t in replies)  # открылась карточка
@@ -0,0 +1,64 @@
+# Полнотекстовый поиск (user-004): триггеры FTS следят за вставкой, изменением и удалением.
+import sqlite3
+
+import db
+from conftest import recipe
+
+USER, OTHER = 4001, 4002
+
+
+def titles(query: str, user_id: int = USER):
+    return [r["title"] for r in db.search(query, user_id)]
+
+
+def test_insert_is_searchable_by_title_stem_and_ingredient():
+    db.insert_many([recipe("Пирог с облепихой", ["Мука", "Облепиха"], "Осенний десерт"),
+                    recipe("Морс ягодный", ["Клюква", "Вода"])])
+    assert titles("облепиха") == ["Пирог с облепихой"]
+    assert titles("Облепихой") == ["Пирог с облепихой"]     # регистр и окончание
+    assert titles("клюква") == ["Морс ягодный"]              # только в ингредиентах
+    assert titles("осенн") == ["Пирог с облепихой"]          # префикс слова описания
+    assert titles("облепиха клюква") == []                   # все слова должны встретиться
+
+
+def test_update_replaces_indexed_text():
+    db.insert_many([recipe("Компот зимний", ["Яблоко", "Вода"])])
+    assert titles("яблоко") == ["Компот зимний"]
+    added, updated = db.upsert_shared([recipe("Компот зимний", ["Айва", "Вода"])])
+    assert (added, updated) == (0, 1)
+    assert titles("яблоко") == []
+    assert titles("айва") == ["Компот зимний"]
+
+
+def test_delete_and_owner_visibility():
+    db.add_user_recipe(USER, "Суп из топинамбура", "", recipe("", ["Топинамбур"])["ingredients"], ["Варить"], 40)
+    assert titles("топинамбур") == ["Суп из топинамбура"]
+    assert titles("топинамбур", OTHER) == []
+    rid = db.search("топинамбур", USER)[0]["id"]
+    assert db.delete_user_recipe(rid, USER)
+    assert titles("топинамбур") == []
+
+
+def test_one_letter_words_are_not_searched():
+    db.insert_many([recipe("Салат с редисом", ["Редис", "Сметана"])])
+    assert db.fts_query("с") is None
+    assert db.fts_query("и в") is None
+    assert db.fts_query("салат с редисом") == '"салат"* "редис"*'
+    assert db.search("с", USER) == []
+    assert titles("салат с редисом") == ["Салат с редисом"]
+
+
+def test_triggers_work_without_app_functions():
+    # Схема не зависит от функций, которые регистрирует приложение: обычный клиент
+    # sqlite3 (консоль, бэкап-скрипт) правит рецепты, а индекс остаётся согласованным.
+    db.insert_many([recipe("Кисель овсяный", ["Овёс", "Вода"]), recipe("Квас хлебный", ["Хлеб", "Вода"])])
+    kisel, kvas = (db.search(t, USER)[0]["id"] for t in ("кисель", "квас"))
+    conn = sqlite3.connect(str(db.DB_PATH))
+    with conn:
+        conn.execute("UPDATE recipes SET title='Кисель клюквенный' WHERE id=?", (kisel,))
+        conn.execute("DELETE FROM recipes WHERE id=?", (kvas,))
+        conn.execute("INSERT INTO recipes_fts(recipes_fts) VALUES('integrity-check')")
+    conn.close()
+    assert titles("клюквенный") == ["Кисель клюквенный"]
+    assert titles("овёс") == ["Кисель клюквенный"]
+    assert titles("квас") == [] and titles("хлеб") == []
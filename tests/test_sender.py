@@ -0,0 +1,43 @@
+# Исходящие запросы (user-013): быстрые «Далее» в пошаговой готовке склеиваются в одну правку,
+# ответы на кнопки не ждут лимита чата. Bot API — tools/fake_api.py с лимитом 1 сообщение/с на чат.
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+import db
+from conftest import callback_update, fake_telegram, feed, recipe
+from handlers import register_handlers
+from sender import ThrottledBot
+
+USER = 13001
+
+
+async def _rapid_next_taps():
+    r = recipe("Запеканка из пяти шагов", ["Творог"])
+    r["steps"] = ["Шаг первый", "Шаг второй", "Шаг третий", "Шаг четвёртый", "Шаг пятый"]
+    db.insert_many([r])
+    rid = db.search("запеканка", USER)[0]["id"]
+    async with fake_telegram(ThrottledBot, chat_rate=1.0) as (api, bot):
+        dp = Dispatcher(bot, storage=MemoryStorage())
+        Bot.set_current(bot); Dispatcher.set_current(dp)
+        register_handlers(dp)
+        t0 = time.monotonic()
+        for idx in range(4):                       # четыре нажатия подряд, по очереди, как в UpdatePipeline
+            await feed(dp, callback_update(USER, f"cook:{rid}:{idx}", message_id=7))
+        handled = time.monotonic() - t0
+        await bot.drain()
+        edits = [p for method, p in api.log if method == "editMessageText"]
+        answers = [method for method, _ in api.log if method == "answerCallbackQuery"]
+        return handled, edits, answers, api.stats()["429"], bot.metrics()
+
+
+def test_rapid_edits_coalesce_and_answers_do_not_wait():
+    handled, edits, answers, limited, stats = asyncio.run(_rapid_next_taps())
+    assert len(answers) == 4
+    assert handled < 0.5                           # ни один ответ на кнопку не ждал правку
+    # правка уходит не на каждое нажатие: ждущая лимита чата заменяется следующей
+    assert len(edits) <= 2 and len(edits) + stats["coalesced"] == 4
+    assert "Шаг четвёртый" in edits[-1]["text"]
+    assert limited == {}
@@ -0,0 +1,25 @@
+# Похожие рецепты (user-020): одна копия матрицы, поиск строки по id, сборка фоном.
+import numpy as np
+
+import db
+import similar
+from conftest import recipe
+
+
+def test_index_keeps_single_matrix_and_finds_rows():
+    db.upsert_shared([recipe("Борщ украинский", ["Свёкла", "Капуста", "Картофель"]),
+                      recipe("Щи кислые", ["Капуста", "Картофель", "Морковь"]),
+                      recipe("Борщ постный", ["Свёкла", "Капуста", "Фасоль"])])
+    similar.warm().join()
+    version, vocab, index = similar._shared
+    assert version == db.recipes_version(0)[0]
+    assert np.all(np.diff(index.fam) >= 0)          # общие рецепты закодированы сразу по семьям
+    assert len(similar._shared) == 3                # матрица живёт только в индексе
+    for i, rid in enumerate(index.ids):
+        assert index.find(int(rid)) == i
+    assert index.find(-1) == -1
+
+    m = similar._Matrix(index.ids[::-1].copy(), index.fam[::-1].copy(), index.x[::-1].copy())
+    shuffled = similar._Index(m)                    # строки не по семьям — индекс переставляет их сам
+    assert np.all(np.diff(shuffled.fam) >= 0)
+    assert shuffled.find(int(index.ids[0])) >= 0
@@ -0,0 +1,93 @@
+# Состояния FSM и отложенная запись событий (user-014): данные доходят до базы пакетом,
+# просроченное не читается и вычищается, close() дописывает очередь.
+import asyncio
+import time
+
+import db
+from conftest import recipe
+from storage import SQLiteStorage
+from writer import BatchWriter
+
+CHAT, USER = 14001, 14001
+
+
+def cook_logs(user_id: int) -> int:
+    return db.get_conn().execute("SELECT COUNT(*) FROM cook_logs WHERE user_id=?", (user_id,)).fetchone()[0]
+
+
+async def _round_trip():
+    s = SQLiteStorage(flush_ms=60_000)                    # сами фоном не пишем — только flush()
+    await s.set_state(chat=CHAT, user=USER, state="AddRecipe:ings")
+    await s.update_data(chat=CHAT, user=USER, data={"title": "Плов"}, ings=["Рис"])
+    await s.set_bucket(chat=CHAT, user=USER, bucket={"hits": 1})
+    assert db.fsm_load(CHAT, USER, 0) is None             # пока только в памяти
+    await s.flush()
+    fresh = SQLiteStorage()
+    assert await fresh.get_state(chat=CHAT, user=USER) == "AddRecipe:ings"
+    assert await fresh.get_data(chat=CHAT, user=USER) == {"title": "Плов", "ings": ["Рис"]}
+    assert await fresh.get_bucket(chat=CHAT, user=USER) == {"hits": 1}
+
+    await s.reset_state(chat=CHAT, user=USER, with_data=True)
+    await s.set_bucket(chat=CHAT, user=USER, bucket={})
+    await s.close()                                       # пустое состояние — удаление строки
+    assert db.fsm_load(CHAT, USER, 0) is None
+    assert await SQLiteStorage().get_state(chat=CHAT, user=USER) is None
+    await fresh.close()
+
+
+def test_state_and_data_survive_flush():
+    asyncio.run(_round_trip())
+
+
+async def _close_flushes():
+    s = SQLiteStorage(flush_ms=60_000)
+    await s.set_data(chat=CHAT + 1, user=USER + 1, data={"step": 2})
+    assert s.metrics()["dirty"] == 1
+    await s.close()
+    assert s.metrics()["dirty"] == 0 and s.writes == 1
+    assert await SQLiteStorage().get_data(chat=CHAT + 1, user=USER + 1) == {"step": 2}
+
+
+def test_close_writes_pending_states():
+    asyncio.run(_close_flushes())
+
+
+async def _expiry():
+    now = int(time.time())
+    db.fsm_save([(CHAT + 2, USER + 2, "Stale:state", '{"old": true}', "{}", now - 120),
+                 (CHAT + 3, USER + 3, "Live:state", "{}", "{}", now)])
+    s = SQLiteStorage(ttl=60, flush_ms=10, sweep_s=0)
+    assert await s.get_state(chat=CHAT + 2, user=USER + 2) is None     # старше ttl — не читается
+    assert await s.get_data(chat=CHAT + 2, user=USER + 2) == {}
+    assert await s.get_state(chat=CHAT + 3, user=USER + 3) == "Live:state"
+    await s.set_state(chat=CHAT + 4, user=USER + 4, state="Any:state")  # запускает фоновую запись и чистку
+    for _ in range(100):
+        if s.expired:
+            break
+        await asyncio.sleep(0.02)
+    await s.close()
+    assert s.expired >= 1
+    assert db.get_conn().execute("SELECT COUNT(*) FROM fsm_states WHERE chat_id=?", (CHAT + 2,)).fetchone()[0] == 0
+    assert db.fsm_load(CHAT + 3, USER + 3, now - 60) is not None
+
+
+def test_expired_states_are_skipped_and_swept():
+    asyncio.run(_expiry())
+
+
+async def _writer_close(rid: int):
+    w = BatchWriter(flush_ms=60_000, max_batch=1000)
+    for _ in range(5):
+        await w.log_cook(USER, rid)
+    assert w.queued == 5 and cook_logs(USER) == 0          # ждут интервала или полного пакета
+    await w.close()
+    assert cook_logs(USER) == 5
+    assert (w.written, w.batches, w.queued) == (5, 1, 0)
+    await w.log_cook(USER, rid)                            # после close — напрямую, без очереди
+    assert cook_logs(USER) == 6 and w.written == 6
+
+
+def test_writer_close_flushes_queue():
+    db.insert_many([recipe("Омлет с зеленью", ["Яйцо", "Укроп"])])
+    rid = db.search("омлет", USER)[0]["id"]
+    asyncio.run(_writer_close(rid))
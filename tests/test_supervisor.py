@@ -0,0 +1,99 @@
+# Несколько процессов (user-022): запись идёт через процесс-писатель, и он продолжает работать,
+# когда воркер падает и перезапускается. Процессы настоящие (spawn), Bot API не нужен.
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import db
+import supervisor
+from conftest import fake_telegram, message_update, recipe
+
+USER = 22001
+
+
+def cooked(user_id: int) -> int:
+    return db.get_conn().execute("SELECT COUNT(*) FROM cook_logs WHERE user_id=?", (user_id,)).fetchone()[0]
+
+
+async def _until(check, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "не дождались"
+        await asyncio.sleep(0.1)
+
+
+async def _scenario():
+    db.insert_many([recipe("Сырники", ["Творог", "Яйцо", "Мука"])])
+    rid = db.search("сырники", USER)[0]["id"]
+    now = datetime.now(timezone.utc)
+    sup = supervisor.Supervisor(1)
+    await sup.start()
+    loop = asyncio.get_running_loop()
+    try:
+        # воркер 0 в этом процессе: вызовы @_writes уходят писателю
+        db.write_proxy = supervisor._WriterClient(0, sup.address, sup.authkey)
+        await loop.run_in_executor(None, db.write_events, [("cook", (USER, rid, now))] * 3)
+        assert cooked(USER) == 3
+
+        # воркер падает: соединение с писателем рвётся посреди работы, процесс перезапускается
+        db.write_proxy._conn.close()
+        worker, writer_pid = sup.workers[0], sup.writer.process.pid
+        old_pid = worker.process.pid
+        worker.process.kill()
+        await _until(lambda: worker.crashes == 1 and worker.process.pid != old_pid and worker.process.is_alive())
+
+        db.write_proxy = supervisor._WriterClient(0, sup.address, sup.authkey)
+        await loop.run_in_executor(None, db.write_events, [("cook", (USER, rid, now))] * 2)
+        ings = recipe("", ["Творог"])["ingredients"]
+        await loop.run_in_executor(None, db.add_user_recipe, USER, "Мои сырники", "", ings, ["Жарить"], 15)
+        assert cooked(USER) == 5
+        assert sorted(r["title"] for r in db.search("сырники", USER)) == ["Мои сырники", "Сырники"]
+        assert sup.writer.crashes == 0 and sup.writer.process.pid == writer_pid
+    finally:
+        db.write_proxy = None
+        await sup.stop()
+    assert not sup.writer.process.is_alive() and not sup.workers[0].process.is_alive()
+
+
+def test_writer_applies_batches_and_survives_worker_restart():
+    asyncio.run(_scenario())
+
+
+def _finish(sup, update_ids):
+    """Подтверждение "done" от воркера — как его разбирает _Child._read."""
+    for w in sup.workers:
+        ids = [i for i in update_ids if i in w.open_ids]
+        if ids:
+            w.open_ids.difference_update(ids)
+            sup._on_message(w, ("done", 0, ids))
+
+
+async def _poll_offsets():
+    async with fake_telegram() as (api, bot):
+        sup = supervisor.Supervisor(2)          # процессы не запускаем: воркеров изображает тест
+        batch = [message_update(22100 + n, f"u{n}") for n in range(4)]
+        ids = [u["update_id"] for u in batch]
+        api.updates.extend(batch); api.has_updates.set()
+        stop = asyncio.Event()
+        task = asyncio.create_task(supervisor.poll(sup, bot, stop, timeout=1))
+        await _until(lambda: sup.routed == 4)
+        _finish(sup, [ids[0], ids[2], ids[3]])
+        await asyncio.sleep(1.0)                # Telegram повторяет ids[1] и всё после него
+        routed_while_stuck = sup.routed
+        offsets = [int(p["offset"]) for m, p in api.log if m == "getUpdates" and "offset" in p]
+        polls = sum(1 for m, _ in api.log if m == "getUpdates")
+        _finish(sup, [ids[1]])
+        await _until(lambda: sup.done_offset() == ids[3] + 1)
+        stop.set()
+        await task
+        await supervisor.confirm(sup, bot)
+        final = int([p for m, p in api.log if m == "getUpdates"][-1]["offset"])
+        return ids, routed_while_stuck, offsets, polls, final
+
+
+def test_poll_confirms_only_finished_updates():
+    ids, routed, offsets, polls, final = asyncio.run(_poll_offsets())
+    assert routed == 4                              # повторная доставка воркерам не уходит
+    assert offsets and max(offsets) <= ids[1]       # недоработанный не подтверждён
+    assert polls < 15
+    assert final == ids[3] + 1
@@ -0,0 +1,59 @@
+# Long polling (user-012): Telegram подтверждается только доработанное, повторная доставка
+# не обрабатывается дважды. Bot API — tools/fake_api.py (offset в нём работает как в Telegram).
+import asyncio
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+import updates
+from conftest import fake_telegram, message_update
+
+
+async def _wait(check, timeout: float = 10.0):
+    for _ in range(int(timeout / 0.02)):
+        if check():
+            return
+        await asyncio.sleep(0.02)
+    raise AssertionError("не дождались")
+
+
+async def _poll_with_a_stuck_update():
+    async with fake_telegram() as (api, bot):
+        dp = Dispatcher(bot, storage=MemoryStorage())
+        Bot.set_current(bot); Dispatcher.set_current(dp)
+        handled, gate = [], asyncio.Event()
+
+        @dp.message_handler()
+        async def record(m: types.Message):
+            if m.text == "slow":
+                await gate.wait()
+            handled.append(m.text)
+
+        batch = [message_update(12000 + n, "slow" if n == 1 else f"u{n}") for n in range(5)]
+        ids = [u["update_id"] for u in batch]
+        api.updates.extend(batch); api.has_updates.set()
+        stop = asyncio.Event()
+        task = asyncio.create_task(updates.poll(dp, stop, timeout=1))
+        await _wait(lambda: len(handled) == 4)
+        await asyncio.sleep(1.0)                     # Telegram всё это время повторяет «slow» и тех, кто после него
+        stuck_offsets = [int(p["offset"]) for m, p in api.log if m == "getUpdates" and "offset" in p]
+        polls_while_stuck = sum(1 for m, _ in api.log if m == "getUpdates")
+
+        gate.set()
+        await _wait(lambda: len(handled) == 5)
+        late = message_update(12010, "late")
+        api.updates.append(late); api.has_updates.set()
+        await _wait(lambda: len(handled) == 6)
+        stop.set()
+        await task
+        await dp.storage.close()
+        final = int([p for m, p in api.log if m == "getUpdates"][-1]["offset"])
+        return ids, late["update_id"], handled, stuck_offsets, polls_while_stuck, final, list(api.updates)
+
+
+def test_offset_waits_for_unfinished_updates_and_skips_redelivery():
+    ids, late_id, handled, stuck_offsets, polls, final, left = asyncio.run(_poll_with_a_stuck_update())
+    assert sorted(handled) == sorted(["slow", "u0", "u2", "u3", "u4", "late"])   # каждый ровно один раз
+    assert stuck_offsets and max(stuck_offsets) <= ids[1]   # «slow» не подтверждён, пока не доработан
+    assert polls < 15                                       # повторы не крутят getUpdates вхолостую
+    assert final == late_id + 1 and left == []               # на остановке подтверждено всё
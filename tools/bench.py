@@ -0,0 +1,432 @@
+# tools/bench.py — сквозной нагрузочный тест бота на поддельном Bot API
+#
+# Гоняет настоящий Dispatcher из bot.py (все хендлеры, FSM-хранилище, ThrottledBot,
+# очередь записи) синтетическими апдейтами: поиск, номер рецепта, пошаговая готовка
+# (cook:rid:idx), случайный рецепт, подбор по ингредиентам, список, AddRecipe целиком,
+# inline-поиск (набор слова по буквам и вторая страница результатов).
+# Ответы бота уходят по HTTP в tools/fake_api.py (без лимитов), база — сгенерированная
+# из recipes.json на 1k / 100k / 1M строк.
+#
+#   python tools/bench.py gen --rows 100000            # bench/data/recipes_100k.db
+#   python tools/bench.py run --rows 100000 --users 50 --iterations 20
+#   python tools/bench.py compare bench/results/A.json bench/results/B.json
+#   python tools/bench.py cluster --rows 100000 --workers 4 --updates 20000 --chats 500
+#
+# Отчёт: апдейтов/с, p50/p95/p99 по хендлерам и по функциям db.* (через db.aio).
+# Результаты пишутся в bench/results/*.json — сравнивайте версии через compare/--baseline.
+# cluster — те же сценарии через supervisor.py (процессы-воркеры и писатель БД): апдейты
+# забираются getUpdates из поддельного API, итог — апдейтов в секунду на всех процессах.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "tools"))
+
+DATA_DIR = ROOT / "bench" / "data"
+RESULTS_DIR = ROOT / "bench" / "results"
+TOKEN = "123456:bench"
+
+# Сценарии и их доли в нагрузке по умолчанию
+MIX = {"search": 3, "free_search": 2, "lookup": 3, "cook": 3, "random": 2,
+       "ingredients": 2, "list": 1, "add_recipe": 1, "inline": 2}
+
+
+def _label(rows: int) -> str:
+    if rows >= 1_000_000 and rows % 1_000_000 == 0:
+        return f"{rows // 1_000_000}m"
+    if rows >= 1000 and rows % 1000 == 0:
+        return f"{rows // 1000}k"
+    return str(rows)
+
+
+def _db_path(rows: int) -> Path:
+    return DATA_DIR / f"recipes_{_label(rows)}.db"
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+#  Генерация базы
+
+def cmd_gen(args):
+    out = Path(args.out) if args.out else _db_path(args.rows)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{out}{suffix}").unlink(missing_ok=True)
+    os.environ["RECIPES_DB"] = str(out)
+    import db
+    from helpers import load_recipes_from_json
+
+    t0 = time.perf_counter()
+    db.init_db()
+    load_recipes_from_json(args.json)         # сами рецепты из JSON + отпечаток файла в meta
+    base = json.load(open(args.json, encoding="utf-8"))
+    rng = random.Random(args.seed)
+    n = db.get_conn().execute("SELECT COUNT(*) FROM recipes").fetchone()[0]
+    while n < args.rows:
+        chunk = []
+        for k in range(min(args.chunk, args.rows - n)):
+            r = base[(n + k) % len(base)]
+            f = rng.uniform(0.8, 1.2)
+            chunk.append({
+                "title": f"{r['title']} · {n + k}",
+                "description": r["description"],
+                "cook_time_min": max(1, int(r["cook_time_min"] * rng.uniform(0.7, 1.3))),
+                "ingredients": [{**i, "grams": round(i["grams"] * f), "kcal": round(i["kcal"] * f)}
+                                for i in r["ingredients"]],
+                "steps": r["steps"],
+            })
+        db.insert_many(chunk)
+        n += len(chunk)
+        print(f"\r{n}/{args.rows}", end="", flush=True)
+    db.close()
+    print(f"\n{out}: {n} рецептов за {time.perf_counter() - t0:.1f} с")
+
+
+#  Синтетические апдейты
+
+class Workload:
+    def __init__(self, max_id: int, words: List[str], ingredients: List[str], seed: int):
+        self.max_id = max_id
+        self.words = words
+        self.ingredients = ingredients
+        self.rng = random.Random(seed)
+        self.update_id = 0
+        self.message_id = 0
+
+    def _user(self, chat: int) -> Dict[str, Any]:
+        return {"id": chat, "is_bot": False, "first_name": "bench"}
+
+    def message(self, chat: int, text: str) -> Dict[str, Any]:
+        self.update_id += 1; self.message_id += 1
+        return {"update_id": self.update_id, "message": {
+            "message_id": self.message_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat, "type": "private"}, "from": self._user(chat)}}
+
+    def callback(self, chat: int, data: str) -> Dict[str, Any]:
+        self.update_id += 1
+        return {"update_id": self.update_id, "callback_query": {
+            "id": str(self.update_id), "chat_instance": "bench", "from": self._user(chat), "data": data,
+            "message": {"message_id": 1, "date": int(time.time()), "text": "…",
+                        "chat": {"id": chat, "type": "private"}}}}
+
+    def inline_query(self, chat: int, query: str, offset: str = "") -> Dict[str, Any]:
+        self.update_id += 1
+        return {"update_id": self.update_id, "inline_query": {
+            "id": str(self.update_id), "from": self._user(chat), "query": query, "offset": offset}}
+
+    def scenario(self, name: str, chat: int) -> List[Dict[str, Any]]:
+        rng, msg = self.rng, self.message
+        rid = rng.randint(1, self.max_id)
+        if name == "search":
+            return [msg(chat, "🔍 Поиск рецептов"), msg(chat, rng.choice(self.words))]
+        if name == "free_search":
+            return [msg(chat, rng.choice(self.words))]
+        if name == "lookup":
+            return [msg(chat, str(rid))]
+        if name == "cook":
+            return [self.callback(chat, f"cook:{rid}:{i}") for i in range(4)]
+        if name == "random":
+            return [msg(chat, "/random")]
+        if name == "ingredients":
+            return [msg(chat, "🥗 Из ингредиентов?"), msg(chat, ", ".join(rng.sample(self.ingredients, 2)))]
+        if name == "list":
+            return [msg(chat, "📖 Все рецепты")]
+        if name == "inline":   # печатает по букве — дребезг отбрасывает промежуточные запросы
+            word = rng.choice(self.words)
+            typed = [self.inline_query(chat, word[:n]) for n in range(min(3, len(word)), len(word) + 1)]
+            return typed + [self.inline_query(chat, word, "20")]
+        if name == "add_recipe":
+            return [msg(chat, t) for t in ("➕ Добавить рецепт", f"Бенч {chat}-{self.update_id}", "Описание",
+                                           "Курица; 150; 240", "Рис; 100; 130", "готово",
+                                           "Шаг первый\nШаг второй", "готово", "15")]
+        raise ValueError(name)
+
+
+def _vocabulary(json_path: str):
+    recipes = json.load(open(json_path, encoding="utf-8"))
+    words = sorted({w.strip("«»()\"'.,").lower() for r in recipes for w in r["title"].split() if len(w) > 3})
+    names = sorted({i["name"].split()[0].lower() for r in recipes for i in r["ingredients"]})
+    return words, names
+
+
+#  Прогон
+
+def _pct(values: List[float], q: float) -> float:
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, int(round(q * len(s) + 0.5)) - 1))]
+
+
+def _summary(samples: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    return {name: {"n": len(v), "mean_ms": round(sum(v) / len(v) * 1000, 3),
+                   "p50_ms": round(_pct(v, 0.50) * 1000, 3), "p95_ms": round(_pct(v, 0.95) * 1000, 3),
+                   "p99_ms": round(_pct(v, 0.99) * 1000, 3)}
+            for name, v in sorted(samples.items()) if v}
+
+
+async def _run(args, db_copy: Path) -> Dict[str, Any]:
+    from aiohttp import web
+    from fake_api import FakeAPI, make_app
+
+    api = FakeAPI(chat_rate=0, global_rate=0)
+    runner = web.AppRunner(make_app(api), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    os.environ.update(BOT_TOKEN=TOKEN, TELEGRAM_API_SERVER=f"http://127.0.0.1:{args.port}",
+                      RECIPES_DB=str(db_copy), RECIPES_JSON=str(Path(args.json).resolve()),
+                      SEND_GLOBAL_RATE="1e9", SEND_CHAT_RATE="1e9")
+    import logging
+    from aiogram import Bot, Dispatcher, types
+    from aiogram.dispatcher.handler import current_handler
+    from aiogram.dispatcher.middlewares import BaseMiddleware
+    import bot as app    # настоящий bot.py: init_db, импорт JSON, Dispatcher со всеми хендлерами
+    import db
+    from router import current_route
+    logging.getLogger().setLevel(logging.WARNING)
+
+    dp = app.dp
+    labels: Dict[int, str] = {}
+    handler_samples: Dict[str, List[float]] = defaultdict(list)
+    db_samples: Dict[str, List[float]] = defaultdict(list)
+    db.aio.observer = lambda name, s: db_samples[name].append(s)
+
+    class Probe(BaseMiddleware):
+        """Запоминает, какой хендлер (или маршрут TextRouter) обработал апдейт."""
+        async def _pre(self, data):
+            data["_bench_handler"] = current_handler.get().__name__
+
+        async def _post(self, data):
+            name = current_route.get() or data.get("_bench_handler") or "unhandled"
+            labels[types.Update.get_current().update_id] = name
+
+        async def on_process_message(self, m, data): await self._pre(data)
+        async def on_process_callback_query(self, c, data): await self._pre(data)
+        async def on_process_inline_query(self, q, data): await self._pre(data)
+        async def on_post_process_inline_query(self, q, results, data): await self._post(data)
+        async def on_post_process_message(self, m, results, data): await self._post(data)
+        async def on_post_process_callback_query(self, c, results, data): await self._post(data)
+
+    dp.middleware.setup(Probe())
+    Bot.set_current(dp.bot); Dispatcher.set_current(dp)
+    await app.on_startup(dp)
+
+    max_id = db.get_conn().execute("SELECT MAX(id) FROM recipes").fetchone()[0]
+    rows = db.get_conn().execute("SELECT COUNT(*) FROM recipes").fetchone()[0]
+    words, names = _vocabulary(args.json)
+    load = Workload(max_id, words, names, args.seed)
+    mix = dict(MIX)
+    for item in args.mix or []:
+        k, v = item.split("=")
+        mix[k] = float(v)
+    kinds, weights = list(mix), list(mix.values())
+    api.reset()
+
+    async def user(chat: int):
+        for _ in range(args.iterations):
+            for u in load.scenario(load.rng.choices(kinds, weights)[0], chat):
+                update = types.Update(**u)
+                t0 = time.perf_counter()
+                # отдельная задача на апдейт — как в updates.UpdatePipeline
+                await asyncio.create_task(dp.process_update(update))
+                handler_samples[labels.pop(update.update_id, "unhandled")].append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(10_000_000 + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - t0
+    total = sum(len(v) for v in handler_samples.values())
+
+    await app.on_shutdown(dp)
+    await (await dp.bot.get_session()).close()
+    await runner.cleanup()
+    return {
+        "meta": {"version": _git_rev(), "date": datetime.now().isoformat(timespec="seconds"),
+                 "rows": rows, "users": args.users, "iterations": args.iterations, "seed": args.seed,
+                 "mix": mix, "python": platform.python_version()},
+        "total": {"updates": total, "seconds": round(elapsed, 3),
+                  "updates_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+                  "all": _summary({"all": [x for v in handler_samples.values() for x in v]})["all"]},
+        "handlers": _summary(handler_samples),
+        "db": _summary(db_samples),
+        "api": api.stats(),
+    }
+
+
+def _print_table(title: str, rows: Dict[str, Dict[str, float]], base: Dict[str, Dict[str, float]] = None):
+    print(f"\n{title}")
+    print(f"  {'':24} {'n':>7} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9}" + ("   Δp95" if base else ""))
+    for name, s in rows.items():
+        line = f"  {name:24} {s['n']:>7} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}"
+        if base and name in base and base[name]["p95_ms"]:
+            line += f"   {(s['p95_ms'] / base[name]['p95_ms'] - 1) * 100:+.0f}%"
+        print(line)
+
+
+def _report(res: Dict[str, Any], base: Dict[str, Any] = None):
+    m, t = res["meta"], res["total"]
+    print(f"\n{m['version']} · {m['rows']} рецептов · {m['users']} польз. × {m['iterations']} сценариев")
+    line = f"Апдейтов: {t['updates']} за {t['seconds']} с → {t['updates_per_s']} апд/с"
+    if base:
+        line += f"  (было {base['total']['updates_per_s']}, {base['meta']['version']})"
+    print(line)
+    _print_table("Хендлеры", res["handlers"], base and base["handlers"])
+    _print_table("db.*", res["db"], base and base["db"])
+
+
+def cmd_run(args):
+    src = Path(args.db) if args.db else _db_path(args.rows)
+    if not src.exists():
+        subprocess.run([sys.executable, __file__, "gen", "--rows", str(args.rows), "--out", str(src),
+                        "--json", args.json], check=True)
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        db_copy = Path(tmp) / "recipes.db"   # прогон пишет в базу — работаем с копией
+        shutil.copyfile(src, db_copy)
+        res = asyncio.run(_run(args, db_copy))
+    base = json.load(open(args.baseline, encoding="utf-8")) if args.baseline else None
+    _report(res, base)
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    out = RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}_{res['meta']['version']}_{_label(res['meta']['rows'])}.json"
+    json.dump(res, open(out, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
+    print(f"\nРезультат: {out}")
+
+
+async def _cluster(args, db_copy: Path):
+    from aiohttp import web
+    from fake_api import FakeAPI, make_app
+
+    api = FakeAPI(chat_rate=0, global_rate=0)
+    runner = web.AppRunner(make_app(api), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    # окружение наследуют процессы supervisor'а: ответы — в заглушку, без лимитов отправки
+    os.environ.update(BOT_TOKEN=TOKEN, TELEGRAM_API_SERVER=f"http://127.0.0.1:{args.port}",
+                      RECIPES_DB=str(db_copy), SEND_GLOBAL_RATE="1e9", SEND_CHAT_RATE="1e9", METRICS_PORT="0")
+    import logging
+    import signal
+    from aiogram import Bot
+    from aiogram.bot.api import TelegramAPIServer
+    import db
+    import supervisor
+    logging.basicConfig(level=logging.WARNING)
+
+    db.init_db()
+    max_id = db.get_conn().execute("SELECT MAX(id) FROM recipes").fetchone()[0] or 1
+    words, names = _vocabulary(args.json)
+    load = Workload(max_id, words, names, args.seed)
+    kinds = [k for k, w in MIX.items() for _ in range(w)]
+    chats = [load.rng.randint(10 ** 6, 10 ** 9) for _ in range(args.chats)]
+    batch = []
+    while len(batch) < args.updates:
+        batch += load.scenario(load.rng.choice(kinds), load.rng.choice(chats))
+    api.updates.extend(batch)
+    api.has_updates.set()
+
+    bot = Bot(TOKEN, server=TelegramAPIServer.from_base(f"http://127.0.0.1:{args.port}"))
+    sup = supervisor.Supervisor(args.workers)
+    await sup.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    poller = asyncio.create_task(supervisor.poll(sup, bot, stop, timeout=1))
+    t0 = time.perf_counter()
+    while sup.routed < len(batch) and not stop.is_set():
+        await asyncio.sleep(0.05)
+    ok = await sup.idle(args.timeout, stop)
+    elapsed = time.perf_counter() - t0
+    processed = sup.metrics()["processed"]
+    stop.set()
+    await poller
+    await sup.stop()
+    await supervisor.confirm(sup, bot)
+    await (await bot.get_session()).close()
+    await runner.cleanup()
+    db.close()
+    print(f"{'Готово' if ok else 'Не дождались'}: {processed}/{len(batch)} апдейтов "
+          f"за {elapsed:.1f} с — {processed / elapsed:.0f} апд/с на {sup.n} воркерах; "
+          f"Bot API: {dict(api.calls)}")
+
+
+def cmd_cluster(args):
+    src = Path(args.db) if args.db else _db_path(args.rows)
+    if not src.exists():
+        subprocess.run([sys.executable, __file__, "gen", "--rows", str(args.rows), "--out", str(src),
+                        "--json", args.json], check=True)
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        db_copy = Path(tmp) / "recipes.db"
+        shutil.copyfile(src, db_copy)
+        asyncio.run(_cluster(args, db_copy))
+
+
+def cmd_compare(args):
+    base = json.load(open(args.base, encoding="utf-8"))
+    new = json.load(open(args.new, encoding="utf-8"))
+    _report(new, base)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Нагрузочный тест бота на поддельном Bot API")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("gen", help="сгенерировать базу на N рецептов из recipes.json")
+    sp.add_argument("--rows", type=int, default=1000)
+    sp.add_argument("--out", help="путь к базе (по умолчанию bench/data/recipes_<N>.db)")
+    sp.add_argument("--json", default=str(ROOT / "recipes.json"))
+    sp.add_argument("--chunk", type=int, default=10_000)
+    sp.add_argument("--seed", type=int, default=1)
+    sp.set_defaults(func=cmd_gen)
+
+    sp = sub.add_parser("run", help="прогнать нагрузку и сохранить результат")
+    sp.add_argument("--rows", type=int, default=1000, help="1000 / 100000 / 1000000 (база генерируется при отсутствии)")
+    sp.add_argument("--db", help="готовая база вместо bench/data/recipes_<N>.db")
+    sp.add_argument("--json", default=str(ROOT / "recipes.json"))
+    sp.add_argument("--users", type=int, default=50, help="одновременных пользователей (чатов)")
+    sp.add_argument("--iterations", type=int, default=20, help="сценариев на пользователя")
+    sp.add_argument("--mix", nargs="*", help="доли сценариев, например cook=5 add_recipe=0")
+    sp.add_argument("--port", type=int, default=18081, help="порт поддельного Bot API")
+    sp.add_argument("--seed", type=int, default=1)
+    sp.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    sp.set_defaults(func=cmd_run)
+
+    sp = sub.add_parser("cluster", help="та же нагрузка через supervisor.py в несколько процессов")
+    sp.add_argument("--rows", type=int, default=1000)
+    sp.add_argument("--db", help="готовая база вместо bench/data/recipes_<N>.db")
+    sp.add_argument("--json", default=str(ROOT / "recipes.json"))
+    sp.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    sp.add_argument("--updates", type=int, default=10000)
+    sp.add_argument("--chats", type=int, default=500)
+    sp.add_argument("--port", type=int, default=18082, help="порт поддельного Bot API")
+    sp.add_argument("--seed", type=int, default=1)
+    sp.add_argument("--timeout", type=float, default=600, help="сколько ждать обработки всех апдейтов")
+    sp.set_defaults(func=cmd_cluster)
+
+    sp = sub.add_parser("compare", help="сравнить два сохранённых прогона")
+    sp.add_argument("base")
+    sp.add_argument("new")
+    sp.set_defaults(func=cmd_compare)
+
+    args = p.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
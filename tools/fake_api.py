@@ -0,0 +1,150 @@
+# tools/fake_api.py — локальный поддельный Bot API для нагрузочных проверок
+#
+# Отвечает на методы, которые использует бот, и сам следит за лимитами Telegram:
+# превышение (1 сообщение/с в чат, --global-rate в целом) — ответ 429 с retry_after,
+# как у настоящего API. --flood добавляет случайные 429 с заданной вероятностью.
+#
+#   python tools/fake_api.py --port 8081
+#   TELEGRAM_API_SERVER=http://127.0.0.1:8081 python bot.py
+#
+# Апдейты для getUpdates кладутся POST'ом на /_updates (JSON-список апдейтов),
+# счётчики — GET /_stats, сброс счётчиков — POST /_reset.
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+
+class FakeAPI:
+    def __init__(self, chat_rate: float = 1.0, global_rate: float = 30.0, flood: float = 0.0, retry_after: int = 1):
+        self.chat_gap = 1 / chat_rate if chat_rate else 0.0
+        self.global_rate = global_rate
+        self.flood = flood
+        self.retry_after = retry_after
+        self.updates = deque()
+        self.has_updates = asyncio.Event()
+        self.reset()
+
+    def reset(self):
+        self.calls = Counter()
+        self.limited = Counter()
+        self.last_sent = {}          # chat_id -> время последней отправки
+        self.window = deque()        # времена отправок за последнюю секунду
+        self.message_id = 0
+        self.sent_at = []            # (время, chat_id) — для проверки соблюдения лимитов
+        self.log = []                # (метод, параметры) — для тестов
+
+    def stats(self):
+        return {"calls": dict(self.calls), "429": dict(self.limited), "queued_updates": len(self.updates)}
+
+    def _check_limits(self, chat_id):
+        """Возвращает retry_after или None, если отправка разрешена."""
+        now = time.monotonic()
+        if self.flood and random.random() < self.flood:
+            return self.retry_after
+        last = self.last_sent.get(chat_id)
+        if last is not None and now - last < self.chat_gap * 0.95:
+            return max(1, math.ceil(self.chat_gap - (now - last)))
+        while self.window and now - self.window[0] >= 1.0:
+            self.window.popleft()
+        if self.global_rate and len(self.window) > self.global_rate:  # допуск на дрожание таймеров
+            return 1
+        self.last_sent[chat_id] = now
+        self.window.append(now)
+        self.sent_at.append((now, chat_id))
+        return None
+
+    def _message(self, chat_id, text=""):
+        self.message_id += 1
+        return {"message_id": self.message_id, "date": int(time.time()), "text": text,
+                "chat": {"id": int(chat_id), "type": "private" if int(chat_id) > 0 else "group"},
+                "from": BOT_USER}
+
+    async def get_updates(self, params):
+        timeout = float(params.get("timeout") or 0)
+        offset = int(params.get("offset") or 0)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates and timeout:
+            self.has_updates.clear()
+            try:
+                await asyncio.wait_for(self.has_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        return [u for u in list(self.updates)[:limit] if u["update_id"] >= offset]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] += 1
+        self.log.append((method, params))
+        chat_id = params.get("chat_id")
+        if chat_id is not None:
+            retry = self._check_limits(chat_id)
+            if retry is not None:
+                self.limited[method] += 1
+                return web.json_response({"ok": False, "error_code": 429,
+                                          "description": f"Too Many Requests: retry after {retry}",
+                                          "parameters": {"retry_after": retry}}, status=429)
+        if method == "getUpdates":
+            result = await self.get_updates(params)
+        elif method == "getMe":
+            result = BOT_USER
+        elif method in ("sendMessage", "sendPhoto", "sendDocument"):
+            result = self._message(chat_id, params.get("text", ""))
+        elif method in ("editMessageText", "editMessageReplyMarkup"):
+            result = self._message(chat_id, params.get("text", "")) if chat_id is not None else True
+            if isinstance(result, dict):
+                result["message_id"] = int(params.get("message_id") or 0)
+        else:  # answerCallbackQuery, setMyCommands, deleteWebhook, ...
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def put_updates(self, request: web.Request) -> web.Response:
+        batch = await request.json()
+        self.updates.extend(batch if isinstance(batch, list) else [batch])
+        self.has_updates.set()
+        return web.json_response({"ok": True, "queued": len(self.updates)})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    async def post_reset(self, request: web.Request) -> web.Response:
+        self.reset()
+        return web.json_response({"ok": True})
+
+
+def make_app(api: FakeAPI) -> web.Application:
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["api"] = api
+    app.router.add_post("/_updates", api.put_updates)
+    app.router.add_get("/_stats", api.get_stats)
+    app.router.add_post("/_reset", api.post_reset)
+    app.router.add_route("*", "/bot{token}/{method}", api.handle)
+    return app
+
+
+def main():
+    p = argparse.ArgumentParser(description="Поддельный Bot API с лимитами и 429")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8081)
+    p.add_argument("--chat-rate", type=float, default=1.0, help="сообщений в секунду на чат (0 — без лимита)")
+    p.add_argument("--global-rate", type=float, default=30.0, help="сообщений в секунду всего (0 — без лимита)")
+    p.add_argument("--flood", type=float, default=0.0, help="вероятность случайного 429")
+    p.add_argument("--retry-after", type=int, default=1)
+    args = p.parse_args()
+    api = FakeAPI(args.chat_rate, args.global_rate, args.flood, args.retry_after)
+    web.run_app(make_app(api), host=args.host, port=args.port, print=lambda *a: print(json.dumps(
+        {"listening": f"http://{args.host}:{args.port}"})))
+
+
+if __name__ == "__main__":
+    main()
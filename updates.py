@@ -0,0 +1,373 @@
+# updates.py — приём апдейтов (webhook или long polling) и их параллельная обработка
+#
+# UpdatePipeline — ограниченный пул воркеров поверх Dispatcher:
+#   • апдейты разных чатов обрабатываются параллельно (до UPDATE_WORKERS одновременно);
+#   • апдейты одного чата — строго по очереди (FSM и пошаговая готовка не перемешиваются);
+#   • общее число ожидающих апдейтов ограничено UPDATE_QUEUE (submit ждёт — обратное давление);
+#   • на остановке очередь дорабатывается до конца, а не сбрасывается.
+#
+# Long polling подтверждает Telegram только доработанное: getUpdates уходит с
+# offset=done_offset() — до первого незавершённого апдейта (любой запрос с offset, даже
+# отменённый, подтверждает всё ниже него). Поэтому незавершённые и доработанные после них
+# приходят повторно — seen() отсеивает их. Упавший посреди работы бот получит их снова.
+import asyncio
+import heapq
+import logging
+import signal
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+import metrics
+from router import current_route
+
+from config import (UPDATE_WORKERS, UPDATE_QUEUE, SKIP_UPDATES, WEBHOOK_PATH, WEBHOOK_SECRET,
+                    WEBAPP_HOST, WEBAPP_PORT, DRAIN_TIMEOUT_S)
+
+logger = logging.getLogger("cooking-bot.updates")
+
+Hook = Callable[[Dispatcher], Awaitable[None]]
+
+
+def chat_key(update: types.Update) -> int:
+    """Ключ упорядочивания: id чата (или пользователя, если чата нет — inline/callback без сообщения)."""
+    for name in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        obj = getattr(update, name, None)
+        if obj is not None:
+            return obj.chat.id
+    cq = update.callback_query
+    if cq is not None:
+        return cq.message.chat.id if cq.message else cq.from_user.id
+    for name in ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query",
+                 "my_chat_member", "chat_member", "chat_join_request", "poll_answer"):
+        obj = getattr(update, name, None)
+        if obj is not None:
+            chat = getattr(obj, "chat", None)
+            if chat is not None:
+                return chat.id
+            user = getattr(obj, "from_user", None) or getattr(obj, "user", None)
+            if user is not None:
+                return user.id
+    return 0
+
+
+def raw_chat_key(data: dict) -> int:
+    """chat_key для апдейта в виде JSON-словаря — без сборки types.Update (supervisor.py)."""
+    for name in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        obj = data.get(name)
+        if obj is not None:
+            return obj["chat"]["id"]
+    cq = data.get("callback_query")
+    if cq is not None:
+        return cq["message"]["chat"]["id"] if cq.get("message") else cq["from"]["id"]
+    for name in ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query",
+                 "my_chat_member", "chat_member", "chat_join_request", "poll_answer"):
+        obj = data.get(name)
+        if obj is not None:
+            chat = obj.get("chat")
+            if chat is not None:
+                return chat["id"]
+            user = obj.get("from") or obj.get("user")
+            if user is not None:
+                return user["id"]
+    return 0
+
+
+#  Метрики хендлеров
+
+_UPDATE_KINDS = ("message", "callback_query", "inline_query", "chosen_inline_result", "edited_message",
+                 "my_chat_member", "channel_post")
+_handler_name: ContextVar[Optional[str]] = ContextVar("handler_name", default=None)
+
+
+def update_kind(update: types.Update) -> str:
+    for name in _UPDATE_KINDS:
+        if getattr(update, name, None) is not None:
+            return name
+    return "other"
+
+
+def _handler_label() -> str:
+    # текстовые сообщения идут через один route_text — подписываем их хендлером TextRouter
+    return current_route.get() or _handler_name.get() or "unhandled"
+
+
+class HandlerMetrics(BaseMiddleware):
+    """metrics.HANDLER_SECONDS по каждому хендлеру и UPDATE_SECONDS по апдейту целиком."""
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        data["_metrics_t0"] = time.perf_counter()
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        t0 = data.get("_metrics_t0")
+        if t0 is not None:
+            metrics.UPDATE_SECONDS.observe(time.perf_counter() - t0, update_kind(update))
+
+    async def _start(self, data: dict):
+        _handler_name.set(current_handler.get().__name__)
+        data["_metrics_t0"] = time.perf_counter()
+
+    async def _finish(self, data: dict):
+        t0 = data.get("_metrics_t0")
+        if t0 is not None:
+            metrics.HANDLER_SECONDS.observe(time.perf_counter() - t0, _handler_label())
+
+    async def on_process_message(self, m, data): await self._start(data)
+    async def on_post_process_message(self, m, results, data): await self._finish(data)
+    async def on_process_callback_query(self, c, data): await self._start(data)
+    async def on_post_process_callback_query(self, c, results, data): await self._finish(data)
+    async def on_process_inline_query(self, q, data): await self._start(data)
+    async def on_post_process_inline_query(self, q, results, data): await self._finish(data)
+
+
+async def count_error(update: types.Update, exception: Exception):
+    """errors_handler: считает исключение и не глушит его (None — aiogram пробросит дальше)."""
+    metrics.HANDLER_ERRORS.inc(_handler_label(), type(exception).__name__)
+
+
+def setup_metrics(dp: Dispatcher):
+    dp.middleware.setup(HandlerMetrics())
+    dp.register_errors_handler(count_error)
+
+
+class UpdatePipeline:
+    def __init__(self, dp: Dispatcher, workers: int = UPDATE_WORKERS, max_pending: int = UPDATE_QUEUE):
+        self.dp = dp
+        self.workers = workers
+        self.max_pending = max_pending
+        self._chats: Dict[int, Deque[types.Update]] = {}   # чат -> его очередь (есть в dict = занят)
+        self._ready: Optional[asyncio.Queue] = None          # чаты, готовые к обработке
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._tasks = []
+        self.accepting = False
+        self.pending = 0
+        self.processed = 0
+        self.errors = 0
+        self.on_done: Optional[Callable[[int], None]] = None   # update_id доработанного (supervisor.py)
+        self._open: Set[int] = set()        # update_id принятых, но ещё не доработанных
+        self._open_heap: List[int] = []     # те же id кучей (с отложенным удалением) — для минимума
+        self._done: Set[int] = set()        # доработанные, пока ниже них есть незавершённый
+        self._last_id: Optional[int] = None
+        self._progress: Optional[asyncio.Event] = None
+
+    def metrics(self) -> Dict[str, int]:
+        return {"workers": self.workers, "pending": self.pending, "chats": len(self._chats),
+                "processed": self.processed, "errors": self.errors}
+
+    def start(self):
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._idle = asyncio.Event(); self._idle.set()
+        self._progress = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self.accepting = True
+        metrics.register("updates", self.metrics)
+
+    def _low(self) -> Optional[int]:
+        heap = self._open_heap
+        while heap and heap[0] not in self._open:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def done_offset(self) -> Optional[int]:
+        """offset для getUpdates, подтверждающий только доработанное: всё до первого
+        незавершённого апдейта (чаты идут параллельно, поэтому не «до последнего»)."""
+        if self._last_id is None:
+            return None
+        low = self._low()
+        return low if low is not None else self._last_id + 1
+
+    def seen(self, update_id: int) -> bool:
+        """Апдейт уже принят (повторная доставка после getUpdates с offset=done_offset())."""
+        offset = self.done_offset()
+        return offset is not None and (update_id < offset or update_id in self._open or update_id in self._done)
+
+    async def progressed(self, since: int, timeout: float):
+        """Дождаться, пока доработанных станет больше since (processed + errors), не дольше timeout."""
+        if self.processed + self.errors > since:
+            return
+        self._progress.clear()
+        try:
+            await asyncio.wait_for(self._progress.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def submit(self, update: types.Update):
+        await self._slots.acquire()
+        self.pending += 1
+        self._idle.clear()
+        self._open.add(update.update_id)
+        heapq.heappush(self._open_heap, update.update_id)
+        if self._last_id is None or update.update_id > self._last_id:
+            self._last_id = update.update_id
+        key = chat_key(update)
+        queue = self._chats.get(key)
+        if queue is not None:
+            queue.append(update)        # чат уже в работе или ждёт воркера
+        else:
+            self._chats[key] = deque([update])
+            self._ready.put_nowait(key)
+
+    async def _worker(self, n: int):
+        while True:
+            key = await self._ready.get()
+            queue = self._chats[key]
+            while queue:
+                update = queue.popleft()
+                try:
+                    # отдельная задача = свежая копия контекста (aiogram кэширует state в ContextVar)
+                    await asyncio.create_task(self.dp.process_update(update))
+                    self.processed += 1
+                except Exception:
+                    self.errors += 1
+                    logger.exception(f"Ошибка обработки апдейта {update.update_id}")
+                finally:
+                    self.pending -= 1
+                    self._slots.release()
+                self._finish(update.update_id)   # отменённый на остановке сюда не доходит
+                if self.on_done is not None:
+                    self.on_done(update.update_id)
+            del self._chats[key]
+            if not self.pending:
+                self._idle.set()
+
+    def _finish(self, update_id: int):
+        self._open.discard(update_id)
+        low = self._low()
+        if low is not None and update_id > low:
+            self._done.add(update_id)      # придёт повторно, пока не доработан low
+        elif self._done:
+            self._done = {i for i in self._done if low is not None and i > low}
+        self._progress.set()
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT_S):
+        """Перестать принимать новые апдейты, доработать очередь и остановить воркеров."""
+        self.accepting = False
+        if self._idle is not None:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Не успели доработать {self.pending} апдейтов за {timeout} с")
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+#  Webhook (aiohttp)
+
+def build_webhook_app(dp: Dispatcher, on_startup: Optional[Hook] = None, on_shutdown: Optional[Hook] = None,
+                      path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET) -> web.Application:
+    """aiohttp-приложение: POST {path} с JSON апдейта. Подходит и для локальных тестов —
+    достаточно отправить записанный апдейт curl'ом."""
+    pipeline = UpdatePipeline(dp)
+    app = web.Application()
+    app["pipeline"] = pipeline
+
+    async def handle(request: web.Request) -> web.Response:
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=403)
+        if not pipeline.accepting:
+            return web.Response(status=503)  # Telegram повторит доставку позже
+        try:
+            update = types.Update(**(await request.json()))
+        except Exception:
+            return web.Response(status=400, text="bad update")
+        await pipeline.submit(update)
+        return web.Response(text="ok")
+
+    async def _startup(app):
+        pipeline.start()
+        if on_startup:
+            await on_startup(dp)
+
+    async def _shutdown(app):
+        await pipeline.drain()
+        logger.info(f"Конвейер апдейтов: {pipeline.metrics()}")
+        if on_shutdown:
+            await on_shutdown(dp)
+        await dp.storage.close(); await dp.storage.wait_closed()
+        session = await dp.bot.get_session()
+        await session.close()
+
+    app.router.add_post(path, handle)
+    app.on_startup.append(_startup)
+    app.on_shutdown.append(_shutdown)
+    return app
+
+
+def run_webhook(dp: Dispatcher, on_startup: Optional[Hook] = None, on_shutdown: Optional[Hook] = None,
+                host: str = WEBAPP_HOST, port: int = WEBAPP_PORT):
+    web.run_app(build_webhook_app(dp, on_startup, on_shutdown), host=host, port=port)
+
+
+#  Long polling через тот же конвейер
+
+# Пачка целиком из уже принятых: Telegram повторяет ждущее за незавершённым апдейтом,
+# и следующий getUpdates вернулся бы сразу — ждём, пока что-нибудь доработается
+REDELIVERY_WAIT_S = 0.5
+
+
+async def poll(dp: Dispatcher, stop: asyncio.Event, timeout: int = 20):
+    """Long polling до сигнала stop. offset каждого getUpdates — done_offset(): Telegram
+    подтверждается только доработанное, недоработанное к падению или остановке придёт снова."""
+    pipeline = UpdatePipeline(dp)
+    pipeline.start()
+    if SKIP_UPDATES:
+        await dp.skip_updates()
+    stopper = asyncio.create_task(stop.wait())
+    while not stop.is_set():
+        offset, finished = pipeline.done_offset(), pipeline.processed + pipeline.errors
+        fetch = asyncio.create_task(dp.bot.get_updates(offset=offset, timeout=timeout))
+        await asyncio.wait({fetch, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        if not fetch.done():
+            fetch.cancel()
+            await asyncio.gather(fetch, return_exceptions=True)
+            break
+        try:
+            batch = fetch.result()
+        except Exception as e:
+            logger.warning(f"get_updates error: {e}")
+            await asyncio.sleep(1)
+            continue
+        fresh = [u for u in batch if not pipeline.seen(u.update_id)]
+        for update in fresh:
+            await pipeline.submit(update)
+        if batch and not fresh:
+            await pipeline.progressed(finished, REDELIVERY_WAIT_S)
+    stopper.cancel()
+    await pipeline.drain()
+    offset = pipeline.done_offset()
+    if offset is not None:
+        try:  # подтверждаем доработанное, иначе после рестарта Telegram пришлёт его ещё раз;
+              # не успевшее за DRAIN_TIMEOUT_S придёт снова
+            await dp.bot.get_updates(offset=offset, limit=1, timeout=0)
+        except Exception as e:
+            logger.warning(f"get_updates (confirm) error: {e}")
+    logger.info(f"Конвейер апдейтов: {pipeline.metrics()}")
+
+
+def run_polling(dp: Dispatcher, on_startup: Optional[Hook] = None, on_shutdown: Optional[Hook] = None):
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        if on_startup:
+            await on_startup(dp)
+        await poll(dp, stop)
+        if on_shutdown:
+            await on_shutdown(dp)
+        await dp.storage.close(); await dp.storage.wait_closed()
+        session = await dp.bot.get_session()
+        await session.close()
+    asyncio.run(main())
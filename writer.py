@@ -0,0 +1,115 @@
+# writer.py — отложенная пакетная запись мелких append-only событий (cook_logs и т.п.)
+#
+# Хендлер кладёт событие в очередь и сразу отвечает пользователю; фоновая задача раз в
+# WRITE_FLUSH_MS (или как только набралось WRITE_BATCH событий) пишет всё одной
+# транзакцией через db.write_events. Если очередь заполнена, put() ждёт — это и есть
+# обратное давление на хендлеры. На остановке бота очередь дописывается до конца.
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import db
+from config import WRITE_FLUSH_MS, WRITE_BATCH, WRITE_QUEUE
+
+logger = logging.getLogger("cooking-bot.writer")
+
+
+class BatchWriter:
+    def __init__(self, flush_ms: int = WRITE_FLUSH_MS, max_batch: int = WRITE_BATCH, max_queue: int = WRITE_QUEUE):
+        self.flush_s = flush_ms / 1000
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._q: Optional[asyncio.Queue] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.blocked = 0          # сколько раз put() ждал из-за полной очереди
+        self.last_flush_ms = 0.0
+
+    @property
+    def queued(self) -> int:
+        return self._q.qsize() if self._q is not None else 0
+
+    @property
+    def congested(self) -> bool:
+        """Очередь заполнена наполовину: запись не успевает, скоро put() начнёт ждать."""
+        return self.queued >= self.max_queue // 2
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"queued": self.queued, "congested": int(self.congested), "written": self.written,
+                "batches": self.batches, "failed": self.failed, "blocked": self.blocked,
+                "last_flush_ms": round(self.last_flush_ms, 2)}
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._q = self._q or asyncio.Queue(maxsize=self.max_queue)
+            self._full = self._full or asyncio.Event()
+            self._closing = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def put(self, kind: str, *args):
+        if self._closing:  # бот останавливается — пишем напрямую, без очереди
+            await self._write([(kind, args)])
+            return
+        self.start()
+        if self._q.full():
+            self.blocked += 1
+        await self._q.put((kind, args))
+        if self._q.qsize() >= self.max_batch:
+            self._full.set()
+
+    async def log_cook(self, user_id: int, recipe_id: int):
+        await self.put("cook", user_id, recipe_id, datetime.now(timezone.utc))
+
+    async def _run(self):
+        while True:
+            first = await self._q.get()
+            if not self._closing:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_s)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+            batch = [first] + self._drain(self.max_batch - 1)
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                await self._write(batch)
+            if stop:
+                return
+
+    def _drain(self, n: int) -> List[Tuple[str, tuple]]:
+        batch = []
+        while len(batch) < n and not self._q.empty():
+            batch.append(self._q.get_nowait())
+        return batch
+
+    async def _write(self, batch: List[Tuple[str, tuple]]):
+        t0 = time.perf_counter()
+        try:
+            await db.aio.write_events(batch)
+            self.written += len(batch); self.batches += 1
+        except Exception:
+            self.failed += len(batch)
+            logger.exception(f"Не удалось записать пакет событий ({len(batch)} шт.)")
+        self.last_flush_ms = (time.perf_counter() - t0) * 1000
+
+    async def close(self):
+        """Дописать всё, что в очереди, и остановить фоновую задачу."""
+        self._closing = True
+        if self._task is None or self._task.done():
+            return
+        self._full.set()
+        await self._q.put(_STOP)  # новых событий после флага _closing в очередь не попадёт
+        await self._task
+        self._task = None
+
+
+_STOP = ("stop", ())
+events = BatchWriter()